@@ -0,0 +1,349 @@
+"""Benchmarks of the clients against a local stand-in of the website.
+
+The fake website (see `acapela_group.testing`) runs in its own process, and
+each scenario runs in a fresh process too, so that the measured CPU time
+and peak memory are those of the client only:
+
+* ``sync``: `AcapelaGroup.get_mp3_url` from a thread pool,
+* ``async``: `AcapelaGroupAsync.get_mp3_url` from concurrent coroutines,
+* ``cli``: single invocations of the command line (mostly start-up time),
+* ``cli-batch``: one ``--batch`` invocation of the command line.
+
+Every request has a different text, so nothing is served from a cache or
+coalesced. The results are written as JSON, to be compared between
+releases:
+
+    python benchmarks/bench.py --latency 0.02 --output before.json
+    python benchmarks/bench.py --latency 0.02 --output after.json \\
+        --compare before.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import acapela_group
+from acapela_group.base import AcapelaGroup, AcapelaGroupAsync
+from acapela_group.policy import Policy
+from acapela_group.testing import FakeAcapelaServer
+
+
+SCENARIOS = ('sync', 'async', 'cli', 'cli-batch')
+
+LANGUAGE = 'English (UK)'
+VOICE = 'Rachel'
+USERNAME = 'benchmark'
+PASSWORD = 'secret'
+
+
+def percentile(values, fraction):
+    """Return the nearest-rank percentile of `values`."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1,
+                       int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(requests, errors, latencies, duration, cpu, peak_rss):
+    """Gather the measures of a scenario into a dictionary."""
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': requests,
+        'errors': errors,
+        'duration_s': duration,
+        'throughput_rps': requests / duration if duration else None,
+        'latency_ms': {
+            'p50': percentile(latencies_ms, 0.50),
+            'p99': percentile(latencies_ms, 0.99),
+            'mean': sum(latencies_ms) / len(latencies_ms)
+            if latencies_ms else None,
+            'max': max(latencies_ms) if latencies_ms else None,
+        },
+        'cpu_s': cpu,
+        'peak_rss_kib': peak_rss,
+    }
+
+
+def format_ms(value):
+    """Format a latency in milliseconds, or 'n/a' if it was not measured."""
+    return 'n/a' if value is None else '{:.2f}'.format(value)
+
+
+def texts(count):
+    """Return `count` different texts."""
+    return ['Benchmark sentence number {}.'.format(index)
+            for index in range(count)]
+
+
+def make_policy(options):
+    """Build the policy of the clients from the options."""
+    return Policy(max_attempts=options['retries'] + 1, backoff=0.01)
+
+
+def run_sync(url, options):
+    """Resolve the requests with `AcapelaGroup`, from a thread pool."""
+    latencies = []
+    errors = 0
+    with AcapelaGroup(base_url=url, max_workers=options['concurrency'],
+                      policy=make_policy(options)) as client:
+        client.authenticate(USERNAME, PASSWORD)
+
+        def timed(text):
+            start = time.perf_counter()
+            client.get_mp3_url(LANGUAGE, VOICE, text)
+            return time.perf_counter() - start
+
+        with concurrent.futures.ThreadPoolExecutor(
+                options['concurrency']) as executor:
+            futures = [executor.submit(timed, text)
+                       for text in texts(options['requests'])]
+            for future in futures:
+                try:
+                    latencies.append(future.result())
+                except acapela_group.base.AcapelaGroupError:
+                    errors += 1
+    return len(latencies) + errors, errors, latencies
+
+
+def run_async(url, options):
+    """Resolve the requests with `AcapelaGroupAsync`, from coroutines."""
+    latencies = []
+    errors = 0
+
+    async def main():
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        async with AcapelaGroupAsync(base_url=url,
+                                     policy=make_policy(options)) as client:
+            await client.authenticate(USERNAME, PASSWORD)
+
+            async def timed(text):
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        await client.get_mp3_url(LANGUAGE, VOICE, text)
+                    except acapela_group.base.AcapelaGroupError:
+                        errors += 1
+                    else:
+                        latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*[timed(text)
+                                   for text in texts(options['requests'])])
+
+    asyncio.run(main())
+    return len(latencies) + errors, errors, latencies
+
+
+def _cli(url, options, *args):
+    return [sys.executable, '-m', 'acapela_group', '--base-url', url,
+            '--username', USERNAME, '--password', PASSWORD,
+            '--no-session-store', '--retries', str(options['retries'])] + \
+        list(args)
+
+
+def run_cli(url, options):
+    """Invoke the command line once per request."""
+    latencies = []
+    errors = 0
+    for text in texts(options['cli_runs']):
+        start = time.perf_counter()
+        process = subprocess.run(_cli(url, options, LANGUAGE, VOICE, text),
+                                 stdout=subprocess.DEVNULL)
+        if process.returncode == 0:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    return len(latencies) + errors, errors, latencies
+
+
+def run_cli_batch(url, options):
+    """Invoke the command line once for all the requests."""
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv') as batch:
+        for text in texts(options['requests']):
+            batch.write('{}\t{}\t{}\n'.format(LANGUAGE, VOICE, text))
+        batch.flush()
+
+        output = subprocess.run(
+            _cli(url, options, '--batch', batch.name,
+                 '--concurrency', str(options['concurrency'])),
+            stdout=subprocess.PIPE, check=True).stdout
+
+    results = [json.loads(line) for line in output.splitlines()]
+    errors = sum('error' in result for result in results)
+    # The latency of each request is not known, only the whole duration.
+    return len(results), errors, []
+
+
+RUNNERS = {
+    'sync': run_sync,
+    'async': run_async,
+    'cli': run_cli,
+    'cli-batch': run_cli_batch,
+}
+
+
+def _measure(scenario, url, options, connection):
+    """Run a scenario in this (fresh) process and send back its measures."""
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    requests, errors, latencies = RUNNERS[scenario](url, options)
+
+    duration = time.perf_counter() - start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if scenario.startswith('cli'):
+        cpu = children.ru_utime - children_start.ru_utime + \
+            children.ru_stime - children_start.ru_stime
+        peak_rss = children.ru_maxrss
+    else:
+        cpu = time.process_time() - cpu_start
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    connection.send(summarize(requests, errors, latencies, duration, cpu,
+                              peak_rss))
+
+
+def _serve(server_options, connection):
+    """Run the fake website until asked to stop."""
+    with FakeAcapelaServer(**server_options) as server:
+        connection.send(server.url)
+        connection.recv()
+        connection.send(server.requests())
+
+
+def run(options):
+    """Run the scenarios and return the report."""
+    context = multiprocessing.get_context('spawn')
+    server_options = {
+        'latency': options['latency'],
+        'page_size': options['page_size'],
+        'error_rate': options['error_rate'],
+        'seed': options['seed'],
+    }
+    server_connection, child_connection = context.Pipe()
+    server = context.Process(target=_serve,
+                             args=(server_options, child_connection))
+    server.start()
+    url = server_connection.recv()
+
+    results = {}
+    try:
+        for scenario in options['scenarios']:
+            connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_measure,
+                args=(scenario, url, options, child_connection))
+            process.start()
+            results[scenario] = connection.recv()
+            process.join()
+            print('{:<10} {:>8.1f} req/s  p50 {:>8} ms  p99 {:>8} ms  '
+                  'cpu {:>6.2f} s  rss {:>7} KiB'.format(
+                      scenario, results[scenario]['throughput_rps'] or 0,
+                      format_ms(results[scenario]['latency_ms']['p50']),
+                      format_ms(results[scenario]['latency_ms']['p99']),
+                      results[scenario]['cpu_s'],
+                      results[scenario]['peak_rss_kib']),
+                  file=sys.stderr)
+    finally:
+        server_connection.send('stop')
+        server_requests = server_connection.recv()
+        server.join()
+
+    return {
+        'version': acapela_group.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(),
+        'options': options,
+        'server_requests': server_requests,
+        'results': results,
+    }
+
+
+def compare(report, baseline):
+    """Print how the results changed since `baseline`."""
+    print('{:<10} {:>24}'.format('', 'change since {}'.format(
+        baseline['version'])), file=sys.stderr)
+    for scenario, result in sorted(report['results'].items()):
+        old = baseline['results'].get(scenario)
+        if old is None:
+            continue
+        changes = []
+        for name, new_value, old_value in (
+                ('throughput', result['throughput_rps'],
+                 old['throughput_rps']),
+                ('p50', result['latency_ms']['p50'],
+                 old['latency_ms']['p50']),
+                ('p99', result['latency_ms']['p99'],
+                 old['latency_ms']['p99']),
+                ('cpu', result['cpu_s'], old['cpu_s']),
+                ('rss', result['peak_rss_kib'], old['peak_rss_kib'])):
+            if new_value is not None and old_value:
+                changes.append('{} {:+.1%}'.format(
+                    name, new_value / old_value - 1))
+        print('{:<10} {}'.format(scenario, '  '.join(changes)),
+              file=sys.stderr)
+
+
+def main(argv=None):
+    """Parse the arguments, run the benchmarks and save the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', dest='scenarios', action='append',
+                        choices=SCENARIOS,
+                        help='A scenario to run (repeatable). Defaults to '
+                             'all of them.')
+    parser.add_argument('--requests', type=int, default=500,
+                        help='How many requests each scenario sends.')
+    parser.add_argument('--cli-runs', type=int, default=10,
+                        help='How many times the cli scenario runs.')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='How many requests may be in flight at once.')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='The latency of the fake website, in seconds.')
+    parser.add_argument('--page-size', type=int, default=32 * 1024,
+                        help='The size of the fake tts pages, in bytes.')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='The probability of a 503 answer.')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='How many times the clients retry a request.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='The seed of the fake website errors.')
+    parser.add_argument('--output', default='-',
+                        help="Where to write the JSON report ('-' for "
+                             "stdout).")
+    parser.add_argument('--compare', metavar='REPORT',
+                        help='A previous report to compare the results to.')
+    arguments = parser.parse_args(argv)
+
+    options = vars(arguments).copy()
+    options['scenarios'] = arguments.scenarios or list(SCENARIOS)
+    del options['output'], options['compare']
+
+    report = run(options)
+    if arguments.compare is not None:
+        with open(arguments.compare) as fileobj:
+            compare(report, json.load(fileobj))
+
+    if arguments.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(arguments.output, 'w') as fileobj:
+            json.dump(report, fileobj, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,8 @@ CLASSIFIERS = [
     'Topic :: Utilities',
 ]
 INSTALL_REQUIRES = [
+    'aiohttp',
     'click',
-    'requests',
 ]
 TESTS_REQUIRE = [
     'pytest',
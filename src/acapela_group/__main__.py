@@ -1,38 +1,403 @@
 """Entry point."""
 
+import functools
+import json
+
 import click
 
 from .base import AcapelaGroup, AcapelaGroupError
+from .batch import DEFAULT_CONCURRENCY, BatchRequest
+from .common import DEFAULT_BASE_URL
+from .jobs import DEFAULT_WORKERS
+from .language import LANGUAGES
+from .policy import (DEFAULT_MAX_ATTEMPTS, DEFAULT_TIMEOUT, CircuitBreaker,
+                     Policy, TokenBucket)
+from .remote import RemoteClient
+from .sessions import SessionStore, default_session_path
+from .voices import VoiceCatalog, default_voices_path
 
 
-@click.command(context_settings={'help_option_names': ['-h', '--help']})
-@click.argument("language")
-@click.argument("voice")
-@click.argument("text")
-@click.option("--username", help="Acapela Group username (if authenticating).")
-@click.option("--password", help="Acapela Group password (if authenticating).")
-def main(language, voice, text, username=None, password=None):
-    """Fetch generated tts sounds from Acapela Group."""
-    acapela_group = AcapelaGroup()
+def _read_requests(fileobj, input_format):
+    """Lazily parse the requests of a batch file.
+
+    Invalid lines are reported on stderr and skipped.
+    """
+    for line_number, line in enumerate(fileobj, start=1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+
+        try:
+            if input_format == 'jsonl':
+                fields = json.loads(line)
+                yield BatchRequest(fields['language'], fields['voice'],
+                                   fields['text'])
+            else:
+                yield BatchRequest(*line.split('\t', 2))
+        except (ValueError, TypeError, KeyError):
+            click.secho("Line {}: invalid request, skipped.".format(
+                line_number), fg='red', err=True)
+
+
+def _format_result(result):
+    fields = result.request._asdict()
+    if result.ok:
+        fields['url'] = result.url
+    else:
+        fields['error'] = str(result.error)
+        fields['error_type'] = type(result.error).__name__
+    return json.dumps(fields, ensure_ascii=False)
+
 
+def _run_batch(acapela_group, batch, input_format, concurrency, ordered):
+    if input_format is None:
+        input_format = 'jsonl' if batch.name.endswith(('.jsonl', '.json')) \
+            else 'tsv'
+
+    results = acapela_group.get_mp3_urls(
+        _read_requests(batch, input_format), concurrency=concurrency,
+        ordered=ordered)
+    for result in results:
+        click.echo(_format_result(result))
+
+
+def _make_policy(retries, timeout, rate, failure_threshold):
+    return Policy(
+        max_attempts=retries + 1, timeout=timeout or None,
+        rate_limiter=TokenBucket(rate) if rate else None,
+        circuit_breaker=CircuitBreaker(failure_threshold)
+        if failure_threshold is not None else None)
+
+
+def _check_credentials(username, password):
+    """Return whether to authenticate, or exit if only one is provided."""
     # The two options must be provided together.
     if username is not None and password is None or \
             password is not None and username is None:
         click.secho("Please provide *BOTH* username and password, or nothing "
                     "at all.", fg="red")
         raise SystemExit(-1)
+    return username is not None and password is not None
+
+
+def _make_session_store(do_authenticate, session_file, no_session_store):
+    if do_authenticate and not no_session_store:
+        return SessionStore(session_file or default_session_path())
+    return None
+
+
+_BASE_URL_OPTION = click.option(
+    "--base-url", default=DEFAULT_BASE_URL, show_default=True,
+    help="The url of the website, e.g. a local stand-in.")
+
+_VOICES_FILE_OPTION = click.option(
+    "--voices-file", type=click.Path(dir_okay=False),
+    default=default_voices_path,
+    help="Where the catalog of voices fetched by 'voices --refresh' is "
+         "kept. Defaults to $XDG_CACHE_HOME/acapela-group/voices.json.")
+
+_CLIENT_OPTIONS = [
+    _BASE_URL_OPTION,
+    click.option("--username",
+                 help="Acapela Group username (if authenticating)."),
+    click.option("--password",
+                 help="Acapela Group password (if authenticating)."),
+    click.option("--session-file", type=click.Path(dir_okay=False),
+                 default=default_session_path,
+                 help="Where to keep the authenticated sessions, so that the "
+                      "next invocations do not log in again. Defaults to "
+                      "$XDG_CACHE_HOME/acapela-group/sessions.json."),
+    click.option("--no-session-store", is_flag=True,
+                 help="Always log in, and do not store the session."),
+    click.option("--retries", type=click.IntRange(min=0),
+                 default=DEFAULT_MAX_ATTEMPTS - 1, show_default=True,
+                 help="How many times a request failing with a network "
+                      "error, a timeout or a server error is retried."),
+    click.option("--timeout", type=click.FloatRange(min=0),
+                 default=DEFAULT_TIMEOUT, show_default=True,
+                 help="How many seconds a single http request may last."),
+    click.option("--rate", type=click.FloatRange(min=0),
+                 help="How many requests per second may be sent to the "
+                      "website. Unlimited by default."),
+    click.option("--circuit-breaker", "failure_threshold",
+                 type=click.IntRange(min=1),
+                 help="Stop sending requests for a while after this many "
+                      "failures in a row. Disabled by default."),
+    _VOICES_FILE_OPTION,
+    click.option("--no-voice-check", is_flag=True,
+                 help="Send the requests even if the voice is not in the "
+                      "catalog of the language."),
+]
+
+
+def _client_options(function):
+    for option in reversed(_CLIENT_OPTIONS):
+        function = option(function)
+    return function
+
+
+class _DefaultGroup(click.Group):
+    """A group running its default command when no command is named.
+
+    This keeps `acapela-group LANGUAGE VOICE TEXT` working next to the
+    other commands.
+    """
+
+    default_command = 'fetch'
+
+    def parse_args(self, ctx, args):
+        """Insert the default command if the first argument is not one."""
+        if not args or args[0] not in self.commands and \
+                args[0] not in ctx.help_option_names:
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=_DefaultGroup,
+             context_settings={'help_option_names': ['-h', '--help']})
+def main():
+    """Fetch generated tts sounds from Acapela Group.
+
+    Without a command, the 'fetch' command runs.
+    """
+
+
+@main.command()
+@click.argument("language", required=False)
+@click.argument("voice", required=False)
+@click.argument("text", required=False)
+@_client_options
+@click.option("--batch", type=click.File('r'),
+              help="Read requests from this file ('-' for stdin) instead of "
+                   "the arguments, and write one JSON result per line.")
+@click.option("--format", "input_format", type=click.Choice(['tsv', 'jsonl']),
+              help="Format of the batch file: LANGUAGE<tab>VOICE<tab>TEXT "
+                   "lines, or JSON objects with 'language', 'voice' and "
+                   "'text' keys. Guessed from the file extension by "
+                   "default.")
+@click.option("--concurrency", type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help="How many batch requests may be in flight at once.")
+@click.option("--ordered/--unordered", default=True, show_default=True,
+              help="Write the batch results in the input order, or as soon "
+                   "as they are ready.")
+@click.option("--server", metavar="ADDRESS", envvar="ACAPELA_GROUP_SERVER",
+              help="Send the requests to an 'acapela-group serve' service "
+                   "listening on this url, or on this Unix socket if "
+                   "prefixed with 'unix:', instead of the website.")
+def fetch(language, voice, text, base_url=DEFAULT_BASE_URL, username=None,
+          password=None, session_file=None, no_session_store=False,
+          retries=DEFAULT_MAX_ATTEMPTS - 1, timeout=DEFAULT_TIMEOUT,
+          rate=None, failure_threshold=None, voices_file=None,
+          no_voice_check=False, batch=None, input_format=None,
+          concurrency=DEFAULT_CONCURRENCY, ordered=True, server=None):
+    """Fetch generated tts sounds from Acapela Group."""
+    if batch is None and text is None:
+        raise click.UsageError("Missing LANGUAGE, VOICE and TEXT arguments.")
+    if batch is not None and language is not None:
+        raise click.UsageError("--batch cannot be used with the LANGUAGE, "
+                               "VOICE and TEXT arguments.")
+
+    do_authenticate = _check_credentials(username, password)
+    if server is not None:
+        if do_authenticate:
+            raise click.UsageError("--server cannot be used with --username "
+                                   "and --password: the service logs in.")
+        acapela_group = RemoteClient(server, max_workers=concurrency)
     else:
-        do_authenticate = username is not None and password is not None
+        acapela_group = AcapelaGroup(
+            base_url=base_url, max_workers=concurrency,
+            session_store=_make_session_store(do_authenticate, session_file,
+                                              no_session_store),
+            policy=_make_policy(retries, timeout, rate, failure_threshold),
+            voices=VoiceCatalog.load(voices_file,
+                                     validate=not no_voice_check))
 
     try:
-        if do_authenticate:
-            acapela_group.authenticate(username, password)
+        with acapela_group:
+            if do_authenticate:
+                acapela_group.authenticate(username, password)
+
+            if batch is not None:
+                _run_batch(acapela_group, batch, input_format, concurrency,
+                           ordered)
+            else:
+                click.echo(acapela_group.get_mp3_url(language, voice, text))
+    except AcapelaGroupError as exn:
+        click.secho(str(exn), fg='red')
+        raise SystemExit(-2)
 
-        click.echo(acapela_group.get_mp3_url(language, voice, text))
+
+@main.command()
+@_client_options
+@click.option("--host", default='127.0.0.1', show_default=True,
+              help="The interface to listen on.")
+@click.option("--port", type=click.IntRange(min=0, max=65535), default=8765,
+              show_default=True, help="The port to listen on.")
+@click.option("--socket", "socket_path", type=click.Path(dir_okay=False),
+              help="Listen on this Unix socket instead of a port.")
+@click.option("--concurrency", type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help="How many requests may be resolved at once.")
+@click.option("--queue-size", type=click.IntRange(min=0), default=100,
+              show_default=True,
+              help="How many more requests may wait for their turn. Beyond "
+                   "that, requests are refused with a 503 status.")
+@click.option("--queue-timeout", type=click.FloatRange(min=0), default=30.0,
+              show_default=True,
+              help="How many seconds a request may wait for its turn.")
+@click.option("--cache-file", type=click.Path(dir_okay=False),
+              help="Also keep the resolved urls in this SQLite database, "
+                   "across restarts.")
+@click.option("--cache-size", type=click.IntRange(min=1), default=10000,
+              show_default=True,
+              help="How many resolved urls are kept in memory.")
+@click.option("--connections-per-host", type=click.IntRange(min=1),
+              help="How many connections to the website may be open at "
+                   "once. Unlimited by default.")
+@click.option("--prewarm", type=click.IntRange(min=0), default=0,
+              show_default=True,
+              help="How many connections to the website to open when the "
+                   "service starts.")
+def serve(base_url=DEFAULT_BASE_URL, username=None, password=None,
+          session_file=None, no_session_store=False,
+          retries=DEFAULT_MAX_ATTEMPTS - 1, timeout=DEFAULT_TIMEOUT,
+          rate=None, failure_threshold=None, voices_file=None,
+          no_voice_check=False, host='127.0.0.1', port=8765,
+          socket_path=None, concurrency=DEFAULT_CONCURRENCY, queue_size=100,
+          queue_timeout=30.0, cache_file=None, cache_size=10000,
+          connections_per_host=None, prewarm=0):
+    """Serve warm sessions to the 'fetch --server' command.
+
+    The service keeps an authenticated session, its connections and a cache
+    of the resolved urls for as long as it runs.
+    """
+    # Only this command needs aiohttp.
+    from .async_client import AcapelaGroupAsync
+    from .cache import MemoryCache, SQLiteCache, TieredCache
+    from .connections import ConnectionConfig
+    from .metrics import Metrics
+    from .server import Server
+
+    do_authenticate = _check_credentials(username, password)
+    cache = MemoryCache(max_entries=cache_size)
+    if cache_file is not None:
+        cache = TieredCache(cache, SQLiteCache(cache_file))
+    metrics = Metrics()
+    client = AcapelaGroupAsync(
+        base_url=base_url, cache=cache,
+        session_store=_make_session_store(do_authenticate, session_file,
+                                          no_session_store),
+        policy=_make_policy(retries, timeout, rate, failure_threshold),
+        metrics=metrics,
+        voices=VoiceCatalog.load(voices_file, validate=not no_voice_check),
+        connections=ConnectionConfig(limit_per_host=connections_per_host,
+                                     prewarm=prewarm))
+    server = Server(client, (username, password) if do_authenticate else None,
+                    concurrency=concurrency, queue_size=queue_size,
+                    queue_timeout=queue_timeout, metrics=metrics)
+
+    try:
+        server.run(host=host, port=port, path=socket_path,
+                   print=lambda message: click.echo(message, err=True))
     except AcapelaGroupError as exn:
         click.secho(str(exn), fg='red')
         raise SystemExit(-2)
 
 
+@main.command()
+@click.argument("requests", type=click.File('r'))
+@click.argument("directory", type=click.Path(file_okay=False))
+@_client_options
+@click.option("--format", "input_format", type=click.Choice(['tsv', 'jsonl']),
+              help="Format of the requests, as for 'fetch --batch'. Guessed "
+                   "from the file extension by default.")
+@click.option("--workers", type=click.IntRange(min=1),
+              default=DEFAULT_WORKERS, show_default=True,
+              help="How many worker processes to run.")
+@click.option("--concurrency", type=click.IntRange(min=1),
+              default=DEFAULT_CONCURRENCY, show_default=True,
+              help="How many requests each worker may have in flight.")
+@click.option("--retry-failed/--no-retry-failed", default=True,
+              show_default=True,
+              help="Send again the requests which failed in a previous run.")
+def job(requests, directory, base_url=DEFAULT_BASE_URL, username=None,
+        password=None, session_file=None, no_session_store=False,
+        retries=DEFAULT_MAX_ATTEMPTS - 1, timeout=DEFAULT_TIMEOUT, rate=None,
+        failure_threshold=None, voices_file=None, no_voice_check=False,
+        input_format=None, workers=DEFAULT_WORKERS,
+        concurrency=DEFAULT_CONCURRENCY, retry_failed=True):
+    """Resolve the REQUESTS file, recording the results in DIRECTORY.
+
+    Running the same job again, e.g. after a crash or an interruption,
+    only sends the requests which were not resolved yet. The results are
+    the results-*.jsonl files of DIRECTORY.
+    """
+    from .async_client import AcapelaGroupAsync
+    from .jobs import Job
+
+    if input_format is None:
+        input_format = 'jsonl' \
+            if requests.name.endswith(('.jsonl', '.json')) else 'tsv'
+
+    do_authenticate = _check_credentials(username, password)
+    client_factory = functools.partial(
+        AcapelaGroupAsync, base_url=base_url,
+        session_store=_make_session_store(do_authenticate, session_file,
+                                          no_session_store),
+        policy=_make_policy(retries, timeout, rate, failure_threshold),
+        voices=VoiceCatalog.load(voices_file, validate=not no_voice_check))
+    bulk_job = Job(directory, workers=workers, concurrency=concurrency,
+                   client_factory=client_factory,
+                   credentials=(username, password) if do_authenticate
+                   else None,
+                   retry_failed=retry_failed)
+
+    try:
+        stats = bulk_job.run(_read_requests(requests, input_format))
+    except ValueError as exn:
+        click.secho(str(exn), fg='red')
+        raise SystemExit(-2)
+
+    click.echo(json.dumps(stats.as_dict()))
+    for error in stats.errors:
+        click.secho(error, fg='red', err=True)
+    if stats.interrupted:
+        click.secho("Interrupted: run the same command to resume.",
+                    fg='yellow', err=True)
+        raise SystemExit(1)
+
+
+@main.command()
+@click.argument("language", required=False)
+@click.option("--refresh", is_flag=True,
+              help="Fetch the voices from the website first, and keep them "
+                   "for the next invocations.")
+@_BASE_URL_OPTION
+@_VOICES_FILE_OPTION
+def voices(language, refresh=False, base_url=DEFAULT_BASE_URL,
+           voices_file=None):
+    """List the voices of LANGUAGE, or of every language."""
+    catalog = VoiceCatalog.load(voices_file)
+    try:
+        if refresh:
+            with AcapelaGroup(base_url=base_url) as acapela_group:
+                catalog.update(acapela_group.fetch_voices())
+            catalog.save(voices_file)
+
+        if language is not None:
+            for voice in catalog.voices_for(language):
+                click.echo(voice)
+            return
+    except AcapelaGroupError as exn:
+        click.secho(str(exn), fg='red')
+        raise SystemExit(-2)
+
+    by_code = catalog.as_dict()
+    for language, language_code in sorted(LANGUAGES.items()):
+        click.echo("{}: {}".format(language,
+                                   ', '.join(by_code.get(language_code, ()))))
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,912 @@
+"""Asynchronous client, on top of aiohttp.
+
+aiohttp is only imported when a session is opened, so that importing this
+module does not cost its import time.
+"""
+import asyncio
+import email.utils
+import functools
+import http.cookiejar
+import http.cookies
+import io
+import time
+
+from .auth import AuthManager
+from .batch import DEFAULT_CONCURRENCY, imap_async, map_async
+from .cache import make_key
+from .common import (ACCEPT_ENCODING, DEFAULT_BASE_URL, TTS_FORM_PATH,
+                     check_login_response, check_status, counting_errors_async,
+                     get_language_code, login_form_data, tts_form_data,
+                     with_deadline)
+from .connections import ConnectionConfig
+from .download import DEFAULT_CHUNK_SIZE, open_destination
+from .exceptions import (AcapelaGroupError, DownloadError, NeedsUpdateError,
+                         NetworkError, ServerError)
+from .longtext import DEFAULT_MAX_LENGTH, split_text
+from .metrics import ChunkMeter, aiohttp_trace_config, stats_collector
+from .mp3 import audio_frames
+from .parsing import scan_mp3_url_async
+from .sessions import is_logged_in
+from .singleflight import AsyncSingleFlight
+from .voices import parse_voices
+
+
+class AcapelaGroupAsync:
+    """Asynchronous client class for Acapela Group website interaction.
+
+    The http session is opened on first use, or by `open`, and must be
+    closed with `close`. Using the client as an asynchronous context
+    manager does both.
+    """
+
+    # The 'client' label of the metrics.
+    _metrics_label = 'async'
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, cache=None,
+                 session_store=None, policy=None, metrics=None,
+                 voices=None, audio_store=None, scheduler=None,
+                 connections=None, hedging=None, endpoints=None,
+                 auth=None):
+        """Create an asynchronous AcapelaGroup session handler.
+
+        Args:
+            base_url (str): The url of the website.
+            cache: An optional cache for the resolved mp3 urls (see the
+                `cache` module).
+            session_store (SessionStore): An optional store to reuse the
+                authenticated sessions of other processes (see the
+                `sessions` module).
+            policy (Policy): An optional policy for the timeouts, retries,
+                rate limiting and circuit breaking of the requests (see the
+                `policy` module).
+            metrics (Metrics): Optional metrics to report the timings,
+                errors and counters of the client to (see the `metrics`
+                module).
+            voices (VoiceCatalog): An optional catalog to check the voices
+                against before sending the requests, and to remember the
+                requests which failed (see the `voices` module).
+            audio_store (AudioStore): An optional store of the generated
+                mp3s, so that the same text is never synthesized twice (see
+                the `audio` module).
+            scheduler (Scheduler): An optional scheduler deciding which
+                requests are sent first, by priority class and by caller
+                (see the `scheduler` module).
+            connections (ConnectionConfig): The settings of the pool of
+                connections (see the `connections` module). Defaults to
+                `ConnectionConfig()`.
+            hedging (HedgingPolicy): An optional policy sending a duplicate
+                of the text-to-speech requests which are slow to answer
+                (see the `hedging` module).
+            endpoints (EndpointSet): Optional endpoints of the website to
+                spread the requests over, in place of `base_url` (see the
+                `endpoints` module).
+            auth (AuthManager): The manager running the logins one at a
+                time, to share with other clients (see the `auth` module).
+                Defaults to an `AuthManager()` of the client.
+
+        """
+        if endpoints is not None:
+            base_url = endpoints.urls[0]
+        self._base_url = base_url
+        self._endpoints = endpoints
+        self._probe_task = None
+        self._cache = cache
+        self._session_store = session_store
+        self._policy = policy
+        self._flights = AsyncSingleFlight()
+        self._metrics = metrics
+        self._voices = voices
+        self._audio_store = audio_store
+        self._scheduler = scheduler
+        self._hedging = hedging
+        self._auth = auth or AuthManager()
+        self._register_collectors()
+        self._credentials = None
+        self._track_expiry = False
+        self._authenticated = False
+        self._connections = connections or ConnectionConfig()
+        self._http_session = None
+        self._request_options = {}
+        self._transient_errors = ()
+        self._network_errors = ()
+
+    async def __aenter__(self):
+        """Open the http session with AcapelaGroup."""
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Close the http session with AcapelaGroup."""
+        await self.close()
+
+    def _get_http_session(self):
+        if self._http_session is not None:
+            return self._http_session
+
+        import aiohttp
+
+        # The errors worth retrying, see `acapela_group.policy`.
+        self._transient_errors = (
+            ServerError, aiohttp.ClientConnectionError,
+            aiohttp.ServerTimeoutError, asyncio.TimeoutError)
+        # The errors raised as `NetworkError` or `DownloadError`.
+        self._network_errors = (aiohttp.ClientError, asyncio.TimeoutError)
+        if self._policy is not None and self._policy.timeout is not None:
+            self._request_options = {
+                'timeout': aiohttp.ClientTimeout(total=self._policy.timeout)}
+
+        trace_configs = []
+        if self._metrics is not None:
+            trace_configs.append(aiohttp_trace_config(self._metrics,
+                                                      self._metrics_label))
+        self._http_session = aiohttp.ClientSession(
+            connector=self._connections.aiohttp_connector(),
+            trace_configs=trace_configs)
+        return self._http_session
+
+    async def open(self):
+        """Open the http session, and the connections to warm up, if any.
+
+        The session is otherwise opened by the first request.
+        """
+        self._get_http_session()
+        if self._connections.prewarm:
+            await self.warm_up()
+
+    async def close(self):
+        """Close the http session and every connection.
+
+        The client may be used again afterwards, with a new session which
+        is not authenticated.
+        """
+        session, self._http_session = self._http_session, None
+        self._authenticated = False
+        self._track_expiry = False
+        probe_task, self._probe_task = self._probe_task, None
+        if probe_task is not None:
+            probe_task.cancel()
+        if session is not None:
+            await session.close()
+
+    async def _head(self, base_url):
+        """Return the status of the index of `base_url`, or None."""
+        import aiohttp
+
+        try:
+            async with self._get_http_session().head(
+                    self._join(base_url), **self._request_kwargs()) \
+                    as response:
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def warm_up(self, count=None):
+        """Open connections to the website in advance.
+
+        The connections are opened concurrently, by requests for the headers
+        of the index page, and are then kept in the pool for the next
+        requests. Failures are ignored: the requests will open their own
+        connections. With several endpoints, the connections are spread
+        over them.
+
+        Args:
+            count (int): How many connections to open. Defaults to the
+                `prewarm` setting of the client.
+
+        Returns:
+            int: How many connections were opened.
+
+        """
+        if count is None:
+            count = self._connections.prewarm
+        urls = [self._base_url]
+        if self._endpoints is not None:
+            urls = self._endpoints.urls
+        statuses = await asyncio.gather(*(self._head(urls[index % len(urls)])
+                                          for index in range(count)))
+        return sum(status is not None for status in statuses)
+
+    @property
+    def base_url(self):
+        """str: Get the base url of the instance.
+
+        Being able to set the base url can be useful for testing purposes. The
+        base url cannot be changed once the instance has been created.
+        """
+        return self._base_url
+
+    @property
+    def flight_stats(self):
+        """Get the counters of the coalesced requests.
+
+        Returns:
+            FlightStats: How many `get_mp3_url` calls were made, and how
+                many of them shared the request of an identical call.
+
+        """
+        return self._flights.stats
+
+    def _register_collectors(self):
+        if self._metrics is None:
+            return
+        client = self._metrics_label
+        self._metrics.add_collector(stats_collector(
+            'coalescing', self._flights.stats, client=client))
+        self._metrics.add_collector(stats_collector(
+            'auth', self._auth.stats, client=client))
+        if getattr(self._cache, 'stats', None) is not None:
+            self._metrics.add_collector(stats_collector(
+                'cache', self._cache.stats, client=client))
+        if self._voices is not None:
+            self._metrics.add_collector(stats_collector(
+                'negative_cache', self._voices.failure_stats, client=client))
+        if self._audio_store is not None:
+            self._metrics.add_collector(stats_collector(
+                'audio_store', self._audio_store.stats, client=client))
+        if self._scheduler is not None:
+            for name, stats in self._scheduler.stats.items():
+                self._metrics.add_collector(stats_collector(
+                    'scheduler', stats, client=client, priority_class=name))
+        if self._hedging is not None:
+            self._metrics.add_collector(stats_collector(
+                'hedging', self._hedging.stats, client=client))
+        if self._endpoints is not None:
+            for url, stats in self._endpoints.stats.items():
+                self._metrics.add_collector(stats_collector(
+                    'endpoint', stats, client=client, endpoint=url))
+
+    def build_url(self, path=''):
+        """Build a full URL with `self.base_url` and `path`.
+
+        The result is simply `self.base_url`/`path`.
+
+        Args:
+            path (str): The path to build the URL with. Defaults to ''.
+
+        Example:
+            if the base url is 'http://www.acapela-group.com' and that the
+            path is 'wp-login.php', then the method will return
+            'http://www.acapela-group.com/wp-login.php'.
+
+        Returns:
+            str: Build url.
+
+        """
+        return self._join(self._base_url, path)
+
+    @staticmethod
+    def _join(base_url, path=''):
+        return '{}/{}'.format(base_url, path)
+
+    @counting_errors_async
+    @with_deadline
+    async def authenticate(self, username: str, password: str, *,
+                           deadline=None):
+        """Authenticate against the website using `login` and `password`.
+
+        The session will use the provided credentials to scrap the website.
+        It is useful mostly for retrieving sound with no background music
+        set when an anonymous user listens to a text-to-speech sound.
+
+        If the client has a session store holding a valid session for this
+        account, that session is reused and nothing is sent to the website.
+        Otherwise, the new session is saved into the store. Later requests
+        log in again transparently if the session expires.
+
+        Only one login of an account runs at a time: concurrent calls share
+        its outcome. After a lockout or refused credentials, the next calls
+        fail at once until the account cooled down (see the `auth` module).
+
+        To obtain some credentials, you must register here:
+        http://www.acapela-group.com/register/
+
+        Args:
+            username: The account's username used for registration.
+            password: The account's password used for registration.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                login must be over. Defaults to no deadline.
+
+        Note:
+            Be careful: Acapela Group does not use HTTPS, so your credentials
+                are passing through networks as plain text. If no exception
+                is raised, then the authentication succeeded.
+
+        Raises:
+            AcapelaGroupError: something went wrong while authenticating.
+            DeadlineExceededError: The login was not over by `deadline`.
+
+        """
+        self._credentials = (username, password)
+        if self._session_store is not None:
+            cookies = self._session_store.load(self._base_url, username)
+            if cookies is not None:
+                self._import_cookies(cookies)
+                self._share_cookies()
+                self._track_expiry = True
+                self._authenticated = True
+                return
+
+        await self._auth.login(self._account(), self._login, username,
+                               password)
+
+    def _account(self):
+        return self._base_url, self._credentials[0]
+
+    async def _login(self, username, password):
+        if self._metrics is None:
+            return await self._call(self._on_endpoint, self._send_login,
+                                    username, password)
+        with self._metrics.timer('phase_seconds', phase='login',
+                                 client=self._metrics_label):
+            await self._call(self._on_endpoint, self._send_login, username,
+                             password)
+
+    async def _send_login(self, base_url, username, password):
+        data = login_form_data(username, password, self._join(base_url))
+
+        session = self._get_http_session()
+        response = await session.post(
+            self._join(base_url, 'wp-login.php'),
+            allow_redirects=False,
+            data=data,
+            **self._request_kwargs())
+        try:
+            text = await response.text()
+            check_status(response.status)
+            location = check_login_response(text, response.headers)
+        finally:
+            response.release()
+
+        # Go to the index to simulate the Location.
+        response = await session.get(location, **self._request_kwargs())
+        response.release()
+        self._authenticated = True
+        self._share_cookies()
+        self._save_session(username)
+
+    def _export_cookies(self):
+        cookies = []
+        if self._http_session is None:
+            return cookies
+        for morsel in self._http_session.cookie_jar:
+            expires = None
+            if morsel['max-age']:
+                expires = time.time() + int(morsel['max-age'])
+            elif morsel['expires']:
+                expires = http.cookiejar.http2time(morsel['expires'])
+            cookies.append({
+                'name': morsel.key,
+                'value': morsel.value,
+                'domain': morsel['domain'] or None,
+                'path': morsel['path'] or '/',
+                'expires': expires,
+                'secure': bool(morsel['secure']),
+            })
+        return cookies
+
+    def _import_cookies(self, cookies, base_url=None):
+        import yarl
+
+        simple_cookie = http.cookies.SimpleCookie()
+        for cookie in cookies:
+            simple_cookie[cookie['name']] = cookie['value']
+            morsel = simple_cookie[cookie['name']]
+            morsel['domain'] = cookie['domain'] or ''
+            morsel['path'] = cookie['path']
+            if cookie['expires'] is not None:
+                morsel['expires'] = email.utils.formatdate(cookie['expires'],
+                                                           usegmt=True)
+            morsel['secure'] = cookie['secure']
+        self._get_http_session().cookie_jar.update_cookies(
+            simple_cookie, response_url=yarl.URL(base_url or self._base_url))
+
+    def _share_cookies(self):
+        """Copy the cookies of the session to every endpoint."""
+        if self._endpoints is None:
+            return
+        # The endpoints are hosts of a same website, sharing the sessions.
+        cookies = [dict(cookie, domain=None)
+                   for cookie in self._export_cookies()]
+        for url in self._endpoints.urls:
+            self._import_cookies(cookies, url)
+
+    async def _relogin(self, username, password):
+        if self._session_store is not None:
+            self._session_store.discard(self._base_url, username)
+        await self._login(username, password)
+
+    async def _ensure_session(self):
+        if self._session_expired():
+            # The callers finding the session expired share one login.
+            await self._auth.login(self._account(), self._relogin,
+                                   *self._credentials)
+
+    async def _with_session(self, function, *args):
+        """Await `function(*args)` with a valid session.
+
+        The call is made again if the website ended the session meanwhile.
+        """
+        await self._ensure_session()
+        result = await function(*args)
+        if self._session_expired():
+            await self._ensure_session()
+            result = await function(*args)
+        return result
+
+    def _save_session(self, username):
+        # Only sessions identified by a login cookie can be told expired.
+        self._track_expiry = self._is_logged_in()
+        if self._session_store is not None and self._track_expiry:
+            self._session_store.save(self._base_url, username,
+                                     self._export_cookies())
+
+    def _is_logged_in(self):
+        return is_logged_in(self._export_cookies())
+
+    def _session_expired(self):
+        return self._track_expiry and not self._is_logged_in()
+
+    def _request_kwargs(self):
+        return self._request_options
+
+    @counting_errors_async
+    @with_deadline
+    async def _store_call(self, store, function, *args, deadline=None):
+        """Call `function(*args)`, in an executor if `store` is blocking.
+
+        The stores waiting for the disk, e.g. a `SQLiteCache`, would stall
+        every request of the loop meanwhile. The call is given up, but not
+        interrupted, once `deadline` passed.
+        """
+        if not getattr(store, 'blocking', False):
+            return function(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            None, function, *args)
+
+    async def _call(self, function, *args):
+        # Opening the session sets up the transient and network errors.
+        self._get_http_session()
+        try:
+            if self._policy is None:
+                return await function(*args)
+            return await self._policy.call_async(
+                function, *args, transient_errors=self._transient_errors)
+        except self._network_errors as exn:
+            # Without retries, or an error the policy does not retry.
+            raise NetworkError("Could not reach the website: {}".format(
+                str(exn) or type(exn).__name__)) from exn
+
+    async def _on_endpoint(self, function, *args):
+        """Await `function(base_url, *args)` on the next endpoint.
+
+        Each attempt of a retried request chooses its endpoint again, so
+        that it fails over to another one.
+        """
+        if self._endpoints is None:
+            return await function(self._base_url, *args)
+        # Opening the session sets up the transient errors.
+        self._get_http_session()
+        endpoint = self._endpoints.choose()
+        try:
+            with self._endpoints.track(endpoint, self._transient_errors):
+                return await function(endpoint.url, *args)
+        finally:
+            if self._probe_task is None and self._endpoints.ejected():
+                self._probe_task = asyncio.ensure_future(
+                    self._probe_endpoints())
+
+    async def _probe_endpoints(self):
+        """Add back the ejected endpoints as soon as they answer."""
+        try:
+            while self._endpoints.ejected():
+                await asyncio.sleep(self._endpoints.probe_interval)
+                for endpoint in self._endpoints.ejected():
+                    status = await self._head(endpoint.url)
+                    if status is not None and status < 500:
+                        self._endpoints.recovered(endpoint)
+        finally:
+            if self._probe_task is asyncio.current_task():
+                self._probe_task = None
+
+    async def _post_tts_form(self, base_url, data):
+        session = self._get_http_session()
+        target = self._join(base_url, TTS_FORM_PATH)
+        # The connection is released as soon as the url is found.
+        async with session.post(target, data=data, headers=ACCEPT_ENCODING,
+                                **self._request_kwargs()) as response:
+            check_status(response.status)
+            chunks = response.content.iter_chunked(DEFAULT_CHUNK_SIZE)
+            if self._metrics is None:
+                return await scan_mp3_url_async(chunks)
+
+            meter = ChunkMeter(self._metrics, self._metrics_label)
+            mp3_url = await scan_mp3_url_async(meter.iterate_async(chunks))
+            meter.finish('page')
+            return mp3_url
+
+    async def _send_tts_form(self, data):
+        if self._hedging is None:
+            return await self._call(self._on_endpoint, self._post_tts_form,
+                                    data)
+        # Each copy goes through the policy, so the duplicates are rate
+        # limited too, and chooses its own endpoint.
+        return await self._hedging.call(self._call, self._on_endpoint,
+                                        self._post_tts_form, data)
+
+    async def _get_text(self, base_url, path):
+        session = self._get_http_session()
+        async with session.get(self._join(base_url, path),
+                               **self._request_kwargs()) as response:
+            check_status(response.status)
+            return await response.text()
+
+    @counting_errors_async
+    @with_deadline
+    async def fetch_voices(self, *, deadline=None):
+        """Fetch the voices of each language from the website.
+
+        See `AcapelaGroup.fetch_voices`.
+        """
+        return parse_voices(await self._call(
+            self._on_endpoint, self._get_text, TTS_FORM_PATH))
+
+    @counting_errors_async
+    @with_deadline
+    async def get_mp3_url(self, language, voice, text, priority=None,
+                          caller=None, *, deadline=None):
+        """Retrieve the mp3 url associated to the settings.
+
+        To see the list of supported languages, check the `language` module.
+
+        Args:
+            language (str): The language to use for the acapela.
+            voice (str): The voice name to use for the acapela.
+            text (str): the text to translate to speech.
+            priority (str): The priority class of the request, if the client
+                has a scheduler. Defaults to its default class.
+            caller: A hashable identifying the caller, so that the scheduler
+                shares the slots of a class fairly between callers.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                call must be over. It is shared by every step of the call:
+                waiting for a slot, logging in again, sending the form and
+                reading the answer. Defaults to no deadline.
+
+        Raises:
+            NeedsUpdateError: The module needs an update since the mp3
+                url could not have been extracted, somehow.
+            VoiceNotSupportedError: The voice catalog of the client does
+                not have this voice for this language.
+            DeadlineExceededError: The call was not over by `deadline`.
+
+        Returns:
+            str: An HTTP url pointing to the generated mp3.
+
+        """
+        language_code = get_language_code(language)
+        if self._voices is not None:
+            self._voices.check_voice(language_code, voice)
+        key = make_key(language_code, voice, text,
+                       authenticated=self._authenticated)
+
+        if self._cache is not None:
+            mp3_url = await self._cache_get(key)
+            if mp3_url is not None:
+                return mp3_url
+
+        if self._voices is not None:
+            # Do not send again a request which failed recently.
+            self._voices.check_failure(key)
+
+        # Identical requests in flight share the same http request.
+        return await self._flights.do(key, self._resolve_mp3_url,
+                                      language_code, voice, text, key,
+                                      priority, caller)
+
+    async def _cache_get(self, key):
+        cache = self._cache
+        if not hasattr(cache, 'get_front_entry'):
+            return await self._store_call(cache, cache.get, key)
+
+        # The fast layers of a tiered cache are looked up right away.
+        entry = cache.get_front_entry(key)
+        if entry is None:
+            entry = await self._store_call(cache, cache.get_back_entry, key)
+        return None if entry is None else entry[0]
+
+    async def _resolve_mp3_url(self, language_code, voice, text, key,
+                               priority, caller):
+        if self._scheduler is None:
+            return await self._request_mp3_url(language_code, voice, text,
+                                               key)
+        # Only the requests sent to the website wait for a slot.
+        async with self._scheduler.slot(priority, caller):
+            return await self._request_mp3_url(language_code, voice, text,
+                                               key)
+
+    async def _request_mp3_url(self, language_code, voice, text, key):
+        data = tts_form_data(language_code, voice, text)
+        # Without a session, the sound has background music.
+        mp3_url = await self._with_session(self._send_tts_form, data)
+
+        if mp3_url is None:
+            message = ("Could not extract mp3 url pattern. "
+                       "Check the language or the voice name.")
+            if self._voices is not None:
+                self._voices.add_failure(key, message)
+            raise NeedsUpdateError(message)
+
+        if self._cache is not None:
+            await self._store_call(self._cache, self._cache.set, key,
+                                   mp3_url)
+
+        return mp3_url
+
+    def get_mp3_urls(self, items, concurrency=DEFAULT_CONCURRENCY,
+                     ordered=True, priority=None, caller=None, *,
+                     deadline=None):
+        """Retrieve the mp3 urls of many requests over the same session.
+
+        The requests are consumed lazily and at most `concurrency` of them
+        are in flight at once. A request failing with an `AcapelaGroupError`
+        (e.g. `NeedsUpdateError`, `LanguageNotSupportedError` or
+        `NetworkError`) does not abort the batch: its result carries the
+        error instead.
+
+        Example:
+            async for result in acapela.get_mp3_urls(items):
+                if result.ok:
+                    print(result.url)
+
+        Args:
+            items: An iterable or an asynchronous iterable of
+                (language, voice, text) sequences.
+            concurrency (int): How many requests may be in flight at once.
+                Defaults to `DEFAULT_CONCURRENCY`.
+            ordered (bool): Whether to yield the results in the input
+                order. Otherwise, they are yielded as soon as they are ready.
+                Defaults to True.
+            priority (str): The priority class of the requests (see
+                `get_mp3_url`).
+            caller: A hashable identifying the caller (see `get_mp3_url`).
+            deadline (float): A `time.monotonic()` timestamp by which every
+                request must be over. The requests still running then fail
+                with `DeadlineExceededError`.
+
+        Returns:
+            An asynchronous iterator of `BatchResult`.
+
+        """
+        return map_async(
+            functools.partial(self.get_mp3_url, priority=priority,
+                              caller=caller, deadline=deadline),
+            items, concurrency, ordered=ordered, errors=(AcapelaGroupError,))
+
+    @counting_errors_async
+    @with_deadline
+    async def download_mp3(self, url, destination,
+                           chunk_size=DEFAULT_CHUNK_SIZE, *, deadline=None):
+        """Download the mp3 located at `url` to `destination`.
+
+        The mp3 is streamed by chunks, so it is never held in memory as a
+        whole. When `destination` is a path, the file is written
+        atomically.
+
+        Args:
+            url (str): The mp3 url, as returned by `get_mp3_url`.
+            destination: A path, a binary file object, or '-' for the
+                standard output.
+            chunk_size (int): The size of the chunks to read and write.
+                Defaults to `DEFAULT_CHUNK_SIZE`.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                whole mp3 must be downloaded. Defaults to no deadline.
+
+        Raises:
+            DownloadError: The website did not serve the mp3, or the
+                download failed with a network error or a timeout.
+            DeadlineExceededError: The download was not over by
+                `deadline`.
+
+        Returns:
+            int: The size of the mp3, in bytes.
+
+        """
+        try:
+            return await self._download_mp3(url, destination, chunk_size)
+        except self._network_errors as exn:
+            raise DownloadError("Could not download {}: {}".format(
+                url, str(exn) or type(exn).__name__)) from exn
+
+    async def _download_mp3(self, url, destination, chunk_size):
+        size = 0
+        session = self._get_http_session()
+        async with session.get(url, **self._request_kwargs()) as response:
+            if response.status != 200:
+                raise DownloadError("Could not download {} (HTTP {}).".format(
+                    url, response.status))
+
+            chunks = response.content.iter_chunked(chunk_size)
+            meter = None
+            if self._metrics is not None:
+                meter = ChunkMeter(self._metrics, self._metrics_label)
+                chunks = meter.iterate_async(chunks)
+
+            with open_destination(destination) as fileobj:
+                async for chunk in chunks:
+                    fileobj.write(chunk)
+                    size += len(chunk)
+
+            if meter is not None:
+                meter.finish('mp3')
+
+        return size
+
+    def _audio_key(self, language, voice, text):
+        return make_key(get_language_code(language), voice, text,
+                        authenticated=self._authenticated)
+
+    async def synthesize(self, language, voice, text, destination, *,
+                         deadline=None):
+        """Generate the mp3 associated to the settings into `destination`.
+
+        See `AcapelaGroup.synthesize`.
+        """
+        # Each step gets what is left of the deadline.
+        if self._audio_store is None:
+            url = await self.get_mp3_url(language, voice, text,
+                                         deadline=deadline)
+            await self.download_mp3(url, destination, deadline=deadline)
+            return url
+
+        store = self._audio_store
+        key = self._audio_key(language, voice, text)
+        if await self._store_call(store, store.copy_to, key, destination,
+                                  deadline=deadline) is not None:
+            return None
+
+        url = await self.get_mp3_url(language, voice, text,
+                                     deadline=deadline)
+        await self._download_to_store(url, key, deadline)
+        if await self._store_call(store, store.copy_to, key, destination,
+                                  deadline=deadline) is None:
+            # Evicted by another process in the meantime.
+            await self.download_mp3(url, destination, deadline=deadline)
+        return url
+
+    async def _download_to_store(self, url, key, deadline):
+        """Stream the mp3 at `url` into the audio store, under `key`.
+
+        The mp3 goes to a temporary file of the store, chunk by chunk, and
+        the file is created, synced and indexed from an executor.
+        """
+        store = self._audio_store
+        fileobj = await self._store_call(store, store.begin,
+                                         deadline=deadline)
+        try:
+            await self.download_mp3(url, fileobj, deadline=deadline)
+            await self._store_call(store, store.commit, key, fileobj,
+                                   deadline=deadline)
+        finally:
+            # Not bounded: the temporary file must go.
+            await self._store_call(store, fileobj.discard)
+
+    async def download_mp3s(self, items, destination_for,
+                            concurrency=DEFAULT_CONCURRENCY, ordered=True,
+                            priority=None, caller=None, *, deadline=None):
+        """Generate the mp3s of many requests and download them.
+
+        The urls are resolved as in `get_mp3_urls`, ahead of the downloads:
+        while an mp3 is being downloaded, the next urls are being resolved.
+
+        Args:
+            items: An iterable or an asynchronous iterable of
+                (language, voice, text) sequences.
+            destination_for: A function taking a `BatchRequest` and returning
+                the destination of its mp3 (see `download_mp3`).
+            concurrency (int): How many urls may be resolved at once.
+                Defaults to `DEFAULT_CONCURRENCY`.
+            ordered (bool): Whether to process the requests in the input
+                order. Defaults to True.
+            priority (str): The priority class of the requests (see
+                `get_mp3_url`).
+            caller: A hashable identifying the caller (see `get_mp3_url`).
+            deadline (float): A `time.monotonic()` timestamp by which every
+                request, download included, must be over.
+
+        Yields:
+            BatchResult: The result of each request. If the download failed,
+                both its `url` and its `error` are set.
+
+        """
+        async for result in self.get_mp3_urls(items, concurrency, ordered,
+                                              priority, caller,
+                                              deadline=deadline):
+            if result.ok:
+                try:
+                    await self.download_mp3(result.url,
+                                            destination_for(result.request),
+                                            deadline=deadline)
+                except AcapelaGroupError as exn:
+                    result = result._replace(error=exn)
+            yield result
+
+    async def _fetch_mp3(self, language, voice, text, deadline=None):
+        key = None
+        if self._audio_store is not None:
+            key = self._audio_key(language, voice, text)
+            data = await self._store_call(self._audio_store,
+                                          self._audio_store.get, key,
+                                          deadline=deadline)
+            if data is not None:
+                return data
+
+        url = await self.get_mp3_url(language, voice, text,
+                                     deadline=deadline)
+        if key is not None:
+            await self._download_to_store(url, key, deadline)
+            data = await self._store_call(self._audio_store,
+                                          self._audio_store.get, key,
+                                          deadline=deadline)
+            if data is not None:
+                return data
+
+        buffer = io.BytesIO()
+        await self.download_mp3(url, buffer, deadline=deadline)
+        return buffer.getvalue()
+
+    async def iter_long_mp3(self, language, voice, text,
+                            max_length=DEFAULT_MAX_LENGTH,
+                            concurrency=DEFAULT_CONCURRENCY, *,
+                            deadline=None):
+        """Generate the mp3 of a text of any length, piece by piece.
+
+        The text is split into chunks of at most `max_length` characters
+        (see `split_text`) which are synthesized concurrently. The audio
+        frames of each chunk are yielded in order as soon as they are
+        available, so the beginning of the mp3 can be played before the end
+        is generated. Joined together, the pieces make a single mp3.
+
+        Args:
+            language (str): The language to use for the acapela.
+            voice (str): The voice name to use for the acapela.
+            text (str): the text to translate to speech.
+            max_length (int): The maximum length of a chunk. Defaults to
+                `DEFAULT_MAX_LENGTH`.
+            concurrency (int): How many chunks may be synthesized at once.
+                Defaults to `DEFAULT_CONCURRENCY`.
+            deadline (float): A `time.monotonic()` timestamp by which every
+                chunk must be synthesized. Defaults to no deadline.
+
+        Yields:
+            bytes: The mp3 data of each chunk.
+
+        Raises:
+            DeadlineExceededError: A chunk was not synthesized by
+                `deadline`.
+
+        """
+        chunks = split_text(text, max_length)
+        pieces = imap_async(
+            lambda chunk: self._fetch_mp3(language, voice, chunk, deadline),
+            chunks,
+            concurrency)
+        first = True
+        async for data in pieces:
+            yield audio_frames(data, keep_tag=first)
+            first = False
+
+    async def synthesize_long(self, language, voice, text, destination,
+                              max_length=DEFAULT_MAX_LENGTH,
+                              concurrency=DEFAULT_CONCURRENCY, *,
+                              deadline=None):
+        """Generate the mp3 of a text of any length into `destination`.
+
+        See `iter_long_mp3` for the arguments. Each piece is flushed as soon
+        as it is written, so a player reading from a file object or from
+        the standard output can start before the whole mp3 is generated.
+        """
+        with open_destination(destination) as fileobj:
+            async for data in self.iter_long_mp3(language, voice, text,
+                                                 max_length, concurrency,
+                                                 deadline=deadline):
+                fileobj.write(data)
+                fileobj.flush()
@@ -0,0 +1,421 @@
+"""Content-addressed storage of the generated mp3s.
+
+The urls returned by `get_mp3_url` point at temporary files, so caching the
+urls does not spare a new synthesis once they expired. An `AudioStore` keeps
+the mp3s themselves on disk, so that the clients given one never synthesize
+the same text twice:
+
+    acapela_group = AcapelaGroup(audio_store=AudioStore())
+
+The requests are identified by a hash of their cache key (see `make_key`),
+and the mp3s by a hash of their content, so identical mp3s are stored once.
+An SQLite index maps the former to the latter, which lets several processes
+share the same store. When the mp3s take more than `max_size` bytes, the
+least recently used ones are evicted.
+
+Stored mp3s are read without copying them into the process: `open` maps them
+in memory, and `copy_to` hands them to the kernel with `os.sendfile`.
+"""
+import contextlib
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from .cache import CacheStats
+from .download import open_destination
+
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+def default_audio_path():
+    """Return the default directory of the audio store.
+
+    It is `acapela-group/audio` in `$XDG_CACHE_HOME` (`~/.cache` by
+    default).
+
+    Returns:
+        str: The path.
+
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'acapela-group', 'audio')
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class _PartialMp3:
+    """A temporary file hashing what is written to it."""
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self._fileobj = os.fdopen(fd, 'wb')
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hash.update(data)
+        self.size += len(data)
+        return self._fileobj.write(data)
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        """Write the mp3 through to the disk and close the file."""
+        if not self._fileobj.closed:
+            self._fileobj.flush()
+            os.fsync(self._fileobj.fileno())
+            self._fileobj.close()
+
+    def discard(self):
+        """Close and remove the file, unless it was moved into the store."""
+        self._fileobj.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.path)
+
+
+class AudioStore:
+    """Generated mp3s, stored on disk by content.
+
+    Each thread uses its own connection to the index, which runs in WAL mode
+    like `SQLiteCache`. An mp3 is written to a temporary file first and only
+    indexed once complete, so readers never see a partial mp3. Storing
+    another mp3 for a key removes the former one, unless other keys share
+    it.
+
+    Every method waits for the disk, so the asynchronous client calls them
+    from an executor.
+
+    Args:
+        path (str): The directory of the store. It is created if needed.
+            Defaults to `default_audio_path()`.
+        max_size (int): How many bytes of mp3s may be stored. The mp3 stored
+            last is always kept, even if it is larger. Defaults to
+            `DEFAULT_MAX_SIZE`.
+        busy_timeout (float): How many seconds to wait for a lock held by
+            another connection. Defaults to 5.
+
+    """
+
+    blocking = True
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE,
+                 busy_timeout=5.0):
+        """Open (and create if needed) the store."""
+        if max_size < 1:
+            raise ValueError("max_size must be a positive integer.")
+
+        self.path = path or default_audio_path()
+        self.max_size = max_size
+        self.busy_timeout = busy_timeout
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(os.path.join(self.path, 'objects'), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " digest TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " accessed_at REAL NOT NULL)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS blobs_accessed_at "
+                "ON blobs (accessed_at)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS keys ("
+                " key TEXT PRIMARY KEY,"
+                " digest TEXT NOT NULL REFERENCES blobs (digest))")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS keys_digest ON keys (digest)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                os.path.join(self.path, 'index.db'),
+                timeout=self.busy_timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, **counters):
+        with self._stats_lock:
+            for name, value in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    def __len__(self):
+        """Return the number of stored requests."""
+        cursor = self._connection().execute("SELECT COUNT(*) FROM keys")
+        return cursor.fetchone()[0]
+
+    @property
+    def size(self):
+        """int: Get how many bytes of mp3s are stored."""
+        cursor = self._connection().execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs")
+        return cursor.fetchone()[0]
+
+    def _lookup(self, key):
+        """Return the path and the size of the mp3 of `key`, or None."""
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT blobs.digest, blobs.size FROM keys"
+                " JOIN blobs ON blobs.digest = keys.digest"
+                " WHERE keys.key = ?", (_hash(key.encode('utf-8')),)
+            ).fetchone()
+            if row is not None:
+                connection.execute(
+                    "UPDATE blobs SET accessed_at = ? WHERE digest = ?",
+                    (time.time(), row[0]))
+
+        if row is None:
+            self._count(misses=1)
+            return None
+        self._count(hits=1)
+        return self._blob_path(row[0]), row[1]
+
+    def __contains__(self, key):
+        """Return whether the mp3 of `key` is stored, without touching it."""
+        cursor = self._connection().execute(
+            "SELECT 1 FROM keys WHERE key = ?", (_hash(key.encode('utf-8')),))
+        return cursor.fetchone() is not None
+
+    def open(self, key):
+        """Map the mp3 of `key` in memory.
+
+        Example:
+            with store.open(key) as data:
+                socket.sendall(data)
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+
+        Returns:
+            mmap.mmap: A read-only mapping of the mp3, to be closed by the
+                caller, or None if the mp3 is not stored.
+
+        """
+        found = self._lookup(key)
+        if found is None:
+            return None
+
+        try:
+            with open(found[0], 'rb') as fileobj:
+                return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            return None
+
+    def get(self, key):
+        """Get the mp3 of `key`.
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+
+        Returns:
+            bytes: The mp3, or None if it is not stored.
+
+        """
+        data = self.open(key)
+        if data is None:
+            return None
+        with data:
+            return data[:]
+
+    def copy_to(self, key, destination):
+        """Copy the mp3 of `key` to `destination`.
+
+        When `destination` has a file descriptor (a path, a file or a
+        socket), the mp3 is copied by the kernel with `os.sendfile`.
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+            destination: A path, a binary file object, or '-' for the
+                standard output (see `open_destination`).
+
+        Returns:
+            int: The size of the mp3, in bytes, or None if it is not stored.
+
+        """
+        found = self._lookup(key)
+        if found is None:
+            return None
+
+        path, size = found
+        try:
+            source = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        with source, open_destination(destination) as fileobj:
+            try:
+                out_fd = fileobj.fileno()
+            except (AttributeError, io.UnsupportedOperation):
+                out_fd = None
+
+            if out_fd is not None and hasattr(os, 'sendfile'):
+                fileobj.flush()
+                offset = 0
+                while offset < size:
+                    sent = os.sendfile(out_fd, source.fileno(), offset,
+                                       size - offset)
+                    if not sent:
+                        break
+                    offset += sent
+            else:
+                with mmap.mmap(source.fileno(), 0,
+                               access=mmap.ACCESS_READ) as data:
+                    fileobj.write(data)
+        return size
+
+    @contextlib.contextmanager
+    def writer(self, key):
+        """Open a file object to store the mp3 of `key`.
+
+        Example:
+            with store.writer(key) as fileobj:
+                acapela_group.download_mp3(url, fileobj)
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+
+        Yields:
+            A binary file object. The mp3 is stored only if the block exits
+            without error.
+
+        """
+        fileobj = self.begin()
+        try:
+            yield fileobj
+            self.commit(key, fileobj)
+        finally:
+            fileobj.discard()
+
+    def begin(self):
+        """Open a temporary file for a new mp3, to be given to `commit`.
+
+        `writer` does both, but the two steps let an asynchronous caller run
+        them in an executor while it writes the mp3 from its event loop.
+
+        Returns:
+            A binary file object, with a `discard` method removing it if it
+            is not committed.
+
+        """
+        return _PartialMp3(os.path.join(self.path, 'objects'))
+
+    def commit(self, key, fileobj):
+        """Store the mp3 written to `fileobj` as the mp3 of `key`.
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+            fileobj: The file object returned by `begin`.
+
+        Raises:
+            ValueError: Nothing was written to `fileobj`.
+
+        """
+        fileobj.close()
+        if not fileobj.size:
+            raise ValueError("Empty mp3s cannot be stored.")
+        self._add(key, fileobj.hash.hexdigest(), fileobj.size, fileobj.path)
+
+    def set(self, key, data):
+        """Store `data` as the mp3 of `key`.
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+            data (bytes): The mp3.
+
+        """
+        with self.writer(key) as fileobj:
+            fileobj.write(data)
+
+    def _add(self, key, digest, size, temporary_path):
+        blob_path = self._blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        key_hash = _hash(key.encode('utf-8'))
+        now = time.time()
+        with self._connection() as connection:
+            known = connection.execute(
+                "SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if known is None or not os.path.exists(blob_path):
+                os.replace(temporary_path, blob_path)
+            former = connection.execute(
+                "SELECT digest FROM keys WHERE key = ?",
+                (key_hash,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO blobs (digest, size, accessed_at) "
+                "VALUES (?, ?, ?)", (digest, size, now))
+            connection.execute(
+                "INSERT OR REPLACE INTO keys (key, digest) VALUES (?, ?)",
+                (key_hash, digest))
+            if former is not None and former[0] != digest:
+                self._remove_orphan(connection, former[0])
+            self._evict(connection, keep=digest)
+
+    def _remove_orphan(self, connection, digest):
+        """Remove the mp3 `digest` if no key refers to it anymore."""
+        if connection.execute("SELECT 1 FROM keys WHERE digest = ?",
+                              (digest,)).fetchone() is not None:
+            return
+        connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._blob_path(digest))
+
+    def _evict(self, connection, keep):
+        excess = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0] - \
+            self.max_size
+        if excess <= 0:
+            return
+
+        evicted = []
+        for digest, size in connection.execute(
+                "SELECT digest, size FROM blobs WHERE digest != ?"
+                " ORDER BY accessed_at", (keep,)):
+            evicted.append(digest)
+            excess -= size
+            if excess <= 0:
+                break
+
+        for digest in evicted:
+            connection.execute("DELETE FROM keys WHERE digest = ?", (digest,))
+            connection.execute("DELETE FROM blobs WHERE digest = ?",
+                               (digest,))
+            # Readers which opened it already keep reading it.
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self._blob_path(digest))
+        self._count(evictions=len(evicted))
+
+    def clear(self):
+        """Remove every mp3."""
+        with self._connection() as connection:
+            digests = [row[0] for row in connection.execute(
+                "SELECT digest FROM blobs")]
+            connection.execute("DELETE FROM keys")
+            connection.execute("DELETE FROM blobs")
+            for digest in digests:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self._blob_path(digest))
+
+    def close(self):
+        """Close the connection of the calling thread."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,180 @@
+"""Coordination of the logins, so that an account is never logged in twice.
+
+When a session expires, every request in flight finds it out at the same
+moment. If each of them logged in again, the website would get a burst of
+logins and answer with a lockout of the IP. An `AuthManager` lets a single
+login per account run at a time: the other callers wait for its outcome
+and share it.
+
+After a login refused for a lockout (`TooManyInvalidLoginAttemptsError`) or
+for wrong credentials (`InvalidCredentialsError`), the account cools down:
+the next logins fail at once with the same error, without reaching the
+website, for a delay which doubles after each refusal in a row. Other
+credentials may still be tried after wrong ones, but not after a lockout.
+
+Each client has its own manager by default. A manager may be shared by the
+clients of a same event loop, such as the clients of an
+`AcapelaGroupAsyncPool`, or the threads of an `AcapelaGroup`, which all run
+on its event loop:
+
+    auth = AuthManager(cooldown=60, max_cooldown=3600)
+    async with AcapelaGroupAsync(auth=auth) as acapela_group:
+        ...
+    print(auth.stats)
+"""
+import time
+
+from .exceptions import (InvalidCredentialsError,
+                         TooManyInvalidLoginAttemptsError)
+from .singleflight import AsyncSingleFlight
+
+
+DEFAULT_COOLDOWN = 60.0
+DEFAULT_MAX_COOLDOWN = 3600.0
+
+# These errors are made worse by trying again right away.
+_REFUSED_ERRORS = (TooManyInvalidLoginAttemptsError, InvalidCredentialsError)
+
+
+class AuthStats:
+    """Counters of an `AuthManager`.
+
+    Attributes:
+        calls (int): How many logins were asked for.
+        logins (int): How many logins were sent to the website. The other
+            calls shared a login in flight, or were refused.
+        failures (int): How many logins failed.
+        refused (int): How many calls failed at once, during a cooldown.
+
+    """
+
+    __slots__ = ('calls', 'logins', 'failures', 'refused')
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.calls = 0
+        self.logins = 0
+        self.failures = 0
+        self.refused = 0
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        """Return a readable representation of the counters."""
+        return '<AuthStats {}>'.format(' '.join(
+            '{}={}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+
+class _Cooldown:
+    def __init__(self):
+        self.refusals = 0
+        self.until = 0.0
+        self.error = None
+        self.args = None
+
+    def refuses(self, args):
+        if isinstance(self.error, InvalidCredentialsError):
+            return args == self.args
+        return True
+
+
+class AuthManager:
+    """Run one login at a time per account, and cool down after refusals.
+
+    Args:
+        cooldown (float): How many seconds an account cools down after a
+            refused login. Defaults to `DEFAULT_COOLDOWN`.
+        max_cooldown (float): The longest cooldown, in seconds, however
+            many logins were refused in a row. Defaults to
+            `DEFAULT_MAX_COOLDOWN`.
+
+    """
+
+    def __init__(self, cooldown=DEFAULT_COOLDOWN,
+                 max_cooldown=DEFAULT_MAX_COOLDOWN):
+        """Create a manager with no login in flight."""
+        if cooldown < 0:
+            raise ValueError("cooldown must not be negative.")
+        if max_cooldown < cooldown:
+            raise ValueError("max_cooldown must not be less than cooldown.")
+
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.stats = AuthStats()
+        self._flights = AsyncSingleFlight()
+        self._cooldowns = {}
+
+    def cooling_down(self, account):
+        """Return how many seconds `account` still cools down, if any.
+
+        Args:
+            account: A hashable identifying the account, e.g. the base url
+                and the username.
+
+        Returns:
+            float: The remaining cooldown, or 0.
+
+        """
+        cooldown = self._cooldowns.get(account)
+        if cooldown is None:
+            return 0.0
+        return max(0.0, cooldown.until - time.monotonic())
+
+    def _refusing(self, account, args):
+        remaining = self.cooling_down(account)
+        if remaining and self._cooldowns[account].refuses(args):
+            return remaining
+        return 0.0
+
+    async def login(self, account, function, *args):
+        """Await `function(*args)` to log `account` in, once at a time.
+
+        If a login of `account` is in flight, its outcome is awaited
+        instead.
+
+        Args:
+            account: A hashable identifying the account.
+            function: The coroutine function logging in.
+            *args: The arguments of `function`, i.e. the credentials.
+
+        Raises:
+            TooManyInvalidLoginAttemptsError: The account cools down after
+                a lockout.
+            InvalidCredentialsError: The account cools down after these
+                credentials were refused.
+
+        """
+        self.stats.calls += 1
+        remaining = self._refusing(account, args)
+        if remaining:
+            self.stats.refused += 1
+            error = self._cooldowns[account].error
+            raise type(error)(
+                "{} Not trying again for {:.0f}s.".format(
+                    error, remaining)) from error
+        return await self._flights.do(account, self._login, account,
+                                      function, *args)
+
+    async def _login(self, account, function, *args):
+        self.stats.logins += 1
+        try:
+            result = await function(*args)
+        except _REFUSED_ERRORS as exn:
+            self.stats.failures += 1
+            cooldown = self._cooldowns.setdefault(account, _Cooldown())
+            delay = min(self.max_cooldown,
+                        self.cooldown * 2 ** cooldown.refusals)
+            cooldown.refusals += 1
+            cooldown.until = time.monotonic() + delay
+            cooldown.error = exn
+            cooldown.args = args
+            raise
+        except Exception:
+            self.stats.failures += 1
+            raise
+
+        self._cooldowns.pop(account, None)
+        return result
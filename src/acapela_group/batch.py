@@ -0,0 +1,289 @@
+"""Helpers to run many text-to-speech requests at once.
+
+The clients expose batch methods built upon the functions of this module.
+Requests are consumed lazily and only a bounded number of them is in flight
+at any time, so a batch can be arbitrarily long.
+"""
+import asyncio
+import collections
+import concurrent.futures
+
+
+DEFAULT_CONCURRENCY = 10
+
+
+class BatchRequest(collections.namedtuple('BatchRequest',
+                                          'language voice text')):
+    """A text-to-speech request of a batch.
+
+    Attributes:
+        language (str): The language to use for the acapela.
+        voice (str): The voice name to use for the acapela.
+        text (str): The text to translate to speech.
+
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def coerce(cls, item):
+        """Build a request from a (language, voice, text) sequence.
+
+        Args:
+            item: A `BatchRequest` or a (language, voice, text) sequence.
+
+        Returns:
+            BatchRequest: The request.
+
+        """
+        if isinstance(item, cls):
+            return item
+        return cls(*item)
+
+
+class BatchResult(collections.namedtuple('BatchResult',
+                                         'request url error')):
+    """The outcome of a `BatchRequest`.
+
+    Attributes:
+        request (BatchRequest): The request.
+        url (str): The mp3 url, or None if the request failed.
+        error (AcapelaGroupError): The error raised by the request, or None
+            if it succeeded.
+
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """bool: Whether the request succeeded."""
+        return self.error is None
+
+
+async def _aiter(iterable):
+    if hasattr(iterable, '__aiter__'):
+        async for item in iterable:
+            yield item
+    else:
+        for item in iterable:
+            yield item
+
+
+async def imap_async(function, items, concurrency, ordered=True):
+    """Run the coroutine `function` for each item of `items`.
+
+    At most `concurrency` items are in flight at any time, and `items` is
+    only consumed when there is room for a new one. The first exception
+    raised by `function` is propagated and cancels the remaining items.
+
+    Args:
+        function: A coroutine function taking an item.
+        items: An iterable or an asynchronous iterable.
+        concurrency (int): How many items may be in flight at once.
+        ordered (bool): Whether to yield the results in the input order.
+            Otherwise, they are yielded as soon as they are ready.
+
+    Yields:
+        The result of `function` for each item.
+
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be a positive integer.")
+
+    iterator = _aiter(items)
+    pending = collections.deque() if ordered else set()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+
+                task = asyncio.ensure_future(function(item))
+                if ordered:
+                    pending.append(task)
+                else:
+                    pending.add(task)
+
+            if not pending:
+                return
+
+            if ordered:
+                yield await pending.popleft()
+            else:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.remove(task)
+                    yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def imap_threaded(executor, function, items, concurrency, ordered=True):
+    """Run `function` for each item of `items` in `executor`.
+
+    This is the thread-based counterpart of `imap_async`: at most
+    `concurrency` items are submitted to `executor` at any time, and `items`
+    is only consumed when there is room for a new one.
+
+    Args:
+        executor (concurrent.futures.Executor): The executor to run the
+            items in.
+        function: A function taking an item.
+        items: An iterable.
+        concurrency (int): How many items may be in flight at once.
+        ordered (bool): Whether to yield the results in the input order.
+            Otherwise, they are yielded as soon as they are ready.
+
+    Yields:
+        The result of `function` for each item.
+
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be a positive integer.")
+
+    iterator = iter(items)
+    pending = collections.deque() if ordered else set()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                future = executor.submit(function, item)
+                if ordered:
+                    pending.append(future)
+                else:
+                    pending.add(future)
+
+            if not pending:
+                return
+
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def _coerce_async(requests):
+    async for item in _aiter(requests):
+        yield BatchRequest.coerce(item)
+
+
+def _resolver_async(function, errors):
+    async def resolve(request):
+        try:
+            url = await function(*request)
+        except errors as exn:
+            return BatchResult(request, None, exn)
+        return BatchResult(request, url, None)
+    return resolve
+
+
+def map_async(function, requests, concurrency, ordered=True,
+              errors=(Exception,)):
+    """Run the coroutine `function` for each request of `requests`.
+
+    See `imap_async` for how the requests are scheduled.
+
+    Args:
+        function: A coroutine function taking (language, voice, text).
+        requests: An iterable or an asynchronous iterable of `BatchRequest`
+            or (language, voice, text) sequences.
+        concurrency (int): How many requests may be in flight at once.
+        ordered (bool): Whether to yield the results in the input order.
+            Otherwise, they are yielded as soon as they are ready.
+        errors (tuple): The exception classes to turn into failed results.
+            Other exceptions are propagated.
+
+    Returns:
+        An asynchronous iterator of `BatchResult`.
+
+    """
+    return imap_async(_resolver_async(function, errors),
+                      _coerce_async(requests), concurrency, ordered=ordered)
+
+
+def map_threaded(executor, function, requests, concurrency, ordered=True,
+                 errors=(Exception,)):
+    """Run `function` for each request of `requests` in `executor`.
+
+    See `imap_threaded` for how the requests are scheduled.
+
+    Args:
+        executor (concurrent.futures.Executor): The executor to run the
+            requests in.
+        function: A function taking (language, voice, text).
+        requests: An iterable of `BatchRequest` or (language, voice, text)
+            sequences.
+        concurrency (int): How many requests may be in flight at once.
+        ordered (bool): Whether to yield the results in the input order.
+            Otherwise, they are yielded as soon as they are ready.
+        errors (tuple): The exception classes to turn into failed results.
+            Other exceptions are propagated.
+
+    Returns:
+        An iterator of `BatchResult`.
+
+    """
+    def resolve(request):
+        try:
+            url = function(*request)
+        except errors as exn:
+            return BatchResult(request, None, exn)
+        return BatchResult(request, url, None)
+
+    return imap_threaded(executor, resolve,
+                         (BatchRequest.coerce(item) for item in requests),
+                         concurrency, ordered=ordered)
+
+
+def map_on_loop(loop, function, requests, concurrency, ordered=True,
+                errors=(Exception,)):
+    """Run the coroutine `function` for each request of `requests` on `loop`.
+
+    This is how the synchronous client runs its batches on its engine:
+    `requests` is consumed in the calling thread, which may block reading
+    it without stalling the loop, while the requests in flight run
+    concurrently on the loop. See `imap_threaded` for how they are
+    scheduled.
+
+    Args:
+        loop (LoopThread): The loop to run the requests on (see the `loop`
+            module).
+        function: A coroutine function taking (language, voice, text).
+        requests: An iterable of `BatchRequest` or (language, voice, text)
+            sequences.
+        concurrency (int): How many requests may be in flight at once.
+        ordered (bool): Whether to yield the results in the input order.
+            Otherwise, they are yielded as soon as they are ready.
+        errors (tuple): The exception classes to turn into failed results.
+            Other exceptions are propagated.
+
+    Returns:
+        An iterator of `BatchResult`.
+
+    """
+    # A `LoopThread` submits coroutine functions as an executor does.
+    return imap_threaded(loop, _resolver_async(function, errors),
+                         (BatchRequest.coerce(item) for item in requests),
+                         concurrency, ordered=ordered)
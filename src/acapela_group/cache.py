@@ -0,0 +1,555 @@
+"""Caching layers for resolved mp3 urls.
+
+The Acapela Group website is slow to answer and the same (language, voice,
+text) triples tend to be requested over and over. The classes of this module
+let the clients remember the urls they already resolved.
+
+Every cache exposes the same small interface: `get(key)`, `set(key, value)`
+and `stats`. Keys are built with `make_key` so that equivalent texts (same
+characters once NFC-normalized, same words once whitespace is collapsed)
+share the same entry. The caches of this module also have `get_entry(key)`,
+giving the remaining lifetime of the value, which `set` takes as its `ttl`,
+and a `blocking` attribute telling whether their calls wait for the disk,
+in which case the asynchronous client runs them in an executor.
+
+Note:
+    The mp3 files generated by the website are temporary, so a cached url
+    must not outlive them. This is why every layer has a TTL.
+
+"""
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+DEFAULT_TTL = 3600
+DEFAULT_PRUNE_INTERVAL = 100
+DEFAULT_TOUCH_BATCH = 100
+
+_WHITESPACE_REGEX = re.compile(r'\s+')
+_KEY_SEPARATOR = '\x1f'
+
+
+def normalize_text(text):
+    """Normalize `text` so that equivalent texts compare equal.
+
+    The text is NFC-normalized, then every run of whitespace is collapsed
+    into a single space and the leading/trailing whitespaces are removed.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+
+    """
+    text = unicodedata.normalize('NFC', text)
+    return _WHITESPACE_REGEX.sub(' ', text).strip()
+
+
+def make_key(language_code, voice, text, authenticated=False):
+    """Build a cache key for a text-to-speech request.
+
+    Args:
+        language_code (str): The resolved language code (see `LANGUAGES`).
+        voice (str): The voice name.
+        text (str): The text to translate to speech. It is normalized with
+            `normalize_text`.
+        authenticated (bool): Whether the request is made by an
+            authenticated session. Authenticated sessions get sounds with no
+            background music, so they must not share entries with anonymous
+            ones.
+
+    Returns:
+        str: The cache key.
+
+    """
+    return _KEY_SEPARATOR.join((
+        'auth' if authenticated else 'anon',
+        language_code,
+        voice.strip(),
+        normalize_text(text),
+    ))
+
+
+class CacheStats:
+    """Counters shared by every cache layer."""
+
+    __slots__ = ('hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def as_dict(self):
+        """Return the counters as a dictionary.
+
+        Returns:
+            dict: A mapping of counter names to their values.
+
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        """Return a readable representation of the counters."""
+        return '<CacheStats {}>'.format(' '.join(
+            '{}={}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+
+class MemoryCache:
+    """In-process LRU cache with a TTL.
+
+    The cache is thread-safe and holds at most `max_entries` entries. When
+    it is full, the least recently used entry is evicted.
+
+    Args:
+        max_entries (int): The maximum number of entries. Defaults to 1024.
+        ttl (float): How many seconds an entry stays valid. Defaults to
+            `DEFAULT_TTL`.
+
+    """
+
+    blocking = False
+
+    def __init__(self, max_entries=1024, ttl=DEFAULT_TTL):
+        """Create an empty in-memory cache."""
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        return len(self._entries)
+
+    def get(self, key):
+        """Get the value associated to `key`.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            str: The cached value, or None if absent or expired.
+
+        """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """Get the value associated to `key`, and how long it stays valid.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            tuple: The cached value and its remaining lifetime in seconds,
+                or None if absent or expired.
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            try:
+                value, expires_at = self._entries[key]
+            except KeyError:
+                self.stats.misses += 1
+                return None
+
+            if expires_at <= now:
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value, expires_at - now
+
+    def set(self, key, value, ttl=None):
+        """Associate `value` to `key`, evicting old entries if needed.
+
+        Args:
+            key (str): The key.
+            value (str): The value to cache.
+            ttl (float): How many seconds the entry stays valid. Defaults
+                to the `ttl` of the cache.
+
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """On-disk cache backed by a SQLite database.
+
+    The database runs in WAL mode, so several processes can share the same
+    file: readers do not block writers and concurrent writers wait for each
+    other for up to `busy_timeout` seconds. Each thread uses its own
+    connection.
+
+    The size of the cache is checked every `prune_interval` writes, rather
+    than on each of them: when it holds more than `max_entries` entries,
+    the least recently used ones are evicted. Each writer can thus overshoot
+    `max_entries` by up to `prune_interval` entries.
+
+    Likewise, the access times of the hits are kept in memory and written
+    by batches of `touch_batch`, or with the next write, so that a lookup
+    does not wait for the write lock of the database.
+
+    Args:
+        path (str): Path of the database file. It is created if needed.
+        max_entries (int): The maximum number of entries. Defaults to
+            100000.
+        ttl (float): How many seconds an entry stays valid. Defaults to
+            `DEFAULT_TTL`.
+        busy_timeout (float): How many seconds to wait for a lock held by
+            another connection. Defaults to 5.
+        prune_interval (int): How many writes go between two checks of the
+            size. Defaults to `DEFAULT_PRUNE_INTERVAL`.
+        touch_batch (int): How many access times are written at once.
+            Defaults to `DEFAULT_TOUCH_BATCH`.
+
+    """
+
+    blocking = True
+
+    def __init__(self, path, max_entries=100000, ttl=DEFAULT_TTL,
+                 busy_timeout=5.0, prune_interval=DEFAULT_PRUNE_INTERVAL,
+                 touch_batch=DEFAULT_TOUCH_BATCH):
+        """Open (and create if needed) the cache database."""
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        if prune_interval < 1:
+            raise ValueError("prune_interval must be a positive integer.")
+        if touch_batch < 1:
+            raise ValueError("touch_batch must be a positive integer.")
+
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.busy_timeout = busy_timeout
+        self.prune_interval = prune_interval
+        self.touch_batch = touch_batch
+        self.stats = CacheStats()
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self._touched = {}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS mp3_urls ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS mp3_urls_accessed_at "
+                "ON mp3_urls (accessed_at)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path,
+                                         timeout=self.busy_timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def _count(self, **counters):
+        with self._stats_lock:
+            for name, value in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _write_touches(self, connection):
+        """Write the access times kept in memory."""
+        with self._stats_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            connection.executemany(
+                "UPDATE mp3_urls SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touched.items()])
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        cursor = self._connection().execute("SELECT COUNT(*) FROM mp3_urls")
+        return cursor.fetchone()[0]
+
+    def get(self, key):
+        """Get the value associated to `key`.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            str: The cached value, or None if absent or expired.
+
+        """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """Get the value associated to `key`, and how long it stays valid.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            tuple: The cached value and its remaining lifetime in seconds,
+                or None if absent or expired.
+
+        """
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, expires_at FROM mp3_urls WHERE key = ?",
+            (key,)).fetchone()
+
+        if row is None:
+            self._count(misses=1)
+            return None
+
+        value, expires_at = row
+        if expires_at <= now:
+            with connection:
+                connection.execute("DELETE FROM mp3_urls WHERE key = ?",
+                                   (key,))
+            self._count(misses=1, expirations=1)
+            return None
+
+        with self._stats_lock:
+            self.stats.hits += 1
+            self._touched[key] = now
+            write = len(self._touched) >= self.touch_batch
+        if write:
+            with connection:
+                self._write_touches(connection)
+        return value, expires_at - now
+
+    def set(self, key, value, ttl=None):
+        """Associate `value` to `key`, evicting old entries if needed.
+
+        Args:
+            key (str): The key.
+            value (str): The value to cache.
+            ttl (float): How many seconds the entry stays valid. Defaults
+                to the `ttl` of the cache.
+
+        """
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        with self._stats_lock:
+            self._writes += 1
+            prune = self._writes % self.prune_interval == 0
+        with self._connection() as connection:
+            self._write_touches(connection)
+            connection.execute(
+                "INSERT OR REPLACE INTO mp3_urls "
+                "(key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now))
+            if not prune:
+                return
+
+            excess = connection.execute(
+                "SELECT COUNT(*) FROM mp3_urls").fetchone()[0] - \
+                self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM mp3_urls WHERE key IN ("
+                    " SELECT key FROM mp3_urls"
+                    " ORDER BY accessed_at LIMIT ?)", (excess,))
+                self._count(evictions=excess)
+
+    def purge(self):
+        """Remove every expired entry.
+
+        Returns:
+            int: The number of removed entries.
+
+        """
+        with self._connection() as connection:
+            removed = connection.execute(
+                "DELETE FROM mp3_urls WHERE expires_at <= ?",
+                (time.time(),)).rowcount
+        self._count(expirations=removed)
+        return removed
+
+    def clear(self):
+        """Remove every entry."""
+        with self._connection() as connection:
+            connection.execute("DELETE FROM mp3_urls")
+
+    def close(self):
+        """Close the connection of the calling thread.
+
+        The access times kept in memory are written first.
+        """
+        with self._connection() as connection:
+            self._write_touches(connection)
+        connection.close()
+        self._local.connection = None
+
+
+class TieredCache:
+    """Chain several caches, the fastest first.
+
+    A lookup tries every layer in order. When a layer answers, the value is
+    copied back into the layers in front of it, with the lifetime it has
+    left, so the next lookup is served by the fastest one. Writes go to
+    every layer.
+
+    The asynchronous client looks up the front layers which do not wait for
+    the disk (see `get_front_entry`) from its event loop, and only the
+    other ones (see `get_back_entry`) from an executor.
+
+    Example:
+        cache = TieredCache(MemoryCache(), SQLiteCache('/tmp/acapela.db'))
+
+    Args:
+        *layers: The caches to chain, the fastest first.
+
+    """
+
+    def __init__(self, *layers):
+        """Create a cache made of `layers`."""
+        if not layers:
+            raise ValueError("At least one cache layer is required.")
+
+        self.layers = layers
+        self.stats = CacheStats()
+        self._stats_lock = threading.Lock()
+
+        # The layers in front of the first one waiting for the disk.
+        self._front = len(layers)
+        for index, layer in enumerate(layers):
+            if getattr(layer, 'blocking', False):
+                self._front = index
+                break
+
+    @property
+    def blocking(self):
+        """bool: Whether a layer waits for the disk."""
+        return self._front < len(self.layers)
+
+    def _count(self, **counters):
+        with self._stats_lock:
+            for name, value in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _find(self, key, start, stop):
+        for index in range(start, stop):
+            entry = self.layers[index].get_entry(key)
+            if entry is not None:
+                for upper_layer in self.layers[:index]:
+                    upper_layer.set(key, *entry)
+                self._count(hits=1)
+                return entry
+        return None
+
+    def get(self, key):
+        """Get the value associated to `key` from the first layer having it.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            str: The cached value, or None if no layer has it.
+
+        """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key):
+        """Get the value associated to `key`, and how long it stays valid.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            tuple: The cached value and its remaining lifetime in seconds,
+                or None if no layer has it.
+
+        """
+        entry = self.get_front_entry(key)
+        if entry is None:
+            entry = self.get_back_entry(key)
+        return entry
+
+    def get_front_entry(self, key):
+        """Look `key` up in the layers in front of the blocking ones.
+
+        A miss is only counted by `get_back_entry`, which must be called
+        next.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            tuple: The cached value and its remaining lifetime in seconds,
+                or None if none of these layers has it.
+
+        """
+        return self._find(key, 0, self._front)
+
+    def get_back_entry(self, key):
+        """Look `key` up in the layers from the first blocking one.
+
+        A value found is copied into every layer in front of its own.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            tuple: The cached value and its remaining lifetime in seconds,
+                or None if none of these layers has it.
+
+        """
+        entry = self._find(key, self._front, len(self.layers))
+        if entry is None:
+            self._count(misses=1)
+        return entry
+
+    def set(self, key, value, ttl=None):
+        """Associate `value` to `key` in every layer.
+
+        Args:
+            key (str): The key.
+            value (str): The value to cache.
+            ttl (float): How many seconds the entry stays valid. Defaults
+                to the `ttl` of each layer.
+
+        """
+        for layer in self.layers:
+            layer.set(key, value, ttl)
+
+    def clear(self):
+        """Remove every entry of every layer."""
+        for layer in self.layers:
+            layer.clear()
@@ -0,0 +1,193 @@
+"""Helpers shared by the synchronous and the asynchronous clients.
+
+This module knows the forms of the website but no http library, so that
+each client only imports its own.
+"""
+import asyncio
+import functools
+import time
+from urllib.parse import urlparse
+
+from .exceptions import (AcapelaGroupError, DeadlineExceededError,
+                         InvalidCredentialsError, LanguageNotSupportedError,
+                         NeedsUpdateError, ServerError,
+                         TooManyInvalidLoginAttemptsError)
+from .language import LANGUAGES
+
+
+DEFAULT_BASE_URL = "http://www.acapela-group.com"
+
+# Both libraries decompress the body incrementally while it is streamed.
+ACCEPT_ENCODING = {'Accept-Encoding': 'gzip, deflate'}
+
+TTS_FORM_PATH = (
+    "demo-tts/DemoHTML5Form_V2.php?langdemo=Powered+by+"
+    "<a+href=\"http://www.acapela-vaas.com\">Acapela+Vo"
+    "ice+as+a+Service</a>.+For+demo+and+evaluation+purp"
+    "ose+only,+for+commercial+use+of+generated+sound+fi"
+    "les+please+go+to+<a+href=\"http://www.acapela-box."
+    "com\">www.acapela-box.com</a>")
+
+LOCKED_OUT_TEXT = ("You have been locked out due to "
+                   "too many invalid login attempts.")
+
+
+def get_language_code(language):
+    """Return the code of a language, as the website expects it.
+
+    Raises:
+        LanguageNotSupportedError: The language is not in `LANGUAGES`.
+
+    """
+    try:
+        return LANGUAGES[language.upper()]
+    except KeyError:
+        raise LanguageNotSupportedError(
+            "The language {} is not supported.".format(language))
+
+
+def check_status(status):
+    """Raise `ServerError` for a 5xx status."""
+    if status >= 500:
+        raise ServerError(
+            "The website answered with the {} status.".format(status))
+
+
+def login_form_data(username, password, redirect_to):
+    """Return the fields of the login form."""
+    return {
+        'log': username,
+        'pwd': password,
+        'wp-submit': '',
+        'redirect_to': redirect_to,
+    }
+
+
+def check_login_response(text, headers):
+    """Check the answer to the login form.
+
+    Args:
+        text (str): The body of the answer.
+        headers: The headers of the answer.
+
+    Raises:
+        TooManyInvalidLoginAttemptsError: The IP is locked out.
+        NeedsUpdateError: The answer is not a redirection.
+        InvalidCredentialsError: The credentials were refused.
+
+    Returns:
+        str: The location to follow to complete the login.
+
+    """
+    if text == LOCKED_OUT_TEXT:
+        raise TooManyInvalidLoginAttemptsError(
+            "Looks like you are screwed because of too many login "
+            "attempts. Try with another IP maybe.")
+
+    try:
+        location = headers["Location"]
+    except KeyError as exn:
+        raise NeedsUpdateError(
+            "Could not get Location header from login. "
+            "The module might need an update.") from exn
+
+    parse_result = urlparse(location)
+    if parse_result.path == '/login/' and \
+            parse_result.query == 'the_error=incorrect_password':
+        raise InvalidCredentialsError("Wrong couple of login/password.")
+    return location
+
+
+def tts_form_data(language_code, voice, text):
+    """Return the fields of the text-to-speech form."""
+    # What is that for?!
+    return {
+        '0': 'Leila',
+        '1': 'Laia',
+        '2': 'Eliska',
+        '3': 'Mette',
+        '4': 'Zoe',
+        '5': 'Jasmijn',
+        '6': 'Tyler',
+        '7': 'Deepa',
+        '8': 'Rhona',
+        '9': 'Rachel',
+        '10': 'Sharon',
+        '11': 'Hanna',
+        '12': 'Sanna',
+        '13': 'Manon-be',
+        '14': 'Louise',
+        '16': 'Claudia',
+        '17': 'Dimitris',
+        '18': 'Fabiana',
+        '19': 'Sakura',
+        '20': 'Minji',
+        '21': 'Lulu',
+        '22': 'Bente',
+        '23': 'Ania',
+        '24': 'Marcia',
+        '25': 'Celia',
+        '26': 'Alyona',
+        '27': 'Biera',
+        '28': 'Ines',
+        '29': 'Rodrigo',
+        '30': 'Elin',
+        '31': 'Samuel',
+        '32': 'Kal',
+        '33': 'Mia',
+        '34': 'Ipek',
+
+        # Here this is clearer:
+        'MyLanguages': language_code,
+        'MySelectedVoice': voice,
+        'MyTextForTTS': text,
+        'agreeterms': 'on',
+        't': '1',  # Don't know about that one.
+        'SendToVaaS': '',
+    }
+
+
+def counting_errors_async(method):
+    """Count the errors raised by `method` in the metrics of the client."""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            return await method(self, *args, **kwargs)
+        except AcapelaGroupError as exn:
+            if self._metrics is not None:
+                self._metrics.increment('errors_total',
+                                        error=type(exn).__name__,
+                                        client=self._metrics_label)
+            raise
+    return wrapper
+
+
+def with_deadline(method):
+    """Bound `method` by its `deadline` keyword argument.
+
+    The deadline is a `time.monotonic()` timestamp, or None for no deadline.
+    It is the same for every step of the call, so each step only gets what
+    is left of it. The call is cancelled when the deadline passes.
+
+    Raises:
+        DeadlineExceededError: The call was not over by the deadline.
+
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        deadline = kwargs.get('deadline')
+        if deadline is None:
+            return await method(self, *args, **kwargs)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError("The deadline has already passed.")
+        try:
+            return await asyncio.wait_for(method(self, *args, **kwargs),
+                                          remaining)
+        except asyncio.TimeoutError:
+            if time.monotonic() < deadline:
+                raise  # The timeout of a request, see `Policy.timeout`.
+            raise DeadlineExceededError(
+                "The call was not over within {:.3f}s.".format(remaining))
+    return wrapper
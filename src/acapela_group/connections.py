@@ -0,0 +1,66 @@
+"""Connection pooling settings of the clients.
+
+Each request to the website costs a round-trip for the TCP handshake when
+no idle connection is at hand, and another one for the DNS lookup when the
+address is not cached. A `ConnectionConfig` given to a client sizes its
+pool of connections, keeps them alive between requests and can open some
+of them in advance:
+
+    connections = ConnectionConfig(limit_per_host=20, prewarm=4)
+    async with AcapelaGroupAsync(connections=connections) as acapela_group:
+        ...  # The first four requests do not wait for a handshake.
+
+Both clients apply every setting to the `aiohttp.TCPConnector` of their
+session: the synchronous client runs the asynchronous one.
+"""
+
+DEFAULT_LIMIT = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 30.0
+DEFAULT_DNS_CACHE_TTL = 300
+
+
+class ConnectionConfig:
+    """Connection pooling settings.
+
+    Args:
+        limit (int): How many connections may be open at once, for every
+            host. Defaults to `DEFAULT_LIMIT`.
+        limit_per_host (int): How many connections may be open at once to
+            a same host. Defaults to no other limit than `limit`.
+        keepalive_timeout (float): How many seconds an idle connection is
+            kept open. Defaults to `DEFAULT_KEEPALIVE_TIMEOUT`.
+        dns_cache_ttl (float): How many seconds a resolved address is
+            cached, or None to resolve the host for each connection.
+            Defaults to `DEFAULT_DNS_CACHE_TTL`.
+        prewarm (int): How many connections to open when the client is
+            entered (see the `warm_up` method of the clients). Defaults to
+            0.
+
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, limit_per_host=None,
+                 keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT,
+                 dns_cache_ttl=DEFAULT_DNS_CACHE_TTL, prewarm=0):
+        """Create connection pooling settings."""
+        if limit < 1:
+            raise ValueError("limit must be a positive integer.")
+        if limit_per_host is not None and limit_per_host < 1:
+            raise ValueError("limit_per_host must be a positive integer.")
+        if prewarm < 0:
+            raise ValueError("prewarm must not be negative.")
+
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.prewarm = prewarm
+
+    def aiohttp_connector(self):
+        """Return a new `aiohttp.TCPConnector` with these settings."""
+        import aiohttp
+
+        return aiohttp.TCPConnector(
+            limit=self.limit, limit_per_host=self.limit_per_host or 0,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=self.dns_cache_ttl is not None,
+            ttl_dns_cache=self.dns_cache_ttl)
@@ -0,0 +1,53 @@
+"""Helpers to write downloaded mp3 files.
+
+A download destination is either a path, a binary file object, or '-' for
+the standard output. Files written to a path are written atomically: the
+data goes to a temporary file of the same directory, which is renamed once
+the download is complete, so a reader never sees a partial mp3.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+@contextlib.contextmanager
+def open_destination(destination):
+    """Open `destination` for writing binary data.
+
+    Args:
+        destination: A path, a file object, or '-' for the standard output.
+            Text file objects wrapping a binary buffer (like `sys.stdout`)
+            are written through their buffer.
+
+    Yields:
+        A binary file object. If `destination` is a path, the data is moved
+        to it only if the block exits without error.
+
+    """
+    if destination == '-':
+        destination = sys.stdout
+
+    if hasattr(destination, 'write'):
+        fileobj = getattr(destination, 'buffer', destination)
+        yield fileobj
+        fileobj.flush()
+        return
+
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix='.{}.'.format(os.path.basename(destination)),
+        suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as fileobj:
+            yield fileobj
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.replace(temporary_path, destination)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(temporary_path)
+        raise
@@ -0,0 +1,263 @@
+"""Load balancing over several endpoints of the website.
+
+The website is served by several hosts. An `EndpointSet` given to a client
+spreads the requests over them: each request picks two endpoints at random
+and goes to the one with the lowest observed latency, weighted by its
+requests in flight (the "power of two choices"). The latency of an endpoint
+fades while it gets no requests, so that a slow endpoint is tried again
+once in a while:
+
+    endpoints = EndpointSet(['http://www.acapela-group.com',
+                             'http://h-ir-ssd-1.acapela-group.com'])
+    async with AcapelaGroupAsync(endpoints=endpoints) as acapela_group:
+        ...
+    print(endpoints.stats)
+
+An endpoint failing `max_failures` requests in a row with a transient error
+(see `acapela_group.policy`) is ejected: it gets no more requests while the
+client probes it in the background, every `probe_interval` seconds, and it
+is added back as soon as it answers. If every endpoint is ejected, the
+requests are spread over all of them anyway.
+
+The mp3 urls are served by the hosts the website names, so the downloads
+are not balanced.
+"""
+import random
+import time
+
+
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_PROBE_INTERVAL = 5.0
+DEFAULT_DECAY = 0.3
+DEFAULT_HALF_LIFE = 30.0
+
+
+class EndpointStats:
+    """Counters of an endpoint of an `EndpointSet`.
+
+    Attributes:
+        requests (int): How many requests were sent.
+        failures (int): How many requests failed with a transient error.
+        ejections (int): How many times the endpoint was ejected.
+        recoveries (int): How many times the endpoint was added back.
+        latency (float): The moving average of the latency of the
+            successful requests, in seconds.
+        healthy (int): 1 while the endpoint gets requests, 0 while it is
+            ejected.
+
+    """
+
+    __slots__ = ('requests', 'failures', 'ejections', 'recoveries',
+                 'latency', 'healthy')
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.recoveries = 0
+        self.latency = 0.0
+        self.healthy = 1
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        """Return a readable representation of the counters."""
+        return '<EndpointStats {}>'.format(' '.join(
+            '{}={}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+
+class Endpoint:
+    """An endpoint of an `EndpointSet`.
+
+    Attributes:
+        url (str): The base url of the endpoint.
+        stats (EndpointStats): The counters of the endpoint.
+        in_flight (int): How many requests are running.
+
+    """
+
+    def __init__(self, url):
+        """Create a healthy endpoint."""
+        self.url = url
+        self.stats = EndpointStats()
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.last_success = None
+
+    @property
+    def healthy(self):
+        """bool: Whether the endpoint gets requests."""
+        return bool(self.stats.healthy)
+
+    def score(self, half_life):
+        """Return the expected wait of a new request, the lower the better.
+
+        The endpoints with no latency yet tie, and are then told apart by
+        their requests in flight.
+
+        Args:
+            half_life (float): How many seconds without a success halve
+                the latency of the endpoint.
+
+        Returns:
+            tuple: The expected wait, then the requests in flight.
+
+        """
+        latency = self.stats.latency
+        if self.last_success is not None:
+            idle = time.monotonic() - self.last_success
+            latency *= 0.5 ** (idle / half_life)
+        return latency * (self.in_flight + 1), self.in_flight
+
+    def __repr__(self):
+        """Return a readable representation of the endpoint."""
+        return '<Endpoint {} healthy={}>'.format(self.url, self.healthy)
+
+
+class _Tracker:
+    """Record the outcome of a request to an endpoint."""
+
+    def __init__(self, endpoints, endpoint, errors):
+        self._endpoints = endpoints
+        self._endpoint = endpoint
+        self._errors = errors
+
+    def __enter__(self):
+        self._endpoint.in_flight += 1
+        self._endpoint.stats.requests += 1
+        self._started_at = time.monotonic()
+        return self._endpoint
+
+    def __exit__(self, exc_type, exc, tb):
+        self._endpoint.in_flight -= 1
+        if exc_type is None:
+            self._endpoints.succeeded(self._endpoint,
+                                      time.monotonic() - self._started_at)
+        elif issubclass(exc_type, self._errors):
+            self._endpoints.failed(self._endpoint)
+        return False
+
+
+class EndpointSet:
+    """Several endpoints of the website, and their health.
+
+    A set may be shared by the clients of a same event loop.
+
+    Args:
+        urls: The base urls of the endpoints. The first one is the url of
+            the sessions (see `acapela_group.sessions`).
+        max_failures (int): How many requests in a row may fail before the
+            endpoint is ejected. Defaults to `DEFAULT_MAX_FAILURES`.
+        probe_interval (float): How many seconds to wait between the probes
+            of an ejected endpoint. Defaults to `DEFAULT_PROBE_INTERVAL`.
+        decay (float): The weight of the last latency in the moving
+            average, between 0 and 1. Defaults to `DEFAULT_DECAY`.
+        half_life (float): How many seconds without a success halve the
+            latency of an endpoint. Defaults to `DEFAULT_HALF_LIFE`.
+        seed: The seed of the random choices, for reproducible runs.
+
+    """
+
+    def __init__(self, urls, max_failures=DEFAULT_MAX_FAILURES,
+                 probe_interval=DEFAULT_PROBE_INTERVAL, decay=DEFAULT_DECAY,
+                 half_life=DEFAULT_HALF_LIFE, seed=None):
+        """Create a set of healthy endpoints."""
+        urls = [url.rstrip('/') for url in urls]
+        if not urls:
+            raise ValueError("At least one endpoint is needed.")
+        if len(set(urls)) != len(urls):
+            raise ValueError("The endpoints must be distinct.")
+        if max_failures < 1:
+            raise ValueError("max_failures must be a positive integer.")
+        if not 0 < decay <= 1:
+            raise ValueError("decay must be between 0 and 1.")
+        if half_life <= 0:
+            raise ValueError("half_life must be positive.")
+
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.max_failures = max_failures
+        self.probe_interval = probe_interval
+        self.decay = decay
+        self.half_life = half_life
+        self._random = random.Random(seed)
+
+    @property
+    def urls(self):
+        """list: Get the base urls of the endpoints."""
+        return [endpoint.url for endpoint in self.endpoints]
+
+    @property
+    def stats(self):
+        """dict: Get the `EndpointStats` of each endpoint, by url."""
+        return {endpoint.url: endpoint.stats for endpoint in self.endpoints}
+
+    def ejected(self):
+        """Return the endpoints which get no requests."""
+        return [endpoint for endpoint in self.endpoints
+                if not endpoint.healthy]
+
+    def choose(self):
+        """Return the endpoint the next request should go to."""
+        candidates = [endpoint for endpoint in self.endpoints
+                      if endpoint.healthy] or self.endpoints
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = self._random.sample(candidates, 2)
+        if first.score(self.half_life) <= second.score(self.half_life):
+            return first
+        return second
+
+    def track(self, endpoint, errors):
+        """Return a context manager recording the outcome of a request.
+
+        Args:
+            endpoint (Endpoint): The endpoint the request goes to.
+            errors: The exception classes which count as failures of the
+                endpoint.
+
+        """
+        return _Tracker(self, endpoint, errors)
+
+    def succeeded(self, endpoint, latency):
+        """Record a successful request, adding the endpoint back if needed.
+
+        Args:
+            endpoint (Endpoint): The endpoint of the request.
+            latency (float): How long the request took, in seconds.
+
+        """
+        stats = endpoint.stats
+        if stats.latency:
+            stats.latency += self.decay * (latency - stats.latency)
+        else:
+            stats.latency = latency
+        endpoint.last_success = time.monotonic()
+        endpoint.consecutive_failures = 0
+        self.recovered(endpoint)
+
+    def failed(self, endpoint):
+        """Record a failed request, ejecting the endpoint if needed.
+
+        Returns:
+            bool: Whether the endpoint was ejected.
+
+        """
+        endpoint.stats.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and \
+                endpoint.consecutive_failures >= self.max_failures:
+            endpoint.stats.healthy = 0
+            endpoint.stats.ejections += 1
+            return True
+        return False
+
+    def recovered(self, endpoint):
+        """Add back an ejected endpoint which answered again."""
+        endpoint.consecutive_failures = 0
+        if not endpoint.healthy:
+            endpoint.stats.healthy = 1
+            endpoint.stats.recoveries += 1
@@ -0,0 +1,75 @@
+"""Exceptions raised by the clients.
+
+They are also available from `acapela_group.base`.
+"""
+
+
+class AcapelaGroupError(Exception):
+    """Base exception class for Acapela Group related errors."""
+
+
+class TooManyInvalidLoginAttemptsError(AcapelaGroupError):
+    """Exception class thrown when locked out for too many login attempts."""
+
+
+class InvalidCredentialsError(AcapelaGroupError):
+    """Exception class for invalid credentials error."""
+
+
+class NeedsUpdateError(AcapelaGroupError):
+    """Exception class thrown when the code cannot scrap the website.
+
+    Basically, it means that the module needs some update to keep interfacing
+    with the Acapela Group website.
+    """
+
+
+class LanguageNotSupportedError(AcapelaGroupError):
+    """Exception class thrown when the language is not supported.
+
+    For a complete list of supported languages, see language.py.
+    """
+
+
+class DownloadError(AcapelaGroupError):
+    """Exception class thrown when a generated mp3 cannot be downloaded."""
+
+
+class NoAccountAvailableError(AcapelaGroupError):
+    """Exception class thrown when every account of a pool is unavailable."""
+
+
+class ServerError(AcapelaGroupError):
+    """Exception class thrown when the website answers with a 5xx status."""
+
+
+class NetworkError(AcapelaGroupError):
+    """Exception class thrown when the website cannot be reached in time.
+
+    The original network error or timeout is its `__cause__`.
+    """
+
+
+class CircuitOpenError(AcapelaGroupError):
+    """Exception class thrown when requests are refused to spare the website.
+
+    See `acapela_group.policy.CircuitBreaker`.
+    """
+
+
+class OverloadedError(AcapelaGroupError):
+    """Exception class thrown when the service sheds load.
+
+    See `acapela_group.server.Server`.
+    """
+
+
+class VoiceNotSupportedError(AcapelaGroupError):
+    """Exception class thrown when the voice does not speak the language.
+
+    See `acapela_group.voices.VoiceCatalog`.
+    """
+
+
+class DeadlineExceededError(AcapelaGroupError):
+    """Exception class thrown when a call is not over by its deadline."""
@@ -0,0 +1,183 @@
+"""Hedged requests, to cut the tail latency of the text-to-speech form.
+
+Most requests to the website are answered quickly, but a few take many
+seconds, and those set the tail latency. A `HedgingPolicy` given to a
+client sends a duplicate of a request which is still unanswered after a
+percentile of the recent latencies (the 95th by default). The first
+successful answer wins and the other request is cancelled:
+
+    hedging = HedgingPolicy(percentile=0.95, budget=0.05)
+    async with AcapelaGroupAsync(hedging=hedging) as acapela_group:
+        ...
+    print(hedging.stats)
+
+The first request still holds its connection, so the duplicate goes out on
+another connection of the pool, and chooses its own endpoint when the
+client has several (see `acapela_group.endpoints`). Each request earns
+`budget` tokens and each duplicate costs one, so hedging never adds more
+than that fraction of extra requests, even while the website is slow for
+everyone.
+"""
+import asyncio
+import collections
+import time
+
+
+DEFAULT_PERCENTILE = 0.95
+DEFAULT_BUDGET = 0.05
+DEFAULT_BURST = 10
+DEFAULT_WINDOW = 500
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_INITIAL_DELAY = 1.0
+DEFAULT_MIN_DELAY = 0.01
+
+
+class HedgeStats:
+    """Counters of a `HedgingPolicy`.
+
+    Attributes:
+        requests (int): How many requests were sent, not counting the
+            duplicates.
+        hedged (int): How many duplicates were sent.
+        won (int): How many duplicates answered first.
+        denied (int): How many duplicates were not sent, for lack of
+            budget.
+
+    """
+
+    __slots__ = ('requests', 'hedged', 'won', 'denied')
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.denied = 0
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        """Return a readable representation of the counters."""
+        return '<HedgeStats {}>'.format(' '.join(
+            '{}={}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+
+class HedgingPolicy:
+    """When to send a duplicate of a slow request.
+
+    A policy may be shared by the clients of a same event loop.
+
+    Args:
+        percentile (float): The percentile of the recent latencies after
+            which a duplicate is sent, between 0 and 1. Defaults to
+            `DEFAULT_PERCENTILE`.
+        budget (float): The fraction of extra requests the duplicates may
+            add. Defaults to `DEFAULT_BUDGET`.
+        burst (int): How many duplicates may be sent in a row when the
+            budget was not used for a while. Defaults to `DEFAULT_BURST`.
+        window (int): How many recent latencies the percentile is computed
+            over. Defaults to `DEFAULT_WINDOW`.
+        min_samples (int): How many latencies are needed before the
+            percentile is used. Defaults to `DEFAULT_MIN_SAMPLES`.
+        initial_delay (float): The delay before a duplicate, in seconds,
+            until there are enough latencies. Defaults to
+            `DEFAULT_INITIAL_DELAY`.
+        min_delay (float): The shortest delay before a duplicate, in
+            seconds. Defaults to `DEFAULT_MIN_DELAY`.
+
+    """
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, budget=DEFAULT_BUDGET,
+                 burst=DEFAULT_BURST, window=DEFAULT_WINDOW,
+                 min_samples=DEFAULT_MIN_SAMPLES,
+                 initial_delay=DEFAULT_INITIAL_DELAY,
+                 min_delay=DEFAULT_MIN_DELAY):
+        """Create a hedging policy."""
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1.")
+        if budget < 0:
+            raise ValueError("budget must not be negative.")
+
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.stats = HedgeStats()
+        self._latencies = collections.deque(maxlen=window)
+        self._tokens = 0.0
+
+    def delay(self):
+        """Return how long to wait for an answer before sending a duplicate.
+
+        Returns:
+            float: The delay, in seconds.
+
+        """
+        if len(self._latencies) < self.min_samples:
+            return self.initial_delay
+        latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1,
+                    int(self.percentile * len(latencies)))
+        return max(self.min_delay, latencies[index])
+
+    def _spend(self):
+        """Take a token of the budget, if there is one."""
+        if self._tokens < 1:
+            self.stats.denied += 1
+            return False
+        self._tokens -= 1
+        self.stats.hedged += 1
+        return True
+
+    async def call(self, function, *args):
+        """Await the coroutine function `function`, hedging it if slow.
+
+        Args:
+            function: The coroutine function sending the request.
+            *args: The arguments of `function`.
+
+        Returns:
+            The result of the first successful call. If both calls fail,
+            the error of the first one is raised.
+
+        """
+        self.stats.requests += 1
+        self._tokens = min(self.burst, self._tokens + self.budget)
+
+        started_at = {}
+
+        def start():
+            task = asyncio.ensure_future(function(*args))
+            started_at[task] = time.monotonic()
+            return task
+
+        first = start()
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending,
+                                               timeout=self.delay())
+            if not done and self._spend():
+                pending.add(start())
+
+            while True:
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    self._latencies.append(time.monotonic() -
+                                           started_at[task])
+                    if task is not first:
+                        self.stats.won += 1
+                    return task.result()
+                if not pending:
+                    # Every call failed.
+                    raise first.exception()
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
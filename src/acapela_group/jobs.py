@@ -0,0 +1,340 @@
+"""Resumable bulk synthesis jobs.
+
+Resolving hundreds of thousands of requests takes hours, and a network drop,
+a lockout or a deploy should not mean starting over. A `Job` shards the
+requests over worker processes, each running an `AcapelaGroupAsync`, and
+records every resolved request in an append-only file of its directory.
+Running the job again skips the requests already resolved:
+
+    job = Job('/var/lib/acapela/nightly', workers=4, concurrency=8)
+    stats = job.run(requests)  # Run it again after a crash: it resumes.
+    for record in job.results():
+        print(record['text'], record.get('url') or record['error'])
+
+Each worker writes to its own `results-<worker>.jsonl` file, one JSON
+object per line with the 'index' of the request in the input, its
+'language', 'voice' and 'text', and either its 'url' or its 'error' and
+'error_type'. A line is written as soon as its request is resolved, so a
+crash loses at most the requests in flight. A truncated last line is
+ignored.
+
+On SIGINT or SIGTERM, the workers stop taking new requests, finish the ones
+in flight, record them and exit.
+"""
+import hashlib
+import json
+import os
+import signal
+import threading
+
+from .batch import DEFAULT_CONCURRENCY, BatchRequest, BatchResult, imap_async
+from .exceptions import AcapelaGroupError
+
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+_MANIFEST = 'job.json'
+
+
+class JobStats:
+    """Counters of a run of a `Job`.
+
+    Attributes:
+        total (int): How many requests the job has.
+        skipped (int): How many requests were resolved by a previous run.
+        resolved (int): How many requests were resolved by this run.
+        failed (int): How many requests failed in this run.
+        interrupted (bool): Whether the run was stopped before sending
+            every request, by a signal, by `Job.stop` or by an error.
+        errors (list): The errors which stopped workers, if any.
+
+    """
+
+    def __init__(self, total, skipped):
+        """Create the counters of a run."""
+        self.total = total
+        self.skipped = skipped
+        self.resolved = 0
+        self.failed = 0
+        self.interrupted = False
+        self.errors = []
+
+    @property
+    def remaining(self):
+        """int: How many requests were not sent by this run."""
+        return self.total - self.skipped - self.resolved - self.failed
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {
+            'total': self.total,
+            'skipped': self.skipped,
+            'resolved': self.resolved,
+            'failed': self.failed,
+            'remaining': self.remaining,
+            'interrupted': self.interrupted,
+            'errors': list(self.errors),
+        }
+
+
+def _digest(requests):
+    digest = hashlib.sha256()
+    for request in requests:
+        digest.update(json.dumps(request).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _record(index, result):
+    record = {'index': index}
+    record.update(result.request._asdict())
+    if result.ok:
+        record['url'] = result.url
+    else:
+        record['error'] = str(result.error)
+        record['error_type'] = type(result.error).__name__
+    return record
+
+
+def _end_last_line(path):
+    """End a line cut short by a crash, so the next one stays readable."""
+    try:
+        with open(path, 'rb+') as fileobj:
+            if not fileobj.seek(0, os.SEEK_END):
+                return
+            fileobj.seek(-1, os.SEEK_END)
+            if fileobj.read(1) != b'\n':
+                fileobj.write(b'\n')
+    except FileNotFoundError:
+        pass
+
+
+async def _resolve_shard(client, credentials, shard, concurrency, path,
+                         stop, counters):
+    async def resolve(item):
+        index, request = item
+        try:
+            url = await client.get_mp3_url(*request)
+        except AcapelaGroupError as exn:
+            # E.g. a `NetworkError`: it fails its request only, not the
+            # whole shard.
+            return index, BatchResult(request, None, exn)
+        return index, BatchResult(request, url, None)
+
+    def pending():
+        for item in shard:
+            if stop.is_set():
+                return
+            yield item
+
+    async with client:
+        if credentials is not None:
+            await client.authenticate(*credentials)
+
+        _end_last_line(path)
+        with open(path, 'a', encoding='utf-8') as fileobj:
+            try:
+                async for index, result in imap_async(
+                        resolve, pending(), concurrency, ordered=False):
+                    fileobj.write(json.dumps(_record(index, result),
+                                             ensure_ascii=False) + '\n')
+                    # Flushed at once: a crash only loses the requests in
+                    # flight.
+                    fileobj.flush()
+                    counter = counters[0 if result.ok else 1]
+                    with counter.get_lock():
+                        counter.value += 1
+            finally:
+                os.fsync(fileobj.fileno())
+
+
+def _run_worker(client_factory, credentials, shard, concurrency, path, stop,
+                counters, errors):
+    import asyncio
+
+    # The parent relays SIGINT; SIGTERM sent to a worker stops it cleanly.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_resolve_shard(
+            client_factory(), credentials, shard, concurrency, path, stop,
+            counters))
+    except Exception as exn:
+        # E.g. a refused login: the other workers may still succeed.
+        errors.put('{}: {}'.format(type(exn).__name__, exn))
+    finally:
+        loop.close()
+
+
+class Job:
+    """A bulk synthesis job, resumable from its directory.
+
+    The workers are forked, so their client factory and arguments do not
+    need to be picklable. Each worker builds its own client: a `Policy`
+    given to the factory limits each worker separately.
+
+    Args:
+        directory (str): The directory of the job, created if needed.
+        workers (int): How many worker processes to run. Defaults to
+            `DEFAULT_WORKERS`.
+        concurrency (int): How many requests each worker may have in
+            flight. Defaults to `DEFAULT_CONCURRENCY`.
+        client_factory: A function returning a new `AcapelaGroupAsync`.
+            Defaults to `AcapelaGroupAsync`.
+        credentials (tuple): An optional (username, password) couple the
+            workers authenticate with.
+        retry_failed (bool): Whether the requests which failed in a
+            previous run are sent again. Defaults to True.
+
+    """
+
+    def __init__(self, directory, workers=DEFAULT_WORKERS,
+                 concurrency=DEFAULT_CONCURRENCY, client_factory=None,
+                 credentials=None, retry_failed=True):
+        """Create a job, without running it."""
+        if workers < 1:
+            raise ValueError("workers must be a positive integer.")
+
+        self.directory = directory
+        self.workers = workers
+        self.concurrency = concurrency
+        self.client_factory = client_factory
+        self.credentials = credentials
+        self.retry_failed = retry_failed
+        self._stop = None
+
+    def _result_paths(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.directory, name) for name in names
+                      if name.startswith('results-') and
+                      name.endswith('.jsonl'))
+
+    def results(self):
+        """Read the records of the resolved requests.
+
+        A request which failed then succeeded in a later run has both
+        records.
+
+        Yields:
+            dict: The record of each resolved request, see the module.
+
+        """
+        for path in self._result_paths():
+            with open(path, encoding='utf-8') as fileobj:
+                for line in fileobj:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Cut short by a crash.
+                    if isinstance(record, dict) and 'index' in record:
+                        yield record
+
+    def completed(self):
+        """Return the indices of the requests which need no new run.
+
+        Returns:
+            set: The indices of the requests which were resolved, or which
+                failed if `retry_failed` is False.
+
+        """
+        return {record['index'] for record in self.results()
+                if 'url' in record or not self.retry_failed}
+
+    def _check_manifest(self, requests):
+        path = os.path.join(self.directory, _MANIFEST)
+        manifest = {'total': len(requests), 'digest': _digest(requests)}
+        try:
+            with open(path) as fileobj:
+                previous = json.load(fileobj)
+        except FileNotFoundError:
+            with open(path, 'w') as fileobj:
+                json.dump(manifest, fileobj)
+            return
+
+        if previous != manifest:
+            raise ValueError(
+                "The requests differ from those of the job in {}.".format(
+                    self.directory))
+
+    def stop(self):
+        """Ask the workers to stop once their requests in flight are done."""
+        if self._stop is not None:
+            self._stop.set()
+
+    def run(self, items):
+        """Resolve the requests of `items` which were not resolved yet.
+
+        When called from the main thread, SIGINT and SIGTERM stop the run
+        cleanly (see `stop`) for as long as it lasts.
+
+        Args:
+            items: An iterable of (language, voice, text) sequences. They
+                must be the same, in the same order, each time the job is
+                run.
+
+        Raises:
+            ValueError: The requests differ from those of a previous run.
+
+        Returns:
+            JobStats: The counters of the run.
+
+        """
+        requests = [BatchRequest.coerce(item) for item in items]
+        os.makedirs(self.directory, exist_ok=True)
+        self._check_manifest(requests)
+
+        completed = self.completed()
+        remaining = [(index, request) for index, request in
+                     enumerate(requests) if index not in completed]
+        stats = JobStats(len(requests), len(requests) - len(remaining))
+        if not remaining:
+            return stats
+
+        if self.client_factory is None:
+            from .async_client import AcapelaGroupAsync
+            client_factory = AcapelaGroupAsync
+        else:
+            client_factory = self.client_factory
+
+        import multiprocessing
+
+        context = multiprocessing.get_context('fork')
+        self._stop = stop = context.Event()
+        # The successes and the failures of every worker.
+        counters = (context.Value('l', 0), context.Value('l', 0))
+        errors = context.Queue()
+        workers = [
+            context.Process(target=_run_worker, args=(
+                client_factory, self.credentials,
+                remaining[shard::self.workers], self.concurrency,
+                os.path.join(self.directory,
+                             'results-{}.jsonl'.format(shard)),
+                stop, counters, errors), daemon=True)
+            for shard in range(min(self.workers, len(remaining)))]
+
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                handlers[signum] = signal.signal(
+                    signum, lambda signum, frame: stop.set())
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            self._stop = None
+
+        stats.resolved = counters[0].value
+        stats.failed = counters[1].value
+        while not errors.empty():
+            stats.errors.append(errors.get())
+        stats.interrupted = stats.remaining > 0
+        return stats
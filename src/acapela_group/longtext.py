@@ -0,0 +1,79 @@
+"""Split long texts into chunks the website accepts.
+
+The website synthesizes short texts only, and a long text is slow to
+synthesize in a single request anyway. Long texts are thus split into
+chunks, preferably at sentence boundaries, then at clause boundaries, then
+between words. Each chunk can then be synthesized on its own and the mp3s
+joined with `acapela_group.mp3.concatenate`.
+"""
+import re
+
+from .cache import normalize_text
+
+
+DEFAULT_MAX_LENGTH = 300
+
+# Chinese and Japanese texts have no space after their punctuation. Each
+# regex captures the separator, so that the chunks keep the original one.
+_SENTENCE_REGEX = re.compile(r'((?<=[.!?…])\s+|(?<=[。！？])\s*)')
+_CLAUSE_REGEX = re.compile(r'((?<=[,;:—])\s+|(?<=[、，；：])\s*)')
+_WORD_REGEX = re.compile(r'(\s+)')
+
+
+def _split(text, max_length, regexes, separator=''):
+    """Return the (separator, piece) pairs of `text`.
+
+    The separator of a piece is the text found between it and the previous
+    piece.
+    """
+    if len(text) <= max_length:
+        return [(separator, text)]
+
+    if not regexes:
+        # No boundary left: cut the text wherever needed.
+        return [(separator if not index else '',
+                 text[index:index + max_length])
+                for index in range(0, len(text), max_length)]
+
+    parts = regexes[0].split(text)
+    pieces = []
+    for index in range(0, len(parts), 2):
+        if parts[index]:
+            pieces.extend(_split(parts[index], max_length, regexes[1:],
+                                 parts[index - 1] if index else separator))
+    return pieces
+
+
+def split_text(text, max_length=DEFAULT_MAX_LENGTH):
+    """Split `text` into chunks of at most `max_length` characters.
+
+    The whitespaces of the text are collapsed first (see
+    `normalize_text`). Consecutive sentences are then grouped as long as
+    they fit in a chunk. A sentence too long for a chunk is split at its
+    clauses, and a clause too long for a chunk at its words. The pieces of
+    a chunk are joined with their original separator, so that Chinese or
+    Japanese texts do not get spaces.
+
+    Args:
+        text (str): The text to split.
+        max_length (int): The maximum length of a chunk. Defaults to
+            `DEFAULT_MAX_LENGTH`.
+
+    Returns:
+        list: The chunks, as strings.
+
+    """
+    if max_length < 1:
+        raise ValueError("max_length must be a positive integer.")
+
+    pieces = _split(normalize_text(text), max_length,
+                    (_SENTENCE_REGEX, _CLAUSE_REGEX, _WORD_REGEX))
+
+    chunks = []
+    for separator, piece in pieces:
+        if chunks and \
+                len(chunks[-1]) + len(separator) + len(piece) <= max_length:
+            chunks[-1] += separator + piece
+        else:
+            chunks.append(piece)
+    return [chunk for chunk in chunks if chunk]
@@ -0,0 +1,102 @@
+"""An asyncio event loop running in a background thread.
+
+The synchronous client is a facade over the asynchronous one: it runs an
+`AcapelaGroupAsync` on a `LoopThread` and waits for the results. Since every
+caller thread submits its coroutines to the same loop, their requests
+overlap over a single session and pool of connections:
+
+    loop = LoopThread()
+    future = loop.submit(acapela_group.get_mp3_url, language, voice, text)
+    print(future.result())  # Or `loop.run(...)` to wait right away.
+    loop.close()
+
+`LoopThread.submit` has the signature of `concurrent.futures.Executor.submit`
+for coroutine functions, so a `LoopThread` can be given to `imap_threaded`
+in place of an executor.
+"""
+import asyncio
+import threading
+
+
+class LoopThread:
+    """An event loop running in a daemon thread, started on first use.
+
+    Args:
+        name (str): The name of the thread.
+
+    """
+
+    def __init__(self, name='acapela-group-loop'):
+        """Create the loop thread, without starting it."""
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        """bool: Whether the thread is running."""
+        return self._loop is not None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever,
+                                          name=self.name, daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def submit(self, function, *args, **kwargs):
+        """Run the coroutine function `function` on the loop.
+
+        Returns:
+            concurrent.futures.Future: A future holding the result of
+                `function(*args, **kwargs)`. Cancelling it cancels the
+                coroutine.
+
+        """
+        loop = self._get_loop()
+        return asyncio.run_coroutine_threadsafe(function(*args, **kwargs),
+                                                loop)
+
+    def run(self, function, *args, **kwargs):
+        """Run the coroutine function `function` and wait for its result.
+
+        Raises:
+            RuntimeError: Called from the loop thread itself, which would
+                wait for itself forever.
+
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("The loop thread cannot wait for itself.")
+        return self.submit(function, *args, **kwargs).result()
+
+    def close(self):
+        """Stop the loop and wait for the thread to exit.
+
+        The tasks still pending, e.g. the probes of the endpoints, are
+        cancelled and awaited first. The loop is started again by the next
+        `submit`.
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(_shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+async def _shutdown():
+    """Cancel the other tasks of the running loop and wait for them."""
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.get_running_loop().shutdown_asyncgens()
@@ -0,0 +1,386 @@
+"""Instrumentation of the clients.
+
+Give a `Metrics` object to a client (or to a pool, which hands it to its
+clients) to measure where the time goes:
+
+    metrics = Metrics()
+    acapela_group = AcapelaGroup(metrics=metrics)
+    ...
+    print(metrics.prometheus_text())
+
+The clients then report:
+
+* the duration of each phase of their requests, in the
+  `acapela_group_phase_seconds` histogram: 'dns', 'connect', 'request'
+  (until the response headers are received), 'transfer' (reading the
+  body), 'parse' (looking for the mp3 url in it) and 'login'; mp3
+  downloads only report their 'transfer',
+* the errors raised to the callers, in `acapela_group_errors_total`, by
+  exception class,
+* the bytes received, in `acapela_group_received_bytes_total`,
+* the cache, coalescing and pool counters, as gauges read at export time.
+  The gauges of several clients with the same labels, e.g. the clients of
+  a pool, are summed, and a stats object shared by several clients is only
+  counted once.
+
+Every measurement is also passed to the callbacks added with
+`Metrics.add_callback`, e.g. an `OpenTelemetryExporter`. A client without
+metrics does not measure anything.
+"""
+import collections
+import contextlib
+import threading
+import time
+
+
+PREFIX = 'acapela_group_'
+
+# The upper bounds of the histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+Measurement = collections.namedtuple('Measurement',
+                                     'kind name value labels')
+Measurement.__doc__ = """A measurement passed to the callbacks.
+
+Attributes:
+    kind (str): 'counter' (`value` is an increment) or 'histogram'
+        (`value` is an observation).
+    name (str): The name of the metric, without `PREFIX`.
+    value (float): The value.
+    labels (dict): The labels of the measurement.
+
+"""
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """Aggregate the measurements of clients, and export them.
+
+    A `Metrics` object can be shared by several clients. It is thread-safe.
+
+    Args:
+        buckets (tuple): The upper bounds of the histogram buckets.
+            Defaults to `DEFAULT_BUCKETS`.
+
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Create an empty registry."""
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Call `callback` with each `Measurement`.
+
+        Callbacks are called synchronously, from the thread or the event
+        loop of the client, so they should be quick.
+        """
+        self._callbacks.append(callback)
+
+    def add_collector(self, collector):
+        """Add a source of gauges, read at export time.
+
+        A collector equal to one already added is ignored.
+
+        Args:
+            collector: A function returning an iterable of (name, value,
+                labels) tuples.
+
+        """
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def increment(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        for callback in self._callbacks:
+            callback(Measurement('counter', name, value, labels))
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a histogram."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram.counts[index] += 1
+            histogram.sum += value
+            histogram.count += 1
+        for callback in self._callbacks:
+            callback(Measurement('histogram', name, value, labels))
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of a block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Return the current values of the metrics.
+
+        Returns:
+            dict: With 'counters', 'histograms' and 'gauges' keys, each a
+                list of dictionaries with 'name', 'labels' and the values.
+
+        """
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._counters.items())]
+            histograms = [
+                {'name': name, 'labels': dict(labels), 'sum': histogram.sum,
+                 'count': histogram.count,
+                 'buckets': list(zip(self.buckets, histogram.counts))}
+                for (name, labels), histogram in
+                sorted(self._histograms.items(), key=lambda item: item[0])]
+            collectors = list(self._collectors)
+        # A series is only exported once, with the sum of its values.
+        values = {}
+        for collector in collectors:
+            for name, value, labels in collector():
+                key = (name, _labels_key(labels))
+                values[key] = values.get(key, 0) + value
+        gauges = [{'name': name, 'labels': dict(labels), 'value': value}
+                  for (name, labels), value in sorted(values.items())]
+        return {'counters': counters, 'histograms': histograms,
+                'gauges': gauges}
+
+    def prometheus_text(self):
+        """Return the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, to be served on a /metrics endpoint.
+
+        """
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for counter in snapshot['counters']:
+            name = PREFIX + counter['name']
+            declare(name, 'counter')
+            lines.append('{}{} {}'.format(
+                name, _format_labels(counter['labels']), counter['value']))
+
+        for histogram in snapshot['histograms']:
+            name = PREFIX + histogram['name']
+            declare(name, 'histogram')
+            labels = histogram['labels']
+            for bound, count in histogram['buckets']:
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(dict(labels, le=repr(bound))),
+                    count))
+            lines.append('{}_bucket{} {}'.format(
+                name, _format_labels(dict(labels, le='+Inf')),
+                histogram['count']))
+            lines.append('{}_sum{} {}'.format(
+                name, _format_labels(labels), histogram['sum']))
+            lines.append('{}_count{} {}'.format(
+                name, _format_labels(labels), histogram['count']))
+
+        for gauge in snapshot['gauges']:
+            name = PREFIX + gauge['name']
+            declare(name, 'gauge')
+            lines.append('{}{} {}'.format(
+                name, _format_labels(gauge['labels']), gauge['value']))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in sorted(labels.items())) + '}'
+
+
+class OpenTelemetryExporter:
+    """Forward the measurements to an OpenTelemetry meter.
+
+    Example:
+        from opentelemetry import metrics as otel_metrics
+
+        metrics = Metrics()
+        metrics.add_callback(OpenTelemetryExporter(
+            otel_metrics.get_meter('acapela_group')))
+
+    Args:
+        meter: An OpenTelemetry `Meter` (or anything with the same
+            `create_counter` and `create_histogram` methods).
+
+    """
+
+    def __init__(self, meter):
+        """Create an exporter; instruments are created on first use."""
+        self._meter = meter
+        self._instruments = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, kind, name):
+        with self._lock:
+            instrument = self._instruments.get(name)
+            if instrument is None:
+                create = self._meter.create_counter if kind == 'counter' \
+                    else self._meter.create_histogram
+                instrument = self._instruments[name] = create(PREFIX + name)
+            return instrument
+
+    def __call__(self, measurement):
+        """Record `measurement` with the matching instrument."""
+        instrument = self._instrument(measurement.kind, measurement.name)
+        if measurement.kind == 'counter':
+            instrument.add(measurement.value, attributes=measurement.labels)
+        else:
+            instrument.record(measurement.value,
+                              attributes=measurement.labels)
+
+
+class _StatsCollector:
+    """Read the counters of a stats object.
+
+    Two collectors of the same stats object, with the same name and labels,
+    are equal, so that `Metrics.add_collector` only adds it once.
+    """
+
+    def __init__(self, name, stats, labels):
+        self._name = name
+        self._stats = stats
+        self._labels = labels
+
+    def _key(self):
+        return self._name, id(self._stats), _labels_key(self._labels)
+
+    def __eq__(self, other):
+        if not isinstance(other, _StatsCollector):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __call__(self):
+        return [('{}_{}'.format(self._name, counter), value, self._labels)
+                for counter, value in self._stats.as_dict().items()]
+
+
+def stats_collector(name, stats, **labels):
+    """Return a collector reading the counters of a stats object.
+
+    Args:
+        name (str): The prefix of the gauges, e.g. 'cache'.
+        stats: An object with an `as_dict` method, e.g. `CacheStats` or
+            `FlightStats`.
+        **labels: The labels of the gauges.
+
+    """
+    return _StatsCollector(name, stats, labels)
+
+
+class ChunkMeter:
+    """Measure the transfer and the parsing of a body read by chunks.
+
+    The time spent waiting for the chunks is the transfer, the rest of the
+    time between `start` and `finish` is the parsing.
+    """
+
+    def __init__(self, metrics, client):
+        """Create a meter reporting to `metrics`."""
+        self._metrics = metrics
+        self._client = client
+        self.size = 0
+        self._waiting = 0.0
+        self._started_at = time.perf_counter()
+
+    async def iterate_async(self, chunks):
+        """Wrap an asynchronous iterable of chunks."""
+        chunks = chunks.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                self._waiting += time.perf_counter() - start
+            self.size += len(chunk)
+            yield chunk
+
+    def finish(self, kind):
+        """Report the measures of the body."""
+        elapsed = time.perf_counter() - self._started_at
+        self._metrics.observe('phase_seconds', self._waiting,
+                              phase='transfer', client=self._client)
+        if kind == 'page':
+            self._metrics.observe('phase_seconds',
+                                  max(0.0, elapsed - self._waiting),
+                                  phase='parse', client=self._client)
+        self._metrics.increment('received_bytes_total', self.size,
+                                kind=kind, client=self._client)
+
+
+def aiohttp_trace_config(metrics, client='async'):
+    """Return an `aiohttp.TraceConfig` timing the dns, connect and request.
+
+    Args:
+        metrics (Metrics): Where to report the timings.
+        client (str): The 'client' label of the timings. Defaults to
+            'async'.
+
+    """
+    import aiohttp
+
+    def on_start(name):
+        async def handler(session, context, params):
+            setattr(context, name, time.perf_counter())
+        return handler
+
+    def on_end(name, phase):
+        async def handler(session, context, params):
+            start = getattr(context, name, None)
+            if start is not None:
+                metrics.observe('phase_seconds', time.perf_counter() - start,
+                                phase=phase, client=client)
+        return handler
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_start('dns_start'))
+    trace_config.on_dns_resolvehost_end.append(on_end('dns_start', 'dns'))
+    trace_config.on_connection_create_start.append(
+        on_start('connect_start'))
+    trace_config.on_connection_create_end.append(
+        on_end('connect_start', 'connect'))
+    trace_config.on_request_start.append(on_start('request_start'))
+    trace_config.on_request_end.append(on_end('request_start', 'request'))
+    return trace_config
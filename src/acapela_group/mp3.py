@@ -0,0 +1,171 @@
+"""Frame-level mp3 manipulation.
+
+Generated mp3s can be joined without re-encoding by concatenating their
+MPEG audio frames. This module extracts those frames, leaving out what would
+confuse a player in the middle of a stream:
+
+* the ID3v2 tag at the beginning of a file and the ID3v1 tag at its end,
+* the Xing/Info/VBRI header frame, which describes the length of a single
+  file and would give a wrong duration to the joined one.
+"""
+
+
+_BITRATES = {
+    # (MPEG version 1, layer): kbps by bitrate index.
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384,
+                416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320,
+                384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256,
+                320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192,
+                 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144,
+                 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144,
+                 160),
+}
+
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),   # MPEG 2.5
+}
+
+_ID3V1_SIZE = 128
+
+
+def _id3v2_size(data):
+    """Return the size of the ID3v2 tag at the beginning of `data`."""
+    if len(data) < 10 or data[:3] != b'ID3':
+        return 0
+
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7f)  # Synchsafe integer.
+
+    footer_size = 10 if data[5] & 0x10 else 0
+    return min(10 + size + footer_size, len(data))
+
+
+def _frame_length(data, offset):
+    """Return the length of the frame starting at `offset`, or 0."""
+    if offset + 4 > len(data):
+        return 0
+
+    byte1, byte2, byte3 = data[offset], data[offset + 1], data[offset + 2]
+    if byte1 != 0xff or byte2 & 0xe0 != 0xe0:
+        return 0
+
+    version = (byte2 >> 3) & 3
+    layer = 4 - ((byte2 >> 1) & 3)
+    bitrate_index = byte3 >> 4
+    sample_rate_index = (byte3 >> 2) & 3
+    padding = (byte3 >> 1) & 1
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or \
+            sample_rate_index == 3:
+        return 0
+
+    bitrate = _BITRATES[version == 3, layer][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4
+    if layer == 3 and version != 3:
+        return 72 * bitrate // sample_rate + padding
+    return 144 * bitrate // sample_rate + padding
+
+
+def _is_vbr_header(frame):
+    """Return whether `frame` is a Xing, Info or VBRI header frame."""
+    version = (frame[1] >> 3) & 3
+    mono = frame[3] >> 6 == 3
+    if version == 3:
+        side_info_size = 17 if mono else 32
+    else:
+        side_info_size = 9 if mono else 17
+
+    xing_offset = 4 + side_info_size
+    return bytes(frame[xing_offset:xing_offset + 4]) in (b'Xing', b'Info') \
+        or bytes(frame[36:40]) == b'VBRI'
+
+
+def split_tags(data):
+    """Split an mp3 file into its ID3v2 tag and its audio data.
+
+    Args:
+        data (bytes): The content of an mp3 file.
+
+    Returns:
+        tuple: The ID3v2 tag (empty if there is none) and the audio data,
+            without its ID3v1 tag if any.
+
+    """
+    tag_size = _id3v2_size(data)
+    end = len(data)
+    if end - tag_size >= _ID3V1_SIZE and \
+            data[end - _ID3V1_SIZE:end - _ID3V1_SIZE + 3] == b'TAG':
+        end -= _ID3V1_SIZE
+    return data[:tag_size], data[tag_size:end]
+
+
+def iter_frames(audio):
+    """Iterate over the MPEG audio frames of `audio`.
+
+    Garbage between frames is skipped, and a truncated last frame is
+    dropped.
+
+    Args:
+        audio (bytes): Audio data, with no ID3 tag (see `split_tags`).
+
+    Yields:
+        memoryview: Each frame.
+
+    """
+    view = memoryview(audio)
+    offset = 0
+    while offset + 4 <= len(audio):
+        length = _frame_length(audio, offset)
+        if length == 0 or offset + length > len(audio):
+            # Not a (complete) frame: look for the next sync word.
+            offset = audio.find(b'\xff', offset + 1)
+            if offset < 0:
+                return
+            continue
+
+        yield view[offset:offset + length]
+        offset += length
+
+
+def audio_frames(data, keep_tag=False):
+    """Extract the audio frames of an mp3 file, so that it can be joined.
+
+    Args:
+        data (bytes): The content of an mp3 file.
+        keep_tag (bool): Whether to keep the ID3v2 tag. Only the first file
+            of a joined stream should keep it. Defaults to False.
+
+    Returns:
+        bytes: The frames, with no VBR header frame.
+
+    """
+    tag, audio = split_tags(data)
+    frames = list(iter_frames(audio))
+    # Only the first frame of a file may be a VBR header.
+    if frames and _is_vbr_header(frames[0]):
+        del frames[0]
+    return (tag if keep_tag else b'') + b''.join(frames)
+
+
+def concatenate(mp3s):
+    """Join several mp3 files into one, without re-encoding.
+
+    Args:
+        mp3s: An iterable of mp3 file contents, as bytes.
+
+    Returns:
+        bytes: The joined mp3, with the ID3v2 tag of the first file.
+
+    """
+    return b''.join(audio_frames(data, keep_tag=index == 0)
+                    for index, data in enumerate(mp3s))
@@ -0,0 +1,103 @@
+"""Incremental parsing of the website responses.
+
+The mp3 url is embedded in the page returned by the text-to-speech form, as
+a javascript variable. Rather than downloading and decoding the whole page,
+the clients feed the raw body to an `Mp3UrlScanner` chunk by chunk and stop
+reading as soon as the url is found.
+"""
+import re
+
+
+_MP3_URL_PREFIX = b"var myPhpVar = '"
+_MP3_URL_REGEX = re.compile(re.escape(_MP3_URL_PREFIX) + rb"(.+?)';")
+
+# Urls longer than this are not urls: do not buffer more than that while
+# waiting for the end of the pattern.
+MAX_URL_LENGTH = 4096
+
+# Once the url is found, the rest of the body is read (and discarded) if it
+# is smaller than this, so that the connection can be reused. Otherwise, the
+# connection is closed.
+DRAIN_LIMIT = 64 * 1024
+
+
+class Mp3UrlScanner:
+    """Look for the mp3 url in a body received by chunks.
+
+    The pattern may span several chunks: only the end of the data that may
+    still be the beginning of a match is kept between two chunks, so memory
+    usage is bounded whatever the size of the body.
+
+    Example:
+        scanner = Mp3UrlScanner()
+        for chunk in chunks:
+            if scanner.feed(chunk) is not None:
+                break
+        print(scanner.url)
+
+    Attributes:
+        url (str): The mp3 url, or None if it was not found yet.
+
+    """
+
+    def __init__(self):
+        """Create a scanner waiting for its first chunk."""
+        self.url = None
+        self._buffer = b''
+
+    def feed(self, chunk):
+        """Scan the next chunk of the body.
+
+        Args:
+            chunk (bytes): The next chunk of the body.
+
+        Returns:
+            str: The mp3 url if it has been found, None otherwise.
+
+        """
+        if self.url is not None:
+            return self.url
+
+        buffer = self._buffer + chunk
+        match = _MP3_URL_REGEX.search(buffer)
+        if match is not None:
+            self.url = match.group(1).decode('utf-8', 'replace')
+            self._buffer = b''
+            return self.url
+
+        start = buffer.rfind(_MP3_URL_PREFIX)
+        if start < 0 or \
+                len(buffer) - start > len(_MP3_URL_PREFIX) + MAX_URL_LENGTH:
+            # Only a partial prefix may be at the end of the buffer.
+            start = max(0, len(buffer) - len(_MP3_URL_PREFIX) + 1)
+        self._buffer = buffer[start:]
+        return None
+
+
+async def scan_mp3_url_async(chunks):
+    """Find the mp3 url in a body received by chunks.
+
+    The chunks are consumed until the url is found. Then, at most
+    `DRAIN_LIMIT` more bytes are consumed, so that a connection can be
+    reused if the body ends shortly after the url.
+
+    Args:
+        chunks: An asynchronous iterator of bytes.
+
+    Returns:
+        str: The mp3 url, or None if it was not found.
+
+    """
+    scanner = Mp3UrlScanner()
+    async for chunk in chunks:
+        if scanner.feed(chunk) is not None:
+            break
+
+    if scanner.url is not None:
+        drained = 0
+        async for chunk in chunks:
+            drained += len(chunk)
+            if drained > DRAIN_LIMIT:
+                break
+
+    return scanner.url
@@ -0,0 +1,284 @@
+"""Rate limiting, retries and circuit breaking for the clients.
+
+A `Policy` wraps every request a client sends to the website:
+
+* a `TokenBucket` limits how many requests are sent per second,
+* transient errors (network errors, timeouts and 5xx responses) are retried
+  with an exponential backoff and full jitter, while the other errors (e.g.
+  `InvalidCredentialsError`, `LanguageNotSupportedError` or
+  `NeedsUpdateError`) are raised at once. A network error or a timeout
+  still failing after the last attempt is raised as a `NetworkError`,
+* a `CircuitBreaker` fails fast with `CircuitOpenError` while the website
+  seems to be down, instead of piling up doomed requests.
+
+The same policy object can be shared by several clients, synchronous or
+asynchronous, so that their requests are limited together.
+"""
+import asyncio
+import random
+import threading
+import time
+
+from .exceptions import AcapelaGroupError, CircuitOpenError, NetworkError
+
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 10.0
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RECOVERY_TIMEOUT = 30.0
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    The bucket holds up to `burst` tokens and is refilled with `rate` tokens
+    per second. Each request takes a token, waiting for it if the bucket is
+    empty. Waiting requests reserve their token, so they are served in
+    order.
+
+    Args:
+        rate (float): How many requests per second are allowed.
+        burst (int): How many requests may be sent at once after an idle
+            period. Defaults to 1.
+
+    """
+
+    def __init__(self, rate, burst=1):
+        """Create a full bucket."""
+        if rate <= 0:
+            raise ValueError("rate must be positive.")
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take a token and return how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire_async(self):
+        """Take a token, sleeping asynchronously until it is available."""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """Fail fast while the website is down.
+
+    After `failure_threshold` transient failures in a row, the circuit
+    opens: calls fail with `CircuitOpenError` without reaching the website.
+    Once `recovery_timeout` seconds have passed, a single trial call is let
+    through. If it succeeds, the circuit closes; otherwise, it opens again.
+    If the trial call is cancelled before any outcome, e.g. by a deadline,
+    the circuit opens again for another `recovery_timeout`.
+
+    Args:
+        failure_threshold (int): How many failures in a row open the
+            circuit. Defaults to `DEFAULT_FAILURE_THRESHOLD`.
+        recovery_timeout (float): How many seconds the circuit stays open.
+            Defaults to `DEFAULT_RECOVERY_TIMEOUT`.
+
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 recovery_timeout=DEFAULT_RECOVERY_TIMEOUT):
+        """Create a closed circuit."""
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Check that a call may go through.
+
+        Raises:
+            CircuitOpenError: The circuit is open.
+
+        Returns:
+            bool: Whether the call is the trial call of a half-open circuit.
+
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+
+            if self.state == self.OPEN and \
+                    time.monotonic() - self._opened_at >= \
+                    self.recovery_timeout:
+                self.state = self.HALF_OPEN
+                return True
+
+            raise CircuitOpenError(
+                "The website seems to be down, not sending the request.")
+
+    def record_success(self):
+        """Record that a call reached the website."""
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """Record that a call failed with a transient error."""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def cancel_trial(self):
+        """Record that the trial call ended with no outcome.
+
+        The circuit opens again, so that another trial call is let through
+        once `recovery_timeout` seconds have passed.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class Policy:
+    """How a client sends its requests to the website.
+
+    Args:
+        max_attempts (int): How many times a request is tried when it fails
+            with a transient error. Defaults to `DEFAULT_MAX_ATTEMPTS`.
+        backoff (float): The base delay between two attempts, in seconds.
+            The n-th retry waits up to `backoff * 2 ** (n - 1)` seconds.
+            Defaults to `DEFAULT_BACKOFF`.
+        max_backoff (float): The maximum delay between two attempts.
+            Defaults to `DEFAULT_MAX_BACKOFF`.
+        timeout (float): How many seconds a single http request may last,
+            or None for no timeout. Defaults to `DEFAULT_TIMEOUT`.
+        rate_limiter (TokenBucket): An optional rate limiter.
+        circuit_breaker (CircuitBreaker): An optional circuit breaker.
+
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 timeout=DEFAULT_TIMEOUT, rate_limiter=None,
+                 circuit_breaker=None):
+        """Create a policy."""
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be a positive integer.")
+
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+
+    def delay(self, attempt):
+        """Return how long to wait before the retry following `attempt`.
+
+        Args:
+            attempt (int): The number of the failed attempt, from 1.
+
+        Returns:
+            float: A random delay, in seconds ("full jitter").
+
+        """
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _before_attempt(self):
+        """Return whether the attempt is the trial call of the breaker."""
+        if self.circuit_breaker is not None:
+            return self.circuit_breaker.before_call()
+        return False
+
+    def _cancel_attempt(self, trial):
+        if trial:
+            self.circuit_breaker.cancel_trial()
+
+    def _after_attempt(self, attempt, exn, transient_errors):
+        """Record the outcome of an attempt.
+
+        Returns:
+            bool: Whether the attempt should be retried.
+
+        """
+        if exn is not None and isinstance(exn, transient_errors):
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            return attempt < self.max_attempts
+
+        # Any other outcome means that the website answered.
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        return False
+
+    @staticmethod
+    def _give_up(exn, transient_errors):
+        """Raise the error of the last attempt.
+
+        The network errors and the timeouts are raised as a `NetworkError`,
+        so that catching `AcapelaGroupError` is enough.
+        """
+        if isinstance(exn, transient_errors) and \
+                not isinstance(exn, AcapelaGroupError):
+            raise NetworkError("Could not reach the website: {}".format(
+                str(exn) or type(exn).__name__)) from exn
+        raise exn
+
+    async def call_async(self, function, *args, transient_errors=()):
+        """Await the coroutine function `function`, applying the policy.
+
+        Args:
+            function: The coroutine function sending the request.
+            *args: The arguments of `function`.
+            transient_errors (tuple): The exception classes worth retrying.
+
+        Raises:
+            CircuitOpenError: The circuit breaker is open.
+            NetworkError: A transient error which is not an
+                `AcapelaGroupError` failed the last attempt.
+
+        Returns:
+            The result of `function`.
+
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            trial = self._before_attempt()
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.acquire_async()
+                result = await function(*args)
+            except Exception as exn:
+                if not self._after_attempt(attempt, exn, transient_errors):
+                    self._give_up(exn, transient_errors)
+            except BaseException:
+                # Cancelled, e.g. by a deadline or by a hedged copy which
+                # answered first: the attempt has no outcome.
+                self._cancel_attempt(trial)
+                raise
+            else:
+                self._after_attempt(attempt, None, transient_errors)
+                return result
+
+            await asyncio.sleep(self.delay(attempt))
@@ -0,0 +1,378 @@
+"""Pools of authenticated clients.
+
+Authenticated sessions give sounds with no background music, but a single
+account can only be pushed so hard. A pool holds one client per account and
+spreads the requests over them, sending each request to the account with
+the fewest requests in flight.
+
+An account is taken out of rotation for a while when it is locked out, when
+its credentials are refused, or when too many of its requests fail in a
+row. It is brought back (and logged in again) once its cooldown is over.
+"""
+import concurrent.futures
+import threading
+import time
+
+from .base import (AcapelaGroup, AcapelaGroupAsync, AcapelaGroupError,
+                   CircuitOpenError, DeadlineExceededError,
+                   InvalidCredentialsError, LanguageNotSupportedError,
+                   NeedsUpdateError, NoAccountAvailableError,
+                   TooManyInvalidLoginAttemptsError, VoiceNotSupportedError)
+from .batch import DEFAULT_CONCURRENCY, map_async, map_threaded
+
+
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_COOLDOWN = 300
+
+# These errors are caused by the request itself, or by the website, not by
+# the account.
+_REQUEST_ERRORS = (LanguageNotSupportedError, NeedsUpdateError,
+                   VoiceNotSupportedError, DeadlineExceededError,
+                   CircuitOpenError)
+_LOGIN_ERRORS = (TooManyInvalidLoginAttemptsError, InvalidCredentialsError)
+
+
+class AccountStats:
+    """Counters of an account of a pool.
+
+    Attributes:
+        requests (int): How many requests were sent.
+        successes (int): How many requests succeeded.
+        failures (int): How many requests failed because of the account or
+            of the network.
+        login_failures (int): How many logins failed.
+        latency (float): The total time spent in successful requests, in
+            seconds.
+
+    """
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.created_at = time.monotonic()
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.login_failures = 0
+        self.latency = 0.0
+
+    @property
+    def mean_latency(self):
+        """float: The mean duration of the successful requests."""
+        return self.latency / self.successes if self.successes else 0.0
+
+    @property
+    def throughput(self):
+        """float: The successful requests per second since creation."""
+        elapsed = time.monotonic() - self.created_at
+        return self.successes / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        """Return the counters as a dictionary.
+
+        Returns:
+            dict: A mapping of counter names to their values.
+
+        """
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'failures': self.failures,
+            'login_failures': self.login_failures,
+            'mean_latency': self.mean_latency,
+            'throughput': self.throughput,
+        }
+
+
+class _Member:
+
+    def __init__(self, username, password, client):
+        self.username = username
+        self.password = password
+        self.client = client
+        self.stats = AccountStats()
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.authenticated = False
+        self.disabled_until = None
+
+
+class _BasePool:
+
+    def __init__(self, accounts, client_factory, max_failures, cooldown,
+                 client_kwargs):
+        self._members = [
+            _Member(username, password, client_factory(**client_kwargs))
+            for username, password in accounts]
+        if not self._members:
+            raise ValueError("At least one account is required.")
+
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+
+        metrics = client_kwargs.get('metrics')
+        if metrics is not None:
+            metrics.add_collector(self._collect)
+
+    def _acquire(self):
+        """Pick the available member with the fewest requests in flight."""
+        now = time.monotonic()
+        available = []
+        for member in self._members:
+            if member.disabled_until is not None and \
+                    member.disabled_until <= now:
+                member.disabled_until = None
+                member.consecutive_failures = 0
+            if member.disabled_until is None:
+                available.append(member)
+
+        if not available:
+            raise NoAccountAvailableError(
+                "Every account of the pool is out of rotation.")
+
+        member = min(available, key=lambda member: (
+            member.outstanding, member.stats.requests))
+        member.outstanding += 1
+        member.stats.requests += 1
+        return member
+
+    def _disable(self, member):
+        member.disabled_until = time.monotonic() + self.cooldown
+        member.authenticated = False
+
+    def _release(self, member, started_at, exn=None, cancelled=False):
+        """Give `member` back, and record the outcome of its request.
+
+        A cancelled request is neither a success nor a failure of the
+        account.
+        """
+        member.outstanding -= 1
+        if cancelled:
+            return
+        if exn is None:
+            member.consecutive_failures = 0
+            member.stats.successes += 1
+            member.stats.latency += time.monotonic() - started_at
+        elif isinstance(exn, _LOGIN_ERRORS):
+            member.stats.login_failures += 1
+            self._disable(member)
+        elif not isinstance(exn, _REQUEST_ERRORS):
+            member.stats.failures += 1
+            member.consecutive_failures += 1
+            if member.consecutive_failures >= self.max_failures:
+                self._disable(member)
+
+    def stats(self):
+        """Get the statistics of every account.
+
+        Returns:
+            dict: A mapping of usernames to dictionaries of counters (see
+                `AccountStats.as_dict`), plus the 'outstanding' requests and
+                whether the account is 'available'.
+
+        """
+        now = time.monotonic()
+        stats = {}
+        for member in self._members:
+            stats[member.username] = dict(
+                member.stats.as_dict(),
+                outstanding=member.outstanding,
+                available=member.disabled_until is None or
+                member.disabled_until <= now)
+        return stats
+
+    def _collect(self):
+        """Return the statistics of every account as gauges."""
+        return [('pool_' + name, float(value), {'account': username})
+                for username, stats in self.stats().items()
+                for name, value in sorted(stats.items())]
+
+
+class AcapelaGroupPool(_BasePool):
+    """Pool of `AcapelaGroup` clients, one per account.
+
+    The pool is thread-safe. Accounts log in lazily, on their first request.
+
+    Example:
+        pool = AcapelaGroupPool([('user1', 'pass1'), ('user2', 'pass2')])
+        print(pool.get_mp3_url('French (France)', 'Antoine', 'Bonjour'))
+        print(pool.stats())
+
+    Args:
+        accounts: An iterable of (username, password) pairs.
+        max_failures (int): How many requests of an account may fail in a
+            row before it is taken out of rotation. Defaults to
+            `DEFAULT_MAX_FAILURES`.
+        cooldown (float): How many seconds an account stays out of
+            rotation. Defaults to `DEFAULT_COOLDOWN`.
+        client_factory: The class of the clients. Defaults to
+            `AcapelaGroup`.
+        **client_kwargs: The arguments of each client (e.g. `base_url`,
+            `cache`, `session_store` or `metrics`, which also gets the
+            statistics of the pool).
+
+    """
+
+    def __init__(self, accounts, max_failures=DEFAULT_MAX_FAILURES,
+                 cooldown=DEFAULT_COOLDOWN, client_factory=AcapelaGroup,
+                 **client_kwargs):
+        """Create a client for each account."""
+        super().__init__(accounts, client_factory, max_failures, cooldown,
+                         client_kwargs)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def __enter__(self):
+        """Return the pool itself."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Close the pool."""
+        self.close()
+
+    def _call(self, method, *args, deadline=None):
+        with self._lock:
+            member = self._acquire()
+
+        started_at = time.monotonic()
+        # Cancelled, unless the call returns or raises an error.
+        outcome = {'cancelled': True}
+        try:
+            # The client runs a single login at a time (see the `auth`
+            # module), so concurrent first requests share it.
+            if not member.authenticated:
+                member.client.authenticate(member.username, member.password,
+                                           deadline=deadline)
+                member.authenticated = True
+            result = getattr(member.client, method)(*args, deadline=deadline)
+            outcome = {}
+        except Exception as exn:
+            outcome = {'exn': exn}
+            raise
+        finally:
+            with self._lock:
+                self._release(member, started_at, **outcome)
+        return result
+
+    def get_mp3_url(self, language, voice, text, *, deadline=None):
+        """Retrieve the mp3 url associated to the settings.
+
+        See `AcapelaGroup.get_mp3_url`. The `deadline` covers the login of
+        the account, if it is not logged in yet.
+
+        Raises:
+            NoAccountAvailableError: Every account is out of rotation.
+
+        """
+        return self._call('get_mp3_url', language, voice, text,
+                          deadline=deadline)
+
+    def get_mp3_urls(self, items, concurrency=DEFAULT_CONCURRENCY,
+                     ordered=True):
+        """Retrieve the mp3 urls of many requests using worker threads.
+
+        See `AcapelaGroup.get_mp3_urls`.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=concurrency)
+        return map_threaded(self._executor, self.get_mp3_url, items,
+                            concurrency, ordered=ordered,
+                            errors=(AcapelaGroupError,))
+
+    def close(self):
+        """Close every client of the pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for member in self._members:
+            member.client.close()
+
+
+class AcapelaGroupAsyncPool(_BasePool):
+    """Pool of `AcapelaGroupAsync` clients, one per account.
+
+    Accounts log in lazily, on their first request.
+
+    Example:
+        async with AcapelaGroupAsyncPool(accounts) as pool:
+            print(await pool.get_mp3_url('French (France)', 'Antoine',
+                                         'Bonjour'))
+
+    Args:
+        accounts: An iterable of (username, password) pairs.
+        max_failures (int): How many requests of an account may fail in a
+            row before it is taken out of rotation. Defaults to
+            `DEFAULT_MAX_FAILURES`.
+        cooldown (float): How many seconds an account stays out of
+            rotation. Defaults to `DEFAULT_COOLDOWN`.
+        client_factory: The class of the clients. Defaults to
+            `AcapelaGroupAsync`.
+        **client_kwargs: The arguments of each client (e.g. `base_url`,
+            `cache`, `session_store` or `metrics`, which also gets the
+            statistics of the pool).
+
+    """
+
+    def __init__(self, accounts, max_failures=DEFAULT_MAX_FAILURES,
+                 cooldown=DEFAULT_COOLDOWN, client_factory=AcapelaGroupAsync,
+                 **client_kwargs):
+        """Create a client for each account."""
+        super().__init__(accounts, client_factory, max_failures, cooldown,
+                         client_kwargs)
+
+    async def __aenter__(self):
+        """Open the http session of every client."""
+        for member in self._members:
+            await member.client.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Close the http session of every client."""
+        for member in self._members:
+            await member.client.__aexit__(exc_type, exc, tb)
+
+    async def _call(self, method, *args, deadline=None):
+        member = self._acquire()
+        started_at = time.monotonic()
+        # Cancelled, unless the call returns or raises an error.
+        outcome = {'cancelled': True}
+        try:
+            # The client runs a single login at a time (see the `auth`
+            # module), so concurrent first requests share it.
+            if not member.authenticated:
+                await member.client.authenticate(member.username,
+                                                 member.password,
+                                                 deadline=deadline)
+                member.authenticated = True
+            result = await getattr(member.client, method)(
+                *args, deadline=deadline)
+            outcome = {}
+        except Exception as exn:
+            outcome = {'exn': exn}
+            raise
+        finally:
+            self._release(member, started_at, **outcome)
+        return result
+
+    async def get_mp3_url(self, language, voice, text, *, deadline=None):
+        """Retrieve the mp3 url associated to the settings.
+
+        See `AcapelaGroupAsync.get_mp3_url`. The `deadline` covers the login
+        of the account, if it is not logged in yet.
+
+        Raises:
+            NoAccountAvailableError: Every account is out of rotation.
+
+        """
+        return await self._call('get_mp3_url', language, voice, text,
+                                deadline=deadline)
+
+    def get_mp3_urls(self, items, concurrency=DEFAULT_CONCURRENCY,
+                     ordered=True):
+        """Retrieve the mp3 urls of many requests concurrently.
+
+        See `AcapelaGroupAsync.get_mp3_urls`.
+        """
+        return map_async(self.get_mp3_url, items, concurrency,
+                         ordered=ordered, errors=(AcapelaGroupError,))
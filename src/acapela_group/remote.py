@@ -0,0 +1,177 @@
+"""A thin client of the service run by ``acapela-group serve``.
+
+`RemoteClient` only depends on the standard library, so that a short-lived
+process can ask a warm service for mp3 urls without importing any http
+library nor logging in. It has the same `get_mp3_url` and `get_mp3_urls`
+methods as `AcapelaGroup`.
+
+The address of the service is an url, e.g. ``http://127.0.0.1:8765``, or
+the path of a Unix socket prefixed with ``unix:``, e.g.
+``unix:/run/acapela-group.sock``.
+"""
+import concurrent.futures
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlparse
+
+from . import exceptions
+from .batch import DEFAULT_CONCURRENCY, map_threaded
+
+
+DEFAULT_TIMEOUT = 60.0
+
+_UNIX_PREFIX = 'unix:'
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _error_from(fields, status):
+    """Rebuild the exception described by an error answer."""
+    error_class = getattr(exceptions, fields.get('error_type') or '', None)
+    if not isinstance(error_class, type) or \
+            not issubclass(error_class, exceptions.AcapelaGroupError):
+        error_class = exceptions.AcapelaGroupError
+    return error_class(fields.get('error') or
+                       "The service answered with the {} status.".format(
+                           status))
+
+
+class RemoteClient:
+    """Client of an ``acapela-group serve`` service.
+
+    Each thread keeps its own connection to the service alive.
+
+    Args:
+        address (str): The address of the service.
+        timeout (float): How many seconds a request may last. Defaults to
+            `DEFAULT_TIMEOUT`.
+        max_workers (int): How many threads `get_mp3_urls` may use.
+            Defaults to `DEFAULT_CONCURRENCY`.
+
+    """
+
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT,
+                 max_workers=DEFAULT_CONCURRENCY):
+        """Create a client, without connecting yet."""
+        self.address = address
+        self.timeout = timeout
+        self._max_workers = max_workers
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._executor = None
+
+    def _new_connection(self):
+        if self.address.startswith(_UNIX_PREFIX):
+            return _UnixHTTPConnection(self.address[len(_UNIX_PREFIX):],
+                                       self.timeout)
+        parse_result = urlparse(self.address)
+        return http.client.HTTPConnection(parse_result.netloc,
+                                          timeout=self.timeout)
+
+    def _get_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._new_connection()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _request(self, method, path, body=None):
+        connection = self._get_connection()
+        headers = {'Content-Type': 'application/json'}
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+        except (http.client.RemoteDisconnected, BrokenPipeError,
+                ConnectionResetError):
+            # The service closed an idle connection: try a new one.
+            connection.close()
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+        return response.status, response.read()
+
+    def get_mp3_url(self, language, voice, text, priority=None, caller=None):
+        """Retrieve the mp3 url associated to the settings.
+
+        The `priority` class and the `caller` are passed on to the scheduler
+        of the service, if any (see `AcapelaGroupAsync.get_mp3_url`).
+
+        Raises:
+            OverloadedError: The service is too busy to take the request.
+            AcapelaGroupError: The service could not resolve the request,
+                or could not be reached.
+
+        Returns:
+            str: An HTTP url pointing to the generated mp3.
+
+        """
+        body = json.dumps({'language': language, 'voice': voice,
+                           'text': text, 'priority': priority,
+                           'caller': caller}).encode('utf-8')
+        try:
+            status, payload = self._request('POST', '/mp3-url', body)
+        except OSError as exn:
+            raise exceptions.AcapelaGroupError(
+                "Could not reach the service at {}: {}".format(
+                    self.address, exn)) from exn
+
+        try:
+            fields = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            fields = {}
+        if status != 200 or 'url' not in fields:
+            raise _error_from(fields, status)
+        return fields['url']
+
+    def health(self):
+        """Return the load of the service, as a dictionary."""
+        status, payload = self._request('GET', '/health')
+        return json.loads(payload.decode('utf-8'))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._max_workers)
+            return self._executor
+
+    def get_mp3_urls(self, items, concurrency=None, ordered=True):
+        """Retrieve the mp3 urls of many requests, from a thread pool.
+
+        See `AcapelaGroup.get_mp3_urls`.
+        """
+        return map_threaded(self._get_executor(), self.get_mp3_url, items,
+                            concurrency or self._max_workers,
+                            ordered=ordered,
+                            errors=(exceptions.AcapelaGroupError,))
+
+    def close(self):
+        """Close the connections and the thread pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            connections, self._connections = self._connections, []
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for connection in connections:
+            connection.close()
+
+    def __enter__(self):
+        """Return the client itself."""
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Close the client."""
+        self.close()
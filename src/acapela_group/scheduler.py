@@ -0,0 +1,316 @@
+"""Scheduling of the requests of several kinds of traffic.
+
+When interactive users share an `AcapelaGroupAsync` with bulk jobs, a large
+batch fills every connection and single requests wait behind it. A
+`Scheduler` given to the client decides which request goes next:
+
+    scheduler = Scheduler(concurrency=10, classes={
+        'interactive': PriorityClass(priority=0),
+        'bulk': PriorityClass(priority=1, max_concurrency=8),
+    })
+    acapela_group = AcapelaGroupAsync(scheduler=scheduler)
+    await acapela_group.get_mp3_url(language, voice, text,
+                                    priority='bulk', caller='nightly')
+
+* classes are served by strict priority: a request of a lower class only
+  goes when no request of a higher class is waiting,
+* within a class, the callers share the slots by weighted fair queuing, so
+  one caller's thousands of requests do not delay another caller's few,
+* each class may be capped, which keeps some slots free for the others.
+
+Only the requests actually sent to the website are scheduled: answers from
+the cache and coalesced calls do not take a slot.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+
+DEFAULT_CONCURRENCY = 10
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class PriorityClass:
+    """The settings of a class of traffic.
+
+    Args:
+        priority (int): The classes with the lowest priority number are
+            served first. Defaults to 0.
+        max_concurrency (int): How many requests of this class may be in
+            flight at once, or None for no other limit than the scheduler's.
+
+    """
+
+    def __init__(self, priority=0, max_concurrency=None):
+        """Create the settings of a class."""
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be a positive integer.")
+
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+
+
+def default_classes(concurrency=DEFAULT_CONCURRENCY):
+    """Return the 'interactive' and 'bulk' classes.
+
+    Bulk requests may use all but a fifth of the slots (at least one), which
+    stay free for the interactive ones.
+
+    Args:
+        concurrency (int): The concurrency of the scheduler.
+
+    Returns:
+        dict: The classes, by name.
+
+    """
+    return {
+        INTERACTIVE: PriorityClass(priority=0),
+        BULK: PriorityClass(priority=1, max_concurrency=max(
+            1, concurrency - max(1, concurrency // 5))),
+    }
+
+
+class ClassStats:
+    """Counters of a class of a `Scheduler`.
+
+    Attributes:
+        queued (int): How many requests are waiting for a slot.
+        max_queued (int): The largest number of requests which waited at
+            once.
+        in_flight (int): How many requests hold a slot.
+        admitted (int): How many requests got a slot.
+        wait_time (float): The total time the admitted requests waited, in
+            seconds.
+        max_wait_time (float): The longest time a request waited.
+
+    """
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.queued = 0
+        self.max_queued = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def mean_wait_time(self):
+        """float: The mean time the admitted requests waited."""
+        return self.wait_time / self.admitted if self.admitted else 0.0
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'in_flight': self.in_flight,
+            'admitted': self.admitted,
+            'mean_wait_time': self.mean_wait_time,
+            'max_wait_time': self.max_wait_time,
+        }
+
+    def __repr__(self):
+        """Return a representation of the counters."""
+        return '<ClassStats {}>'.format(' '.join(
+            '{}={}'.format(name, value)
+            for name, value in self.as_dict().items()))
+
+
+class _Waiter:
+
+    __slots__ = ('future', 'enqueued_at')
+
+    def __init__(self, future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _Class:
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.settings = settings
+        self.stats = ClassStats()
+        # (finish tag, sequence number, waiter), the smallest tag first.
+        self.heap = []
+        self.virtual_time = 0.0
+        self.last_tags = {}
+
+    def has_room(self):
+        cap = self.settings.max_concurrency
+        return cap is None or self.stats.in_flight < cap
+
+
+class _Slot:
+
+    def __init__(self, scheduler, priority, caller):
+        self._scheduler = scheduler
+        self._priority = priority
+        self._caller = caller
+
+    async def __aenter__(self):
+        await self._scheduler.acquire(self._priority, self._caller)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._scheduler.release(self._priority)
+
+
+class Scheduler:
+    """Share a number of slots between classes of traffic and callers.
+
+    The scheduler is meant to be used from a single event loop.
+
+    Args:
+        concurrency (int): How many requests may be in flight at once.
+            Defaults to `DEFAULT_CONCURRENCY`.
+        classes (dict): The `PriorityClass` of each class, by name.
+            Defaults to `default_classes(concurrency)`.
+        default_class (str): The class of the requests with no class.
+            Defaults to `INTERACTIVE`.
+
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, classes=None,
+                 default_class=INTERACTIVE):
+        """Create a scheduler with every slot free."""
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer.")
+        if classes is None:
+            classes = default_classes(concurrency)
+        if default_class not in classes:
+            raise ValueError("Unknown default class {}.".format(
+                default_class))
+
+        self.concurrency = concurrency
+        self.default_class = default_class
+        self.in_flight = 0
+        self._classes = {name: _Class(name, settings)
+                         for name, settings in classes.items()}
+        self._by_priority = sorted(self._classes.values(),
+                                   key=lambda cls: cls.settings.priority)
+        self._weights = {}
+        self._sequence = itertools.count()
+
+    @property
+    def stats(self):
+        """dict: Get the `ClassStats` of each class, by name."""
+        return {name: cls.stats for name, cls in self._classes.items()}
+
+    def set_weight(self, caller, weight):
+        """Set the share of the slots of a caller, relative to the others.
+
+        Callers have a weight of 1 by default.
+
+        Args:
+            caller: A hashable identifying the caller.
+            weight (float): The weight of the caller.
+
+        """
+        if weight <= 0:
+            raise ValueError("weight must be positive.")
+        self._weights[caller] = weight
+
+    def _get_class(self, priority):
+        name = self.default_class if priority is None else priority
+        try:
+            return self._classes[name]
+        except KeyError:
+            raise ValueError("Unknown priority class {}.".format(
+                name)) from None
+
+    def slot(self, priority=None, caller=None):
+        """Return an asynchronous context manager holding a slot.
+
+        Example:
+            async with scheduler.slot('bulk', caller='nightly'):
+                ...
+
+        Args:
+            priority (str): The name of the class of the request. Defaults
+                to the default class.
+            caller: A hashable identifying the caller, for fair queuing
+                within the class.
+
+        """
+        return _Slot(self, priority, caller)
+
+    async def acquire(self, priority=None, caller=None):
+        """Wait for a slot.
+
+        See `slot` for the arguments. Each `acquire` must be followed by a
+        `release` with the same class.
+
+        Raises:
+            ValueError: The class is unknown.
+
+        """
+        cls = self._get_class(priority)
+
+        # Weighted fair queuing: a request finishes, in virtual time, the
+        # inverse of its caller's weight after it starts, which is when the
+        # previous request of the caller finishes or now, whichever is later.
+        # The smallest finish tag is served first.
+        start = max(cls.virtual_time, cls.last_tags.get(caller, 0.0))
+        tag = start + 1.0 / self._weights.get(caller, 1.0)
+        cls.last_tags[caller] = tag
+
+        waiter = _Waiter(asyncio.get_event_loop().create_future())
+        heapq.heappush(cls.heap, (tag, next(self._sequence), waiter))
+        cls.stats.queued += 1
+        cls.stats.max_queued = max(cls.stats.max_queued, cls.stats.queued)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted while the caller was cancelled.
+                self.release(priority)
+            else:
+                waiter.future.cancel()
+                cls.stats.queued -= 1
+            raise
+
+    def release(self, priority=None):
+        """Free a slot taken by `acquire`."""
+        cls = self._get_class(priority)
+        cls.stats.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant the free slots to the waiting requests."""
+        while self.in_flight < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            waiter.future.set_result(None)
+
+    def _next_waiter(self):
+        for cls in self._by_priority:
+            if not cls.has_room():
+                continue
+            while cls.heap:
+                tag, _, waiter = heapq.heappop(cls.heap)
+                if waiter.future.cancelled():
+                    continue
+
+                cls.virtual_time = tag
+                if not cls.heap:
+                    # Idle: the next callers start afresh.
+                    cls.last_tags.clear()
+                    cls.virtual_time = 0.0
+
+                waited = time.monotonic() - waiter.enqueued_at
+                cls.stats.queued -= 1
+                cls.stats.in_flight += 1
+                cls.stats.admitted += 1
+                cls.stats.wait_time += waited
+                cls.stats.max_wait_time = max(cls.stats.max_wait_time,
+                                              waited)
+                self.in_flight += 1
+                return waiter
+        return None
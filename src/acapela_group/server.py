@@ -0,0 +1,214 @@
+"""A long-running service around a warm asynchronous client.
+
+Starting the command line for each request pays for the interpreter, the
+imports, a new connection and possibly a login. `Server` keeps a single
+`AcapelaGroupAsync` alive instead, with its authenticated session, its
+connection pool and its cache, and serves it over HTTP, on a TCP port or on
+a Unix socket:
+
+* ``POST /mp3-url`` with a JSON object holding 'language', 'voice' and
+  'text' answers a JSON object holding the 'url', or the 'error' and its
+  'error_type' (the name of the exception class). The object may also hold
+  the 'priority' class and the 'caller' of the request, as strings, for
+  the scheduler of the client (see `acapela_group.scheduler`),
+* ``GET /health`` answers the load of the service,
+* ``GET /metrics`` answers the metrics of the client in the Prometheus text
+  format.
+
+At most `concurrency` requests are resolved at once, and at most
+`queue_size` more wait for their turn. Beyond that, or when a request has
+waited for more than `queue_timeout` seconds, the service sheds the load:
+it answers at once with a 503 status and an `OverloadedError`, instead of
+letting the callers pile up.
+
+`acapela_group.remote.RemoteClient` is the matching client.
+"""
+import asyncio
+
+from aiohttp import web
+
+from .exceptions import (AcapelaGroupError, InvalidCredentialsError,
+                         LanguageNotSupportedError, NeedsUpdateError,
+                         OverloadedError, TooManyInvalidLoginAttemptsError,
+                         VoiceNotSupportedError)
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_CONCURRENCY = 10
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_QUEUE_TIMEOUT = 30.0
+
+# The status of the answers, by error. Other errors are a 502: the website
+# did not answer as expected.
+_ERROR_STATUSES = (
+    (OverloadedError, 503),
+    (LanguageNotSupportedError, 400),
+    (VoiceNotSupportedError, 400),
+    (NeedsUpdateError, 422),
+    (InvalidCredentialsError, 502),
+    (TooManyInvalidLoginAttemptsError, 502),
+)
+
+
+def _error_status(exn):
+    for error_class, status in _ERROR_STATUSES:
+        if isinstance(exn, error_class):
+            return status
+    return 502
+
+
+class Server:
+    """Serve a warm `AcapelaGroupAsync` over HTTP.
+
+    The client is entered when the service starts and exited when it
+    stops.
+
+    Args:
+        client (AcapelaGroupAsync): The client.
+        credentials (tuple): An optional (username, password) couple to
+            authenticate with when the service starts.
+        concurrency (int): How many requests may be resolved at once.
+            Defaults to `DEFAULT_CONCURRENCY`.
+        queue_size (int): How many requests may wait for their turn.
+            Defaults to `DEFAULT_QUEUE_SIZE`.
+        queue_timeout (float): How many seconds a request may wait for its
+            turn. Defaults to `DEFAULT_QUEUE_TIMEOUT`.
+        metrics (Metrics): The metrics of the client, if any, served on
+            ``/metrics``.
+
+    """
+
+    def __init__(self, client, credentials=None,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, metrics=None):
+        """Create a service, without starting it."""
+        self.client = client
+        self.credentials = credentials
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = 0
+        self._semaphore = None
+
+    async def _start(self, app):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self.client.__aenter__()
+        if self.credentials is not None:
+            await self.client.authenticate(*self.credentials)
+
+    async def _stop(self, app):
+        await self.client.__aexit__(None, None, None)
+
+    async def _acquire(self):
+        """Wait for a turn, or raise `OverloadedError`."""
+        if self.waiting >= self.queue_size and self._semaphore.locked():
+            self.shed += 1
+            raise OverloadedError(
+                "Too many requests: {} in flight, {} waiting.".format(
+                    self.in_flight, self.waiting))
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(),
+                                   self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise OverloadedError(
+                "The request waited for more than {} seconds.".format(
+                    self.queue_timeout)) from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _handle_mp3_url(self, request):
+        try:
+            fields = await request.json()
+            language, voice, text = (fields['language'], fields['voice'],
+                                     fields['text'])
+            # Only given to the client when set.
+            scheduling = {name: fields[name] for name in ('priority', 'caller')
+                          if fields.get(name) is not None}
+        except (ValueError, TypeError, KeyError):
+            return web.json_response(
+                {'error': "Expected a JSON object with 'language', 'voice' "
+                          "and 'text' keys.",
+                 'error_type': 'ValueError'}, status=400)
+
+        for name, value in scheduling.items():
+            # A list or an object could not key the queues of the scheduler.
+            if not isinstance(value, str):
+                return web.json_response(
+                    {'error': "Expected a string or null as {!r}.".format(
+                        name),
+                     'error_type': 'ValueError'}, status=400)
+
+        try:
+            await self._acquire()
+            try:
+                url = await self.client.get_mp3_url(language, voice, text,
+                                                    **scheduling)
+            finally:
+                self._release()
+        except ValueError as exn:
+            # An unknown priority class.
+            return web.json_response(
+                {'error': str(exn), 'error_type': 'ValueError'}, status=400)
+        except AcapelaGroupError as exn:
+            headers = {'Retry-After': '1'} \
+                if isinstance(exn, OverloadedError) else None
+            return web.json_response(
+                {'error': str(exn), 'error_type': type(exn).__name__},
+                status=_error_status(exn), headers=headers)
+
+        return web.json_response({'url': url})
+
+    async def _handle_health(self, request):
+        return web.json_response({
+            'status': 'ok',
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'shed': self.shed,
+            'coalescing': self.client.flight_stats.as_dict(),
+        })
+
+    async def _handle_metrics(self, request):
+        if self.metrics is None:
+            raise web.HTTPNotFound(text="Metrics are not enabled.")
+        return web.Response(text=self.metrics.prometheus_text(),
+                            content_type='text/plain', charset='utf-8')
+
+    def make_app(self):
+        """Return the `aiohttp.web.Application` of the service."""
+        app = web.Application()
+        app.router.add_post('/mp3-url', self._handle_mp3_url)
+        app.router.add_get('/health', self._handle_health)
+        app.router.add_get('/metrics', self._handle_metrics)
+        app.on_startup.append(self._start)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    def run(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None,
+            print=print):
+        """Run the service until interrupted.
+
+        Args:
+            host (str): The interface to listen on. Defaults to
+                `DEFAULT_HOST`.
+            port (int): The port to listen on. Defaults to `DEFAULT_PORT`.
+            path (str): The path of a Unix socket to listen on instead.
+            print: The function printing the address of the service.
+
+        """
+        if path is not None:
+            web.run_app(self.make_app(), path=path, print=print)
+        else:
+            web.run_app(self.make_app(), host=host, port=port, print=print)
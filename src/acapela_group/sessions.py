@@ -0,0 +1,157 @@
+"""Persistent storage of authenticated sessions.
+
+Logging in costs two round-trips, and logging in too often gets the IP
+locked out. A `SessionStore` keeps the cookies of the authenticated sessions
+on disk, so that other processes (or the same one, after a restart) can
+reuse them for as long as they are valid.
+
+The store is a JSON file guarded by a lock file, so several processes can
+share it. Only cookies are stored, never passwords. The file is only
+readable by its owner since the cookies grant access to the account.
+"""
+import contextlib
+import json
+import os
+import tempfile
+import time
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # Not on Windows: no locking there.
+
+
+_LOGGED_IN_COOKIE_PREFIX = 'wordpress_logged_in'
+
+
+def default_session_path():
+    """Return the default path of the session store.
+
+    It is `acapela-group/sessions.json` in `$XDG_CACHE_HOME` (`~/.cache` by
+    default).
+
+    Returns:
+        str: The path.
+
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'acapela-group', 'sessions.json')
+
+
+def is_logged_in(cookies, now=None):
+    """Return whether `cookies` hold a valid authenticated session.
+
+    Args:
+        cookies: An iterable of cookie dictionaries, as stored by
+            `SessionStore`.
+        now (float): The current timestamp. Defaults to `time.time()`.
+
+    Returns:
+        bool: True if there is an unexpired login cookie.
+
+    """
+    now = time.time() if now is None else now
+    return any(cookie['name'].startswith(_LOGGED_IN_COOKIE_PREFIX) and
+               (cookie.get('expires') is None or cookie['expires'] > now)
+               for cookie in cookies)
+
+
+class SessionStore:
+    """Cookies of authenticated sessions, stored in a JSON file.
+
+    Sessions are identified by the base url of the website and the
+    username. Each cookie is a dictionary with the 'name', 'value',
+    'domain', 'path', 'expires' (a timestamp, or None) and 'secure' keys.
+
+    Args:
+        path (str): The path of the JSON file. Defaults to
+            `default_session_path()`.
+
+    """
+
+    def __init__(self, path=None):
+        """Create a store, without touching the file yet."""
+        self.path = path or default_session_path()
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file,
+                            fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as fileobj:
+                return json.load(fileobj)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write(self, sessions):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'w') as fileobj:
+                json.dump(sessions, fileobj)
+            os.replace(temporary_path, self.path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @staticmethod
+    def _key(base_url, username):
+        return '{} {}'.format(base_url, username)
+
+    def load(self, base_url, username):
+        """Load the cookies of a session, if it is still valid.
+
+        Args:
+            base_url (str): The base url of the website.
+            username (str): The account's username.
+
+        Returns:
+            list: The cookies, or None if there is no valid session.
+
+        """
+        with self._locked(exclusive=False):
+            cookies = self._read().get(self._key(base_url, username))
+
+        if cookies is None or not is_logged_in(cookies):
+            return None
+        return cookies
+
+    def save(self, base_url, username, cookies):
+        """Save the cookies of a session.
+
+        Args:
+            base_url (str): The base url of the website.
+            username (str): The account's username.
+            cookies (list): The cookies of the session.
+
+        """
+        with self._locked(exclusive=True):
+            sessions = self._read()
+            sessions[self._key(base_url, username)] = list(cookies)
+            self._write(sessions)
+
+    def discard(self, base_url, username):
+        """Forget a session, typically because it expired.
+
+        Args:
+            base_url (str): The base url of the website.
+            username (str): The account's username.
+
+        """
+        with self._locked(exclusive=True):
+            sessions = self._read()
+            if sessions.pop(self._key(base_url, username), None) is not None:
+                self._write(sessions)
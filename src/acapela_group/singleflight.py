@@ -0,0 +1,108 @@
+"""Coalescing of identical requests in flight.
+
+When many callers ask for the same sound at once (a popular phrase, a batch
+with duplicates), sending one request per caller is wasteful: the website
+answers the same for each of them. An `AsyncSingleFlight` lets the first
+caller send the request while the others wait for its outcome, then all of
+them get the same result, or the same exception.
+
+Unlike a cache, nothing is remembered once the request is over: a later
+call with the same key sends a new request.
+"""
+import asyncio
+
+
+class FlightStats:
+    """Counters of an `AsyncSingleFlight`.
+
+    Attributes:
+        calls (int): How many calls were made.
+        flights (int): How many of them actually ran the function.
+        deduplicated (int): How many of them shared the outcome of a call
+            already in flight.
+
+    """
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self.calls = 0
+        self.flights = 0
+        self.deduplicated = 0
+
+    def as_dict(self):
+        """Return the counters as a dictionary."""
+        return {
+            'calls': self.calls,
+            'flights': self.flights,
+            'deduplicated': self.deduplicated,
+        }
+
+    def __repr__(self):
+        """Return a representation of the counters."""
+        return 'FlightStats(calls={calls}, flights={flights}, ' \
+            'deduplicated={deduplicated})'.format(**self.as_dict())
+
+
+class AsyncSingleFlight:
+    """Coalesce identical calls made from several coroutines.
+
+    The coroutine runs in its own task, so that cancelling one of the
+    callers does not cancel the call for the others. It is cancelled once
+    every caller went away, e.g. when their deadlines passed.
+
+    Example:
+        flights = AsyncSingleFlight()
+        # From any coroutine:
+        mp3_url = await flights.do(key, resolve, language, voice, text)
+
+    Attributes:
+        stats (FlightStats): The counters of the calls.
+
+    """
+
+    def __init__(self):
+        """Create a group with no call in flight."""
+        self.stats = FlightStats()
+        self._flights = {}
+        self._waiters = {}
+
+    async def do(self, key, function, *args):
+        """Await `function(*args)`, unless a call with `key` is running.
+
+        Args:
+            key: A hashable identifying the call.
+            function: The coroutine function to call.
+            *args: The arguments of `function`.
+
+        Returns:
+            The result of `function`, possibly from the call of another
+            caller. Its exception is raised in every caller that waited
+            for it.
+
+        """
+        self.stats.calls += 1
+        task = self._flights.get(key)
+        if task is not None:
+            self.stats.deduplicated += 1
+        else:
+            task = asyncio.ensure_future(function(*args))
+            self._flights[key] = task
+            self.stats.flights += 1
+            task.add_done_callback(
+                lambda task: self._forget(key, task))
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # Nobody waits for the result anymore.
+                task.cancel()
+
+    def _forget(self, key, task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved, even if every caller went away.
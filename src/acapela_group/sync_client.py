@@ -0,0 +1,458 @@
+"""Synchronous client, a facade over the asynchronous one.
+
+`AcapelaGroup` runs an `AcapelaGroupAsync`, its engine, on an event loop of
+its own in a background thread (see the `loop` module), so both clients
+share the same code for the login, the forms, the parsing, the caches and
+the connections. aiohttp is only imported when the engine opens its
+session, so that importing this module does not cost its import time.
+"""
+import functools
+import weakref
+
+from .async_client import AcapelaGroupAsync
+from .batch import DEFAULT_CONCURRENCY, imap_threaded, map_on_loop
+from .common import DEFAULT_BASE_URL
+from .download import DEFAULT_CHUNK_SIZE, open_destination
+from .exceptions import AcapelaGroupError
+from .longtext import DEFAULT_MAX_LENGTH, split_text
+from .loop import LoopThread
+from .mp3 import audio_frames
+
+
+class _Engine(AcapelaGroupAsync):
+    """The engine of an `AcapelaGroup`."""
+
+    _metrics_label = 'sync'
+
+
+def _close(loop, engine):
+    """Close the session of `engine`, then stop `loop`."""
+    if loop.running:
+        loop.run(engine.close)
+    loop.close()
+
+
+class AcapelaGroup:
+    """Client class for Acapela Group website interaction.
+
+    The client can be used from several threads at once: the calls of every
+    thread run concurrently on the event loop of the client, over the same
+    authenticated session and pool of connections. The `submit` methods
+    return a `concurrent.futures.Future` instead of waiting for the result.
+
+    The event loop thread is started on first use, and stopped by `close`,
+    or when the client is garbage collected or the interpreter exits.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, cache=None,
+                 max_workers=DEFAULT_CONCURRENCY, session_store=None,
+                 policy=None, metrics=None, voices=None, audio_store=None,
+                 connections=None, scheduler=None, hedging=None,
+                 endpoints=None, auth=None):
+        """Create an AcapelaGroup session handler.
+
+        Args:
+            base_url (str): The url of the website.
+            cache: An optional cache for the resolved mp3 urls (see the
+                `cache` module).
+            max_workers (int): How many requests the batch methods may have
+                in flight by default. Defaults to `DEFAULT_CONCURRENCY`.
+            session_store (SessionStore): An optional store to reuse the
+                authenticated sessions of other processes (see the
+                `sessions` module).
+            policy (Policy): An optional policy for the timeouts, retries,
+                rate limiting and circuit breaking of the requests (see the
+                `policy` module).
+            metrics (Metrics): Optional metrics to report the timings,
+                errors and counters of the client to (see the `metrics`
+                module).
+            voices (VoiceCatalog): An optional catalog to check the voices
+                against before sending the requests, and to remember the
+                requests which failed (see the `voices` module).
+            audio_store (AudioStore): An optional store of the generated
+                mp3s, so that the same text is never synthesized twice (see
+                the `audio` module).
+            connections (ConnectionConfig): The settings of the pool of
+                connections (see the `connections` module). Defaults to
+                `ConnectionConfig()`.
+            scheduler (Scheduler): An optional scheduler deciding which
+                requests are sent first, by priority class and by caller
+                (see the `scheduler` module).
+            hedging (HedgingPolicy): An optional policy sending a duplicate
+                of the text-to-speech requests which are slow to answer
+                (see the `hedging` module).
+            endpoints (EndpointSet): Optional endpoints of the website to
+                spread the requests over, in place of `base_url` (see the
+                `endpoints` module). The ejected endpoints are probed on the
+                event loop of the client.
+            auth (AuthManager): The manager running the logins one at a
+                time (see the `auth` module). The threads of the client
+                share it. Defaults to an `AuthManager()` of the client.
+
+        """
+        self._engine = _Engine(
+            base_url=base_url, cache=cache, session_store=session_store,
+            policy=policy, metrics=metrics, voices=voices,
+            audio_store=audio_store, scheduler=scheduler,
+            connections=connections, hedging=hedging, endpoints=endpoints,
+            auth=auth)
+        self._max_workers = max_workers
+        self._loop = LoopThread()
+        self._finalizer = weakref.finalize(self, _close, self._loop,
+                                           self._engine)
+
+    def __enter__(self):
+        """Open the connections to warm up, if any, and return the client."""
+        self._loop.run(self._engine.open)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Close the client."""
+        self.close()
+
+    def close(self):
+        """Close every connection and stop the event loop thread.
+
+        The client may be used again afterwards, with a new session which
+        is not authenticated.
+        """
+        _close(self._loop, self._engine)
+
+    def warm_up(self, count=None):
+        """Open connections to the website in advance.
+
+        See `AcapelaGroupAsync.warm_up`.
+
+        Returns:
+            int: How many connections were opened.
+
+        """
+        return self._loop.run(self._engine.warm_up, count)
+
+    @property
+    def base_url(self):
+        """str: Get the base url of the instance.
+
+        Being able to set the base url can be useful for testing purposes. The
+        base url cannot be changed once the instance has been created.
+        """
+        return self._engine.base_url
+
+    @property
+    def flight_stats(self):
+        """Get the counters of the coalesced requests.
+
+        Returns:
+            FlightStats: How many `get_mp3_url` calls were made, and how
+                many of them shared the request of an identical call.
+
+        """
+        return self._engine.flight_stats
+
+    def build_url(self, path=''):
+        """Build a full URL with `self.base_url` and `path`.
+
+        See `AcapelaGroupAsync.build_url`.
+        """
+        return self._engine.build_url(path)
+
+    def fetch_voices(self, *, deadline=None):
+        """Fetch the voices of each language from the website.
+
+        Example:
+            catalog = VoiceCatalog.load()
+            catalog.update(acapela_group.fetch_voices())
+            catalog.save()
+
+        Args:
+            deadline (float): A `time.monotonic()` timestamp by which the
+                voices must be fetched. Defaults to no deadline.
+
+        Raises:
+            NeedsUpdateError: The website does not list the voices.
+            DeadlineExceededError: The voices were not fetched by
+                `deadline`.
+
+        Returns:
+            dict: The voices of each language, by language code.
+
+        """
+        return self._loop.run(self._engine.fetch_voices, deadline=deadline)
+
+    def get_mp3_url(self, language, voice, text, priority=None,
+                    caller=None, *, deadline=None):
+        """Retrieve the mp3 url associated to the settings.
+
+        To see the list of supported languages, check the `language` module.
+
+        Args:
+            language (str): The language to use for the acapela.
+            voice (str): The voice name to use for the acapela.
+            text (str): the text to translate to speech.
+            priority (str): The priority class of the request, if the client
+                has a scheduler. Defaults to its default class.
+            caller: A hashable identifying the caller, so that the scheduler
+                shares the slots of a class fairly between callers.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                call must be over. It is shared by every step of the call:
+                waiting for a slot, logging in again, sending the form and
+                reading the answer. Defaults to no deadline.
+
+        Raises:
+            NeedsUpdateError: The module needs an update since the mp3
+                url could not have been extracted, somehow.
+            VoiceNotSupportedError: The voice catalog of the client does
+                not have this voice for this language.
+            DeadlineExceededError: The call was not over by `deadline`.
+
+        Returns:
+            str: An HTTP url pointing to the generated mp3.
+
+        """
+        return self._loop.run(self._engine.get_mp3_url, language, voice,
+                              text, priority=priority, caller=caller,
+                              deadline=deadline)
+
+    def submit(self, language, voice, text, priority=None, caller=None, *,
+               deadline=None):
+        """Retrieve the mp3 url associated to the settings in the background.
+
+        See `get_mp3_url` for the arguments.
+
+        Returns:
+            concurrent.futures.Future: A future holding the mp3 url.
+
+        """
+        return self._loop.submit(self._engine.get_mp3_url, language, voice,
+                                 text, priority=priority, caller=caller,
+                                 deadline=deadline)
+
+    def get_mp3_urls(self, items, concurrency=None, ordered=True,
+                     priority=None, caller=None, *, deadline=None):
+        """Retrieve the mp3 urls of many requests concurrently.
+
+        The requests are consumed lazily, from the calling thread, and at
+        most `concurrency` of them are in flight at once. A request failing
+        with an `AcapelaGroupError` (e.g. `NeedsUpdateError` or
+        `LanguageNotSupportedError`) does not abort the batch: its result
+        carries the error instead.
+
+        Example:
+            for result in acapela.get_mp3_urls(items):
+                if result.ok:
+                    print(result.url)
+
+        Args:
+            items: An iterable of (language, voice, text) sequences.
+            concurrency (int): How many requests may be in flight at once.
+                Defaults to the `max_workers` of the client.
+            ordered (bool): Whether to yield the results in the input
+                order. Otherwise, they are yielded as soon as they are ready.
+                Defaults to True.
+            priority (str): The priority class of the requests (see
+                `get_mp3_url`).
+            caller: A hashable identifying the caller (see `get_mp3_url`).
+            deadline (float): A `time.monotonic()` timestamp by which every
+                request must be over. The requests still running then fail
+                with `DeadlineExceededError`.
+
+        Returns:
+            An iterator of `BatchResult`.
+
+        """
+        return map_on_loop(
+            self._loop,
+            functools.partial(self._engine.get_mp3_url, priority=priority,
+                              caller=caller, deadline=deadline),
+            items, concurrency or self._max_workers, ordered=ordered,
+            errors=(AcapelaGroupError,))
+
+    def download_mp3(self, url, destination, chunk_size=DEFAULT_CHUNK_SIZE,
+                     *, deadline=None):
+        """Download the mp3 located at `url` to `destination`.
+
+        The mp3 is streamed by chunks, so it is never held in memory as a
+        whole. When `destination` is a path, the file is written
+        atomically.
+
+        Args:
+            url (str): The mp3 url, as returned by `get_mp3_url`.
+            destination: A path, a binary file object, or '-' for the
+                standard output.
+            chunk_size (int): The size of the chunks to read and write.
+                Defaults to `DEFAULT_CHUNK_SIZE`.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                whole mp3 must be downloaded. Defaults to no deadline.
+
+        Raises:
+            DownloadError: The website did not serve the mp3.
+            DeadlineExceededError: The download was not over by
+                `deadline`.
+
+        Returns:
+            int: The size of the mp3, in bytes.
+
+        """
+        return self._loop.run(self._engine.download_mp3, url, destination,
+                              chunk_size, deadline=deadline)
+
+    def synthesize(self, language, voice, text, destination, *,
+                   deadline=None):
+        """Generate the mp3 associated to the settings into `destination`.
+
+        This is `get_mp3_url` followed by `download_mp3`. If the client has
+        an audio store, the mp3 is copied from it when it is there, and
+        stored into it otherwise. The `deadline` is shared by every step,
+        the reads and writes of the store included.
+
+        Returns:
+            str: The url of the mp3, or None if it came from the audio
+                store.
+
+        """
+        return self._loop.run(self._engine.synthesize, language, voice, text,
+                              destination, deadline=deadline)
+
+    def submit_synthesize(self, language, voice, text, destination, *,
+                          deadline=None):
+        """Generate the mp3 associated to the settings in the background.
+
+        See `synthesize`.
+
+        Returns:
+            concurrent.futures.Future: A future holding the url of the mp3,
+                or None if it came from the audio store.
+
+        """
+        return self._loop.submit(self._engine.synthesize, language, voice,
+                                 text, destination, deadline=deadline)
+
+    def download_mp3s(self, items, destination_for, concurrency=None,
+                      ordered=True, priority=None, caller=None, *,
+                      deadline=None):
+        """Generate the mp3s of many requests and download them.
+
+        The urls are resolved as in `get_mp3_urls`, ahead of the downloads:
+        while an mp3 is being downloaded, the next urls are being resolved.
+
+        Args:
+            items: An iterable of (language, voice, text) sequences.
+            destination_for: A function taking a `BatchRequest` and returning
+                the destination of its mp3 (see `download_mp3`).
+            concurrency (int): How many urls may be resolved at once.
+                Defaults to the `max_workers` of the client.
+            ordered (bool): Whether to process the requests in the input
+                order. Defaults to True.
+            priority (str): The priority class of the requests (see
+                `get_mp3_url`).
+            caller: A hashable identifying the caller (see `get_mp3_url`).
+            deadline (float): A `time.monotonic()` timestamp by which every
+                request, download included, must be over.
+
+        Yields:
+            BatchResult: The result of each request. If the download failed,
+                both its `url` and its `error` are set.
+
+        """
+        for result in self.get_mp3_urls(items, concurrency, ordered,
+                                        priority, caller, deadline=deadline):
+            if result.ok:
+                try:
+                    self.download_mp3(result.url,
+                                      destination_for(result.request),
+                                      deadline=deadline)
+                except AcapelaGroupError as exn:
+                    result = result._replace(error=exn)
+            yield result
+
+    def iter_long_mp3(self, language, voice, text,
+                      max_length=DEFAULT_MAX_LENGTH, concurrency=None, *,
+                      deadline=None):
+        """Generate the mp3 of a text of any length, piece by piece.
+
+        The text is split into chunks of at most `max_length` characters
+        (see `split_text`) which are synthesized concurrently. The audio
+        frames of each chunk are yielded in order as soon as they are
+        available, so the beginning of the mp3 can be played before the end
+        is generated. Joined together, the pieces make a single mp3.
+
+        Args:
+            language (str): The language to use for the acapela.
+            voice (str): The voice name to use for the acapela.
+            text (str): the text to translate to speech.
+            max_length (int): The maximum length of a chunk. Defaults to
+                `DEFAULT_MAX_LENGTH`.
+            concurrency (int): How many chunks may be synthesized at once.
+                Defaults to the `max_workers` of the client.
+            deadline (float): A `time.monotonic()` timestamp by which every
+                chunk must be synthesized. Defaults to no deadline.
+
+        Yields:
+            bytes: The mp3 data of each chunk.
+
+        Raises:
+            DeadlineExceededError: A chunk was not synthesized by
+                `deadline`.
+
+        """
+        chunks = split_text(text, max_length)
+        pieces = imap_threaded(
+            self._loop,
+            lambda chunk: self._engine._fetch_mp3(language, voice, chunk,
+                                                  deadline),
+            chunks, concurrency or self._max_workers)
+        for index, data in enumerate(pieces):
+            yield audio_frames(data, keep_tag=index == 0)
+
+    def synthesize_long(self, language, voice, text, destination,
+                        max_length=DEFAULT_MAX_LENGTH, concurrency=None, *,
+                        deadline=None):
+        """Generate the mp3 of a text of any length into `destination`.
+
+        See `iter_long_mp3` for the arguments. Each piece is flushed as soon
+        as it is written, so a player reading from a file object or from
+        the standard output can start before the whole mp3 is generated.
+        """
+        with open_destination(destination) as fileobj:
+            for data in self.iter_long_mp3(language, voice, text, max_length,
+                                           concurrency, deadline=deadline):
+                fileobj.write(data)
+                fileobj.flush()
+
+    def authenticate(self, username: str, password: str, *, deadline=None):
+        """Authenticate against the website using `login` and `password`.
+
+        The session will use the provided credentials to scrap the website.
+        It is useful mostly for retrieving sound with no background music
+        set when an anonymous user listens to a text-to-speech sound.
+
+        If the client has a session store holding a valid session for this
+        account, that session is reused and nothing is sent to the website.
+        Otherwise, the new session is saved into the store. Later requests
+        log in again transparently if the session expires.
+
+        Only one login of an account runs at a time: concurrent calls share
+        its outcome. After a lockout or refused credentials, the next calls
+        fail at once until the account cooled down (see the `auth` module).
+
+        To obtain some credentials, you must register here:
+        http://www.acapela-group.com/register/
+
+        Args:
+            username: The account's username used for registration.
+            password: The account's password used for registration.
+            deadline (float): A `time.monotonic()` timestamp by which the
+                login must be over. Defaults to no deadline.
+
+        Note:
+            Be careful: Acapela Group does not use HTTPS, so your credentials
+                are passing through networks as plain text. If no exception
+                is raised, then the authentication succeeded.
+
+        Raises:
+            AcapelaGroupError: something went wrong while authenticating.
+            DeadlineExceededError: The login was not over by `deadline`.
+
+        """
+        self._loop.run(self._engine.authenticate, username, password,
+                       deadline=deadline)
@@ -0,0 +1,311 @@
+"""A local stand-in for the Acapela Group website.
+
+`FakeAcapelaServer` answers the few pages the clients use (the login form,
+the text-to-speech form, with its lists of voices, and the generated mp3s)
+from a background thread,
+so that the clients, the command line and the benchmarks can be exercised
+over a real socket without reaching the website:
+
+    with FakeAcapelaServer(latency=0.05, error_rate=0.01) as server:
+        acapela_group = AcapelaGroup(base_url=server.url)
+        acapela_group.get_mp3_url('English (UK)', 'Rachel', 'Hello')
+
+The latency, the size of the pages and the rate of 5xx answers can be
+tuned to mimic the website.
+"""
+import hashlib
+import random
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .voices import VOICES
+
+
+LOGIN_PATH = '/wp-login.php'
+TTS_FORM_PATH = '/demo-tts/DemoHTML5Form_V2.php'
+SOUNDS_PATH = '/sounds/'
+
+DEFAULT_PAGE_SIZE = 32 * 1024
+DEFAULT_MP3_FRAMES = 40
+
+LOGGED_IN_COOKIE = 'wordpress_logged_in_fake'
+LOCKED_OUT_TEXT = ("You have been locked out due to "
+                   "too many invalid login attempts.")
+
+# An MPEG-1 layer III frame header: 128 kbps, 44100 Hz, no padding.
+_MP3_FRAME_HEADER = b'\xff\xfb\x90\x00'
+_MP3_FRAME_LENGTH = 417
+
+
+def make_mp3(frames=DEFAULT_MP3_FRAMES, seed=b''):
+    """Build a silent but well-formed mp3.
+
+    Args:
+        frames (int): How many audio frames the mp3 holds (each lasts about
+            26 ms).
+        seed (bytes): Some bytes making the mp3 unique.
+
+    Returns:
+        bytes: The mp3.
+
+    """
+    payload = hashlib.sha256(seed).digest()
+    payload = payload.ljust(_MP3_FRAME_LENGTH - len(_MP3_FRAME_HEADER),
+                            b'\x00')
+    return (_MP3_FRAME_HEADER + payload) * frames
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Connections are kept alive.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.fake._count_connection()
+
+    def _read_form(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        return {key: values[0] for key, values in parse_qs(body).items()}
+
+    def _send(self, status, body=b'', headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _before(self, path):
+        """Apply the latency and the errors; return whether to go on."""
+        server = self.server.fake
+        server._count(path)
+        if server.latency:
+            time.sleep(server.latency)
+        if server._fails():
+            self._send(503, b'Service Unavailable')
+            return False
+        return True
+
+    def do_POST(self):  # noqa: N802
+        path = urlparse(self.path).path
+        form = self._read_form()
+        if not self._before(path):
+            return
+
+        if path == LOGIN_PATH:
+            self._login(form)
+        elif path == TTS_FORM_PATH:
+            self._tts_form(form)
+        else:
+            self._send(404, b'Not Found')
+
+    def do_HEAD(self):  # noqa: N802
+        if self._before(urlparse(self.path).path):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def do_GET(self):  # noqa: N802
+        path = urlparse(self.path).path
+        if not self._before(path):
+            return
+
+        if path.startswith(SOUNDS_PATH):
+            name = path[len(SOUNDS_PATH):]
+            self._send(200, make_mp3(self.server.fake.mp3_frames,
+                                     name.encode('utf-8')),
+                       [('Content-Type', 'audio/mpeg')])
+        elif path == TTS_FORM_PATH:
+            self._send(200, self._voices_form(),
+                       [('Content-Type', 'text/html; charset=utf-8')])
+        else:
+            self._send(200, b'<html><body>Acapela Group</body></html>',
+                       [('Content-Type', 'text/html')])
+
+    def _login(self, form):
+        server = self.server.fake
+        if server.locked_out:
+            self._send(200, LOCKED_OUT_TEXT.encode('utf-8'))
+            return
+
+        username, password = form.get('log'), form.get('pwd')
+        if server.accounts is not None and \
+                server.accounts.get(username) != password:
+            self._send(302, headers=[
+                ('Location',
+                 server.url + '/login/?the_error=incorrect_password')])
+            return
+
+        self._send(302, headers=[
+            ('Location', form.get('redirect_to') or server.url + '/'),
+            ('Set-Cookie', '{}={}; Path=/; HttpOnly'.format(
+                LOGGED_IN_COOKIE, username)),
+        ])
+
+    def _voices_form(self):
+        selects = ''.join(
+            '<select id="{}">{}</select>'.format(language_code, ''.join(
+                '<option value="{0}">{0}</option>'.format(voice)
+                for voice in voices))
+            for language_code, voices in sorted(
+                self.server.fake.voices.items()))
+        return '<html><body><form>{}</form></body></html>'.format(
+            selects).encode('utf-8')
+
+    def _tts_form(self, form):
+        server = self.server.fake
+        voices = server.voices.get(form.get('MyLanguages'))
+        if voices is not None and form.get('MySelectedVoice', '').lower() \
+                not in {voice.lower() for voice in voices}:
+            # The website answers a page without any mp3 url.
+            self._send(200, b' ' * server.page_size,
+                       [('Content-Type', 'text/html; charset=utf-8')])
+            return
+
+        key = '\x1f'.join(form.get(name, '') for name in (
+            'MyLanguages', 'MySelectedVoice', 'MyTextForTTS'))
+        authenticated = LOGGED_IN_COOKIE in (self.headers.get('Cookie') or '')
+        name = '{}{}.mp3'.format(
+            hashlib.sha1(key.encode('utf-8')).hexdigest(),
+            '' if authenticated else '-music')
+        script = "<script>var myPhpVar = '{}{}{}';</script>".format(
+            server.url, SOUNDS_PATH, name).encode('utf-8')
+
+        # The url is in the middle of the page, as on the website.
+        filler = max(0, server.page_size - len(script))
+        body = b' ' * (filler // 2) + script + b' ' * (filler - filler // 2)
+        self._send(200, body, [('Content-Type', 'text/html; charset=utf-8')])
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # The clients drop the connections of the requests they cancel.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeAcapelaServer:
+    """A fake Acapela Group website, served from a background thread.
+
+    Args:
+        latency (float): How many seconds each request takes. Defaults
+            to 0.
+        page_size (int): The size of the text-to-speech form pages, in
+            bytes. Defaults to `DEFAULT_PAGE_SIZE`.
+        error_rate (float): The probability, between 0 and 1, that a
+            request gets a 503 answer. Defaults to 0.
+        mp3_frames (int): How many frames the mp3s hold. Defaults to
+            `DEFAULT_MP3_FRAMES`.
+        accounts (dict): The valid passwords by username, or None to accept
+            any credentials.
+        voices (dict): The voices of each language, by language code.
+            Defaults to `acapela_group.voices.VOICES`. Other voices get a
+            page without any mp3 url.
+        seed: The seed of the errors, for reproducible runs.
+
+    Attributes:
+        locked_out (bool): Whether logins are refused for too many
+            attempts.
+
+    """
+
+    def __init__(self, latency=0.0, page_size=DEFAULT_PAGE_SIZE,
+                 error_rate=0.0, mp3_frames=DEFAULT_MP3_FRAMES,
+                 accounts=None, voices=None, seed=None):
+        """Create a server, without starting it."""
+        self.latency = latency
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.mp3_frames = mp3_frames
+        self.accounts = accounts
+        self.voices = VOICES if voices is None else voices
+        self.locked_out = False
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._connections = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Get the base url of the server.
+
+        The host is `localhost` rather than an IP address, since aiohttp
+        ignores the cookies set by IP addresses.
+
+        Returns:
+            str: The url, to be used as the `base_url` of the clients.
+
+        """
+        return 'http://localhost:{}'.format(self._server.server_address[1])
+
+    def requests(self, path=None):
+        """Return how many requests were received.
+
+        Args:
+            path (str): Only count the requests for this path, e.g.
+                `TTS_FORM_PATH`. Defaults to every path.
+
+        Returns:
+            int: The number of requests.
+
+        """
+        with self._lock:
+            if path is None:
+                return sum(self._counts.values())
+            return self._counts.get(path, 0)
+
+    @property
+    def connections(self):
+        """int: Get how many connections were accepted."""
+        with self._lock:
+            return self._connections
+
+    def _count_connection(self):
+        with self._lock:
+            self._connections += 1
+
+    def _count(self, path):
+        with self._lock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+
+    def _fails(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def start(self):
+        """Listen on a free port of the loopback interface."""
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        kwargs={'poll_interval': 0.05},
+                                        name='fake-acapela-server',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        """Start the server."""
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """Stop the server."""
+        self.stop()
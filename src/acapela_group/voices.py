@@ -0,0 +1,274 @@
+"""Catalog of the voices of each language.
+
+The website only tells that a voice does not speak a language by answering
+a page without any mp3 url, which costs a full round-trip and ends up as a
+`NeedsUpdateError`. A `VoiceCatalog` given to a client checks the language
+and the voice before anything is sent:
+
+    acapela_group = AcapelaGroup(voices=VoiceCatalog.load())
+
+It also remembers the requests which failed anyway for a while (a negative
+cache), so that sending them again fails at once.
+
+`VOICES` is the catalog built into the package. A fresher one can be
+fetched from the website with the `fetch_voices` method of the clients, and
+saved to disk with `VoiceCatalog.save`.
+"""
+import json
+import os
+import re
+import tempfile
+import time
+
+from .cache import MemoryCache
+from .common import get_language_code
+from .exceptions import NeedsUpdateError, VoiceNotSupportedError
+
+
+# How many seconds a failing request is answered from the negative cache.
+DEFAULT_FAILURE_TTL = 10 * 60
+
+# The voices of each language, by language code (see `language.py`).
+VOICES = {
+    'sonid0': ('Leila', 'Mehdi', 'Nizar', 'Salma'),
+    'sonid1': ('Laia',),
+    'sonid2': ('Eliska',),
+    'sonid3': ('Mette', 'Rasmus'),
+    'sonid4': ('Jeroen', 'Sofie', 'Zoe'),
+    'sonid5': ('Daan', 'Femke', 'Jasmijn', 'Max'),
+    'sonid6': ('Lisa', 'Tyler'),
+    'sonid7': ('Deepa',),
+    'sonid8': ('Rhona',),
+    'sonid9': ('Graham', 'Harry', 'Lucy', 'Nizareng', 'Peter', 'PeterHappy',
+               'PeterSad', 'QueenElizabeth', 'Rachel', 'Rosie'),
+    'sonid10': ('Heather', 'Karen', 'Kenny', 'Laura', 'Micah', 'Nelly', 'Rod',
+                'Ryan', 'Saul', 'Sharon', 'Tracy', 'Will', 'WillBadGuy',
+                'WillFromAfar', 'WillHappy', 'WillLittleCreature',
+                'WillOldMan', 'WillSad', 'WillUpClose'),
+    'sonid11': ('Hanna',),
+    'sonid12': ('Sanna',),
+    'sonid13': ('Justine', 'Manon-be'),
+    'sonid14': ('Louise',),
+    'sonid15': ('Alice', 'Antoine', 'AntoineFromAfar', 'AntoineHappy',
+                'AntoineSad', 'AntoineUpClose', 'Bruno', 'Claire', 'Julie',
+                'Manon', 'Margaux', 'MargauxHappy', 'MargauxSad', 'Robot'),
+    'sonid16': ('Andreas', 'Claudia', 'Julia', 'Klaus', 'Sarah'),
+    'sonid17': ('Dimitris',),
+    'sonid18': ('Chiara', 'Fabiana', 'Vittorio'),
+    'sonid19': ('Sakura',),
+    'sonid20': ('Minji',),
+    'sonid21': ('Lulu',),
+    'sonid22': ('Bente', 'Kari', 'Olav'),
+    'sonid23': ('Ania',),
+    'sonid24': ('Marcia',),
+    'sonid25': ('Celia',),
+    'sonid26': ('Alyona',),
+    'sonid27': ('Biera',),
+    'sonid28': ('Antonio', 'Ines', 'Maria'),
+    'sonid29': ('Rodrigo', 'Rosa'),
+    'sonid30': ('Elin', 'Emil', 'Emma', 'Erik'),
+    'sonid31': ('Samuel',),
+    'sonid32': ('Kal',),
+    'sonid33': ('Mia',),
+    'sonid34': ('Ipek',),
+}
+
+# The website labels some voices with a description, e.g.
+# 'AntoineFromAfar (emotive voice)'.
+_DESCRIPTION_PATTERN = re.compile(r'\s*\(.*\)\s*$')
+
+# The text-to-speech form has a list of voices per language code.
+_SELECT_PATTERN = re.compile(
+    r'<select[^>]*\bid=["\'](sonid\d+)["\'][^>]*>(.*?)</select>',
+    re.IGNORECASE | re.DOTALL)
+_OPTION_PATTERN = re.compile(r'<option[^>]*\bvalue=["\']([^"\']+)["\']',
+                             re.IGNORECASE)
+
+
+def default_voices_path():
+    """Return the default path of the saved catalog.
+
+    It is `acapela-group/voices.json` in `$XDG_CACHE_HOME` (`~/.cache` by
+    default).
+
+    Returns:
+        str: The path.
+
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'acapela-group', 'voices.json')
+
+
+def _voice_key(voice):
+    """Return the name of a voice without its description, lowercased."""
+    return _DESCRIPTION_PATTERN.sub('', voice).lower()
+
+
+def parse_voices(html):
+    """Extract the voices of each language from the text-to-speech form.
+
+    Args:
+        html (str): The page of the form.
+
+    Raises:
+        NeedsUpdateError: The page does not list any voice.
+
+    Returns:
+        dict: The voices of each language, by language code.
+
+    """
+    voices = {}
+    for language_code, options in _SELECT_PATTERN.findall(html):
+        names = tuple(_OPTION_PATTERN.findall(options))
+        if names:
+            voices[language_code] = names
+    if not voices:
+        raise NeedsUpdateError("Could not find the list of voices. "
+                               "The module might need an update.")
+    return voices
+
+
+class VoiceCatalog:
+    """The voices of each language, and the requests known to fail.
+
+    Voices are compared regardless of their case and of their description,
+    so 'AntoineFromAfar (emotive voice)' is the voice 'AntoineFromAfar'.
+    Languages missing from the catalog are not checked.
+
+    Args:
+        voices (dict): The voices of each language, by language code.
+            Defaults to `VOICES`.
+        validate (bool): Whether to check the voices before sending the
+            requests. Otherwise, only the negative cache is used. Defaults
+            to True.
+        failure_ttl (float): How many seconds a failing request is answered
+            from the negative cache. Defaults to `DEFAULT_FAILURE_TTL`.
+        max_failures (int): How many failing requests are remembered.
+            Defaults to 1024.
+
+    """
+
+    def __init__(self, voices=None, validate=True,
+                 failure_ttl=DEFAULT_FAILURE_TTL, max_failures=1024):
+        """Create a catalog."""
+        self.validate = validate
+        self._voices = {}
+        self._index = {}
+        self.update(VOICES if voices is None else voices)
+        self._failures = MemoryCache(max_entries=max_failures,
+                                     ttl=failure_ttl)
+
+    @property
+    def failure_stats(self):
+        """CacheStats: Get the counters of the negative cache."""
+        return self._failures.stats
+
+    def update(self, voices):
+        """Replace the voices of the languages in `voices`.
+
+        Args:
+            voices (dict): The voices of each language, by language code,
+                e.g. as returned by `parse_voices`.
+
+        """
+        for language_code, names in voices.items():
+            self._voices[language_code] = tuple(names)
+            self._index[language_code] = frozenset(
+                _voice_key(name) for name in names)
+
+    def as_dict(self):
+        """Return the voices of each language, by language code."""
+        return dict(self._voices)
+
+    def voices_for(self, language):
+        """Return the voices of a language.
+
+        Raises:
+            LanguageNotSupportedError: The language is not supported.
+
+        Returns:
+            tuple: The names of the voices, empty if the language is not in
+                the catalog.
+
+        """
+        return self._voices.get(get_language_code(language), ())
+
+    def check_voice(self, language_code, voice):
+        """Check that `voice` speaks a language, if validating.
+
+        Args:
+            language_code (str): The code of the language, e.g. 'sonid15'.
+            voice (str): The name of the voice.
+
+        Raises:
+            VoiceNotSupportedError: The voice does not speak the language.
+
+        """
+        if not self.validate:
+            return
+        names = self._index.get(language_code)
+        if names is not None and _voice_key(voice) not in names:
+            raise VoiceNotSupportedError(
+                "The voice {} is not available for this language. Try one "
+                "of: {}.".format(voice,
+                                 ', '.join(self._voices[language_code])))
+
+    def check_failure(self, key):
+        """Raise the error of a request which failed recently, if any.
+
+        Args:
+            key (str): The cache key of the request (see `make_key`).
+
+        Raises:
+            NeedsUpdateError: The request failed less than `failure_ttl`
+                seconds ago.
+
+        """
+        message = self._failures.get(key)
+        if message is not None:
+            raise NeedsUpdateError(message)
+
+    def add_failure(self, key, message):
+        """Remember that a request failed with `message`."""
+        self._failures.set(key, message)
+
+    def save(self, path=None):
+        """Write the voices to a JSON file, atomically.
+
+        Args:
+            path (str): The path of the file. Defaults to
+                `default_voices_path()`.
+
+        """
+        path = path or default_voices_path()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'w') as fileobj:
+                json.dump({'updated_at': time.time(),
+                           'voices': self._voices}, fileobj)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    @classmethod
+    def load(cls, path=None, **kwargs):
+        """Create a catalog from `VOICES` updated by a saved one.
+
+        Args:
+            path (str): The path of the file. Defaults to
+                `default_voices_path()`. A missing or corrupt file is
+                ignored.
+            **kwargs: The other arguments of `VoiceCatalog`.
+
+        """
+        catalog = cls(**kwargs)
+        try:
+            with open(path or default_voices_path()) as fileobj:
+                catalog.update(json.load(fileobj)['voices'])
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        return catalog
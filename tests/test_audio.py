@@ -0,0 +1,208 @@
+import io
+import os
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from acapela_group.audio import AudioStore, default_audio_path
+from acapela_group.base import AcapelaGroup, AcapelaGroupAsync
+from acapela_group.cache import make_key
+from acapela_group.testing import TTS_FORM_PATH, FakeAcapelaServer
+
+
+def test_default_audio_path(monkeypatch):
+    """Test the `default_audio_path` function."""
+    monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/cache')
+    assert default_audio_path() == '/tmp/cache/acapela-group/audio'
+
+
+def test_audio_store(tmpdir):
+    """Test the `AudioStore` class."""
+    store = AudioStore(str(tmpdir.join('audio')))
+    assert store.get('a') is None
+    assert store.open('a') is None
+
+    store.set('a', b'ID3 first')
+    store.set('b', b'ID3 first')  # The same content is stored once.
+    store.set('c', b'ID3 second')
+    assert 'a' in store
+    assert len(store) == 3
+    assert store.size == len(b'ID3 first') + len(b'ID3 second')
+
+    with store.open('b') as data:
+        assert data[:] == b'ID3 first'
+    assert store.get('c') == b'ID3 second'
+
+    # Another instance (think another process) sees the same mp3s.
+    other_store = AudioStore(str(tmpdir.join('audio')))
+    assert other_store.get('a') == b'ID3 first'
+
+    with pytest.raises(ValueError):
+        store.set('d', b'')
+    assert 'd' not in store
+
+    store.clear()
+    assert len(store) == 0
+    assert store.size == 0
+    assert store.stats.hits == 2
+    assert store.stats.misses == 2
+    store.close()
+    other_store.close()
+
+
+def test_audio_store_eviction(tmpdir):
+    """Test that `AudioStore` evicts the least recently used mp3s."""
+    store = AudioStore(str(tmpdir), max_size=20)
+    store.set('a', b'a' * 8)
+    store.set('b', b'b' * 8)
+    assert store.get('a')  # 'b' is now the least recently used.
+
+    store.set('c', b'c' * 8)
+    assert 'b' not in store
+    assert store.size == 16
+    assert store.stats.evictions == 1
+
+    # The last mp3 is kept, even if it is too large.
+    store.set('d', b'd' * 30)
+    assert store.get('d') == b'd' * 30
+    assert len(store) == 1
+
+    with pytest.raises(ValueError):
+        AudioStore(str(tmpdir), max_size=0)
+
+
+def test_audio_store_overwrite(tmpdir):
+    """Test that storing another mp3 for a key removes the former one."""
+    store = AudioStore(str(tmpdir))
+    store.set('a', b'a' * 8)
+    store.set('b', b'b' * 8)
+    store.set('c', b'b' * 8)
+
+    store.set('a', b'A' * 8)
+    assert store.get('a') == b'A' * 8
+    assert store.size == 16
+    blobs = [name for directory in os.listdir(str(tmpdir.join('objects')))
+             for name in os.listdir(str(tmpdir.join('objects', directory)))]
+    assert len(blobs) == 2
+
+    # An mp3 shared with another key stays.
+    store.set('b', b'B' * 8)
+    assert store.get('c') == b'b' * 8
+    assert store.size == 24
+    assert store.stats.evictions == 0
+    store.close()
+
+
+def test_audio_store_copy_to(tmpdir):
+    """Test the `copy_to` method of the `AudioStore` class."""
+    store = AudioStore(str(tmpdir.join('audio')))
+    assert store.copy_to('a', io.BytesIO()) is None
+
+    with store.writer('a') as fileobj:
+        fileobj.write(b'ID3')
+        fileobj.write(b'data')
+
+    path = str(tmpdir.join('sound.mp3'))
+    assert store.copy_to('a', path) == 7
+    with open(path, 'rb') as fileobj:
+        assert fileobj.read() == b'ID3data'
+
+    buffer = io.BytesIO()
+    assert store.copy_to('a', buffer) == 7
+    assert buffer.getvalue() == b'ID3data'
+
+    # An interrupted download is not stored.
+    with pytest.raises(RuntimeError):
+        with store.writer('b') as fileobj:
+            fileobj.write(b'ID3')
+            raise RuntimeError
+    assert 'b' not in store
+    assert not [name for name in os.listdir(str(tmpdir.join('audio',
+                                                            'objects')))
+                if name.endswith('.part')]
+
+
+def test_read_through(tmpdir):
+    """Test that the clients synthesize each text only once."""
+    store = AudioStore(str(tmpdir.join('audio')))
+    with FakeAcapelaServer(page_size=1000) as server:
+        with AcapelaGroup(base_url=server.url, audio_store=store) as acapela:
+            for name in ('a.mp3', 'b.mp3'):
+                acapela.synthesize('French (France)', 'Manon', 'Bonjour',
+                                   str(tmpdir.join(name)))
+            assert server.requests(TTS_FORM_PATH) == 1
+            assert tmpdir.join('a.mp3').read_binary() == \
+                tmpdir.join('b.mp3').read_binary()
+
+            acapela.synthesize_long('French (France)', 'Manon', 'Bonjour',
+                                    str(tmpdir.join('long.mp3')))
+            assert server.requests(TTS_FORM_PATH) == 1
+
+    assert store.get(make_key('sonid15', 'Manon', 'Bonjour'))
+
+
+@pytest.mark.asyncio
+async def test_read_through_async(tmpdir):
+    """Test that the asynchronous client uses its audio store."""
+    store = AudioStore(str(tmpdir.join('audio')))
+    with FakeAcapelaServer(page_size=1000) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     audio_store=store) as acapela:
+            buffer = io.BytesIO()
+            assert await acapela.synthesize('French (France)', 'Manon',
+                                            'Bonjour', buffer)
+            assert await acapela.synthesize('French (France)', 'Manon',
+                                            'Bonjour', buffer) is None
+        assert server.requests(TTS_FORM_PATH) == 1
+
+
+@pytest.mark.asyncio
+async def test_read_through_async_executor(tmpdir):
+    """Test that the audio store is used out of the event loop."""
+    threads = set()
+
+    class SpyStore(AudioStore):
+        def _connection(self):
+            threads.add(threading.current_thread())
+            return super()._connection()
+
+    store = SpyStore(str(tmpdir.join('audio')))
+    threads.clear()
+    with FakeAcapelaServer(page_size=1000) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     audio_store=store) as acapela:
+            for _ in range(2):
+                buffer = io.BytesIO()
+                await acapela.synthesize('French (France)', 'Manon',
+                                         'Bonjour', buffer)
+                assert buffer.getvalue()
+            buffer = io.BytesIO()
+            await acapela.synthesize_long('French (France)', 'Manon',
+                                          'Bonjour. Salut.', buffer)
+            assert buffer.getvalue()
+
+    assert threads and threading.current_thread() not in threads
+
+
+@pytest.mark.asyncio
+async def test_read_through_async_streams(tmpdir):
+    """Test that the mp3s are streamed into the store, not into memory."""
+    store = AudioStore(str(tmpdir.join('audio')))
+    with FakeAcapelaServer(page_size=1000) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     audio_store=store) as acapela:
+            with patch('acapela_group.async_client.io.BytesIO',
+                       side_effect=AssertionError):
+                await acapela.synthesize('French (France)', 'Manon',
+                                         'Bonjour',
+                                         str(tmpdir.join('a.mp3')))
+                data = await acapela._fetch_mp3('French (France)', 'Manon',
+                                                'Salut')
+
+    key = make_key('sonid15', 'Manon', 'Bonjour')
+    assert tmpdir.join('a.mp3').read_binary() == store.get(key)
+    assert data == store.get(make_key('sonid15', 'Manon', 'Salut'))
+    assert not [name for name in os.listdir(str(tmpdir.join('audio',
+                                                            'objects')))
+                if name.endswith('.part')]
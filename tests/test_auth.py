@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from acapela_group.auth import AuthManager
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+                                InvalidCredentialsError, NeedsUpdateError,
+                                TooManyInvalidLoginAttemptsError)
+from acapela_group.testing import LOGIN_PATH, FakeAcapelaServer
+
+
+def make_login(errors=()):
+    """Return a coroutine function raising `errors[n]` on its n-th call."""
+    calls = []
+
+    async def login(username, password):
+        calls.append((username, password))
+        await asyncio.sleep(0.01)
+        if len(calls) <= len(errors) and errors[len(calls) - 1] is not None:
+            raise errors[len(calls) - 1]('refused')
+
+    return login, calls
+
+
+@pytest.mark.asyncio
+async def test_auth_manager_coalesces():
+    """Test that concurrent logins of an account share a single one."""
+    auth = AuthManager()
+    login, calls = make_login()
+
+    await asyncio.gather(*(auth.login('foo', login, 'foo', 'bar')
+                           for _ in range(5)),
+                         auth.login('baz', login, 'baz', 'qux'))
+    assert sorted(calls) == [('baz', 'qux'), ('foo', 'bar')]
+    assert auth.stats.as_dict() == {
+        'calls': 6, 'logins': 2, 'failures': 0, 'refused': 0}
+
+
+@pytest.mark.asyncio
+async def test_auth_manager_cooldown():
+    """Test that the refused logins are not tried again right away."""
+    auth = AuthManager(cooldown=0.05, max_cooldown=0.08)
+    login, calls = make_login([InvalidCredentialsError,
+                               TooManyInvalidLoginAttemptsError,
+                               TooManyInvalidLoginAttemptsError,
+                               NeedsUpdateError])
+
+    with pytest.raises(InvalidCredentialsError):
+        await auth.login('foo', login, 'foo', 'bar')
+    with pytest.raises(InvalidCredentialsError) as exn:
+        await auth.login('foo', login, 'foo', 'bar')
+    assert 'Not trying again' in str(exn.value)
+    assert len(calls) == 1
+    assert 0 < auth.cooling_down('foo') <= 0.05
+
+    # Other credentials may be tried, but not after a lockout.
+    with pytest.raises(TooManyInvalidLoginAttemptsError):
+        await auth.login('foo', login, 'foo', 'baz')
+    with pytest.raises(TooManyInvalidLoginAttemptsError):
+        await auth.login('foo', login, 'foo', 'qux')
+    assert len(calls) == 2
+    assert auth.cooling_down('foo') > 0.05  # Doubled.
+
+    await asyncio.sleep(0.08)
+    with pytest.raises(TooManyInvalidLoginAttemptsError):
+        await auth.login('foo', login, 'foo', 'baz')
+    assert 0.05 < auth.cooling_down('foo') <= 0.08  # At most max_cooldown.
+
+    # Other errors do not cool the account down.
+    await asyncio.sleep(0.08)
+    with pytest.raises(NeedsUpdateError):
+        await auth.login('foo', login, 'foo', 'baz')
+    await auth.login('foo', login, 'foo', 'baz')
+    assert auth.cooling_down('foo') == 0
+    assert len(calls) == 5
+    assert auth.stats.as_dict() == {
+        'calls': 7, 'logins': 5, 'failures': 4, 'refused': 2}
+
+    with pytest.raises(ValueError):
+        AuthManager(cooldown=-1)
+    with pytest.raises(ValueError):
+        AuthManager(cooldown=10, max_cooldown=1)
+
+
+@pytest.mark.asyncio
+async def test_async_client_logs_in_once():
+    """Test that the requests finding the session expired log in once."""
+    auth = AuthManager()
+    with FakeAcapelaServer(accounts={'foo': 'bar'}, latency=0.02) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     auth=auth) as acapela:
+            await acapela.authenticate('foo', 'bar')
+
+            # The website ends the session.
+            acapela._http_session.cookie_jar.clear()
+            urls = await asyncio.gather(*(
+                acapela.get_mp3_url('French (France)', 'Manon', str(index))
+                for index in range(10)))
+            assert not any(url.endswith('-music.mp3') for url in urls)
+
+            # A lockout is not tried again.
+            server.locked_out = True
+            for _ in range(3):
+                with pytest.raises(TooManyInvalidLoginAttemptsError):
+                    await acapela.authenticate('foo', 'bar')
+
+        assert server.requests(LOGIN_PATH) == 3
+    assert auth.stats.refused == 2
+
+
+def test_sync_client_logs_in_once():
+    """Test that the threads finding the session expired log in once."""
+    with FakeAcapelaServer(accounts={'foo': 'bar'}, latency=0.02) as server:
+        with AcapelaGroup(base_url=server.url) as acapela:
+            acapela.authenticate('foo', 'bar')
+            acapela._engine._http_session.cookie_jar.clear()
+            futures = [acapela.submit('French (France)', 'Manon', str(index))
+                       for index in range(10)]
+            assert not any(future.result().endswith('-music.mp3')
+                           for future in futures)
+
+        assert server.requests(LOGIN_PATH) == 2
@@ -1,12 +1,24 @@
 import asyncio
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+import acapela_group
+from acapela_group.auth import AuthManager
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync, DownloadError,
                                 InvalidCredentialsError,
                                 LanguageNotSupportedError, NeedsUpdateError,
-                                TooManyInvalidLoginAttemptsError)
+                                NetworkError, TooManyInvalidLoginAttemptsError)
+from acapela_group.cache import MemoryCache, SQLiteCache, make_key
+from acapela_group.sessions import SessionStore
+from acapela_group.testing import (LOGGED_IN_COOKIE, LOGIN_PATH, TTS_FORM_PATH,
+                                   FakeAcapelaServer)
 
 
 class AsyncMock(MagicMock):
@@ -14,6 +26,25 @@ class AsyncMock(MagicMock):
         return super(AsyncMock, self).__call__(*args, **kwargs)
 
 
+class FakeAiohttpResponse:
+    """Minimal stand-in for an `aiohttp.ClientResponse`."""
+
+    def __init__(self, status, chunks):
+        self.status = status
+        self.content = MagicMock()
+        self.content.iter_chunked.return_value = self._iter(chunks)
+
+    async def _iter(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+
 def test_acapela_group_init():
     """Test the __init__ method of the `AcapelaGroup` class."""
     acapela = AcapelaGroup()
@@ -34,44 +65,39 @@ def test_acapela_build_url():
 
 def test_acapela_authenticate():
     """Test the authenticate method of the `AcapelaGroup` class."""
-    acapela = AcapelaGroup()
-    invalid_credentials_mock = MagicMock()
-    invalid_credentials_mock.headers = {
-        "Location":
-            "http://www.acapela-group.com/login/?the_error=incorrect_password"
-    }
-
-    needs_update_credentials_mock = MagicMock()
-
-    # Here, do not set the "Location" headers. It would mean that the
-    # AcapelaGroup class needs some update!
-    needs_update_credentials_mock.headers.__getitem__.side_effect = KeyError
-
-    success_mock = MagicMock()
-    success_mock.headers = {
-        "Location": "http://www.acapela-group.com/"
-    }
-
-    too_many_attempts_mock = MagicMock()
-    too_many_attempts_mock.text = ("You have been locked out due to "
-                                   "too many invalid login attempts.")
-
-    with patch('requests.sessions.Session.post') as post_method:
-        post_method.return_value = invalid_credentials_mock
+    def login_response(text='', location=None):
+        response = MagicMock(status=302 if location else 200)
+        response.text = AsyncMock(return_value=text)
+        response.headers = {} if location is None else {'Location': location}
+        return response
+
+    # No cooldown, so that each answer is sent to the website.
+    with AcapelaGroup(auth=AuthManager(cooldown=0)) as acapela, \
+            patch('aiohttp.ClientSession.post',
+                  new_callable=AsyncMock) as post_method:
+        post_method.return_value = login_response(
+            location="http://www.acapela-group.com/login/"
+                     "?the_error=incorrect_password")
         with pytest.raises(InvalidCredentialsError):
             acapela.authenticate("foo", "bar")
 
-        post_method.return_value = needs_update_credentials_mock
+        # No "Location" header: the AcapelaGroup class needs some update!
+        post_method.return_value = MagicMock(status=302, headers={})
+        post_method.return_value.text = AsyncMock(return_value='')
         with pytest.raises(NeedsUpdateError):
             acapela.authenticate("foo", "bar")
 
-        post_method.return_value = too_many_attempts_mock
+        post_method.return_value = login_response(
+            "You have been locked out due to "
+            "too many invalid login attempts.")
         with pytest.raises(TooManyInvalidLoginAttemptsError):
             acapela.authenticate("foo", "bar")
 
-        with patch('requests.sessions.Session.get') as get_method:
-            post_method.return_value = success_mock
-            get_method.return_value = None  # Just mock the get() call.
+        with patch('aiohttp.ClientSession.get',
+                   new_callable=AsyncMock) as get_method:
+            get_method.return_value = MagicMock()  # Just mock the get() call.
+            post_method.return_value = login_response(
+                location="http://www.acapela-group.com/")
 
             # Should run without any trouble!
             acapela.authenticate("foo", "bar")
@@ -79,27 +105,24 @@ def test_acapela_authenticate():
 
 def test_get_mp3_url():
     """Test the `get_mp3_url` method of the `AcapelaGroup` class."""
-    acapela = AcapelaGroup()
-
-    mp3_url_mock = MagicMock()
-    mp3_url_mock.text = "var myPhpVar = 'http://site.com/path/to/file.mp3';"
-
-    no_mp3_url_mock = MagicMock()
-    no_mp3_url_mock.text = "<dumb>lol</dumb>"
-
-    with patch('requests.sessions.Session.post') as post_method:
-        post_method.return_value = mp3_url_mock
+    with AcapelaGroup() as acapela, \
+            patch('aiohttp.ClientSession.post') as post_method:
+        post_method.return_value = FakeAiohttpResponse(200, [
+            b"<script>var myPhp",
+            b"Var = 'http://site.com/path/to/file.mp3';"])
         assert acapela.get_mp3_url('french (france)', 'bar', 'baz') == \
             "http://site.com/path/to/file.mp3"
 
-        post_method.return_value = no_mp3_url_mock
+        post_method.return_value = FakeAiohttpResponse(200, [
+            b"<dumb>lol</dumb>"])
         with pytest.raises(NeedsUpdateError):
             acapela.get_mp3_url('french (france)', 'bar', 'baz')
 
-    # Test with an invalid language
-    with pytest.raises(LanguageNotSupportedError) as exn:
-        acapela.get_mp3_url('Unexisting language', 'bar', 'foo')
-    assert 'The language Unexisting language is not supported.' in str(exn)
+        # Test with an invalid language
+        with pytest.raises(LanguageNotSupportedError) as exn:
+            acapela.get_mp3_url('Unexisting language', 'bar', 'foo')
+        assert 'The language Unexisting language is not supported.' in \
+            str(exn)
 
 
 @pytest.mark.asyncio
@@ -170,3 +193,306 @@ async def test_acapela_group_async_authenticate():
 
                 # Should run without any trouble!
             #     await acapela.authenticate("foo", "bar")
+
+
+def test_get_mp3_url_cache():
+    """Test that `AcapelaGroup.get_mp3_url` uses its cache."""
+    cache = MemoryCache()
+
+    with AcapelaGroup(cache=cache) as acapela, \
+            patch('aiohttp.ClientSession.post') as post_method:
+        post_method.side_effect = lambda *args, **kwargs: \
+            FakeAiohttpResponse(200, [
+                b"<script>var myPhpVar = ",
+                b"'http://site.com/path/to/file.mp3';"])
+        for text in ('Hello  world', 'Hello world', ' Hello\nworld'):
+            assert acapela.get_mp3_url('french (france)', 'bar', text) == \
+                "http://site.com/path/to/file.mp3"
+
+    assert post_method.call_count == 1
+    assert cache.stats.hits == 2
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_get_mp3_url_cache():
+    """Test that `AcapelaGroupAsync.get_mp3_url` uses its cache."""
+    cache = MemoryCache()
+    cache.set(make_key('sonid15', 'bar', 'baz'), 'http://site.com/a.mp3')
+
+    async with AcapelaGroupAsync(cache=cache) as acapela:
+        with patch('aiohttp.ClientSession.post') as post_method:
+            assert await acapela.get_mp3_url('French (France)', 'bar',
+                                             'baz') == \
+                'http://site.com/a.mp3'
+
+    assert not post_method.called
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_sqlite_cache(tmpdir):
+    """Test that the SQLite cache is queried out of the event loop."""
+    threads = set()
+
+    class SpyCache(SQLiteCache):
+        def get_entry(self, key):
+            threads.add(threading.current_thread())
+            return super().get_entry(key)
+
+    cache = SpyCache(str(tmpdir.join('mp3_urls.db')))
+    cache.set(make_key('sonid15', 'bar', 'baz'), 'http://site.com/a.mp3')
+
+    async with AcapelaGroupAsync(cache=cache) as acapela:
+        assert await acapela.get_mp3_url('French (France)', 'bar',
+                                         'baz') == 'http://site.com/a.mp3'
+
+    assert threads and threading.current_thread() not in threads
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_get_mp3_urls():
+    """Test the `get_mp3_urls` method of the `AcapelaGroupAsync` class."""
+    async with AcapelaGroupAsync() as acapela:
+        with patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+                   new_callable=AsyncMock) as get_mp3_url_method:
+            get_mp3_url_method.side_effect = [
+                'http://site.com/a.mp3',
+                NeedsUpdateError("Could not extract mp3 url pattern."),
+            ]
+            results = [result async for result in acapela.get_mp3_urls([
+                ('French (France)', 'Antoine', 'a'),
+                ('French (France)', 'Antoine', 'b'),
+            ])]
+
+    assert results[0].url == 'http://site.com/a.mp3'
+    assert isinstance(results[1].error, NeedsUpdateError)
+    assert results[1].request.text == 'b'
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_network_errors(tmpdir):
+    """Test that an unreachable website fails each request of a batch."""
+    with FakeAcapelaServer() as server:
+        url = server.url  # Nothing listens there anymore afterwards.
+
+    async with AcapelaGroupAsync(base_url=url) as acapela:
+        results = [result async for result in acapela.get_mp3_urls([
+            ('French (France)', 'Manon', 'a'),
+            ('French (France)', 'Manon', 'b'),
+        ])]
+        assert all(isinstance(result.error, NetworkError)
+                   for result in results)
+
+        with pytest.raises(DownloadError):
+            await acapela.download_mp3(url + '/sounds/a.mp3',
+                                       str(tmpdir.join('a.mp3')))
+
+
+def test_acapela_group_threads(tmpdir):
+    """Test the concurrent methods of the `AcapelaGroup` class."""
+    with FakeAcapelaServer(page_size=1000, latency=0.01) as server, \
+            AcapelaGroup(base_url=server.url, max_workers=4) as acapela:
+        future = acapela.submit('French (France)', 'Manon', 'baz')
+        assert future.result().startswith(server.url + '/sounds/')
+
+        path = str(tmpdir.join('sound.mp3'))
+        assert acapela.submit_synthesize('French (France)', 'Manon', 'baz',
+                                         path).result() == future.result()
+        assert tmpdir.join('sound.mp3').size() == 40 * 417
+
+        results = list(acapela.get_mp3_urls(
+            [('French (France)', 'Manon', str(index))
+             for index in range(8)] +
+            [('Unexisting language', 'bar', 'baz')]))
+
+        assert [result.request.text for result in results[:8]] == \
+            [str(index) for index in range(8)]
+        assert all(result.ok for result in results[:8])
+        assert isinstance(results[8].error, LanguageNotSupportedError)
+
+        # Calls from several threads share the loop of the client.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) \
+                as executor:
+            urls = list(executor.map(
+                lambda text: acapela.get_mp3_url('French (France)', 'Manon',
+                                                 text),
+                ['a', 'b', 'c', 'd']))
+        assert len(set(urls)) == 4
+
+    assert server.requests(TTS_FORM_PATH) == 14
+
+
+def test_acapela_group_download(tmpdir):
+    """Test the download methods of the `AcapelaGroup` class."""
+    path = str(tmpdir.join('sound.mp3'))
+
+    with AcapelaGroup() as acapela, \
+            patch('aiohttp.ClientSession.get') as get_method:
+        get_method.return_value = FakeAiohttpResponse(200, [b'ID3', b'data'])
+        assert acapela.download_mp3('http://site.com/a.mp3', path) == 7
+        get_method.assert_called_with('http://site.com/a.mp3')
+        with open(path, 'rb') as fileobj:
+            assert fileobj.read() == b'ID3data'
+
+        get_method.return_value = FakeAiohttpResponse(404, [])
+        with pytest.raises(DownloadError):
+            acapela.download_mp3('http://site.com/a.mp3', path)
+
+        get_method.side_effect = lambda url: FakeAiohttpResponse(
+            404 if 'missing' in url else 200, [b'ID3'])
+        with patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+                   new_callable=AsyncMock) as get_mp3_url_method:
+            get_mp3_url_method.side_effect = \
+                lambda language, voice, text, **kwargs: \
+                'http://site.com/{}.mp3'.format(text)
+            results = list(acapela.download_mp3s(
+                [('French (France)', 'bar', 'ok'),
+                 ('French (France)', 'bar', 'missing')],
+                lambda request: str(tmpdir.join(request.text + '.mp3'))))
+
+    assert results[0].ok
+    assert isinstance(results[1].error, DownloadError)
+    assert results[1].url == 'http://site.com/missing.mp3'
+    assert not tmpdir.join('missing.mp3').exists()
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_download(tmpdir):
+    """Test the download methods of the `AcapelaGroupAsync` class."""
+    path = str(tmpdir.join('sound.mp3'))
+
+    async with AcapelaGroupAsync() as acapela:
+        with patch('aiohttp.ClientSession.get') as get_method:
+            get_method.return_value = FakeAiohttpResponse(
+                200, [b'ID3', b'data'])
+            with patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+                       new_callable=AsyncMock) as get_mp3_url_method:
+                get_mp3_url_method.return_value = 'http://site.com/a.mp3'
+                assert await acapela.synthesize('French (France)', 'bar',
+                                                'baz', path) == \
+                    'http://site.com/a.mp3'
+
+            with open(path, 'rb') as fileobj:
+                assert fileobj.read() == b'ID3data'
+
+            get_method.return_value = FakeAiohttpResponse(500, [])
+            with pytest.raises(DownloadError):
+                await acapela.download_mp3('http://site.com/a.mp3', path)
+
+
+def test_acapela_group_synthesize_long(tmpdir):
+    """Test the `synthesize_long` method of the `AcapelaGroup` class."""
+    def fetch_mp3(language, voice, text, deadline=None):
+        # A tag, then one MPEG 1 layer III frame per chunk.
+        return b'ID3\x03\x00\x00\x00\x00\x00\x00' + b'\xff\xfb\x90\x00' + \
+            text[-2].encode() * 413
+
+    path = str(tmpdir.join('long.mp3'))
+    with AcapelaGroup(max_workers=2) as acapela:
+        with patch('acapela_group.base.AcapelaGroupAsync._fetch_mp3',
+                   new_callable=AsyncMock) as fetch_mp3_method:
+            fetch_mp3_method.side_effect = fetch_mp3
+            acapela.synthesize_long('French (France)', 'bar',
+                                    'Sentence a. Sentence b. Sentence c.',
+                                    path, max_length=12)
+
+    assert fetch_mp3_method.call_count == 3
+    with open(path, 'rb') as fileobj:
+        data = fileobj.read()
+    assert data.count(b'ID3') == 1
+    assert data.index(b'a' * 413) < data.index(b'b' * 413) < \
+        data.index(b'c' * 413)
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_get_mp3_url():
+    """Test the `get_mp3_url` method of the `AcapelaGroupAsync` class."""
+    async with AcapelaGroupAsync() as acapela:
+        with patch('aiohttp.ClientSession.post') as post_method:
+            post_method.return_value = FakeAiohttpResponse(200, [
+                b"<script>var myPhpVar = 'http://site.com/",
+                b"path/to/file.mp3';</script>"])
+            assert await acapela.get_mp3_url('french (france)', 'bar',
+                                             'baz') == \
+                "http://site.com/path/to/file.mp3"
+            assert post_method.call_args[1]['headers'] == \
+                {'Accept-Encoding': 'gzip, deflate'}
+
+            post_method.return_value = FakeAiohttpResponse(200, [
+                b"<dumb>lol</dumb>"])
+            with pytest.raises(NeedsUpdateError):
+                await acapela.get_mp3_url('french (france)', 'bar', 'baz')
+
+
+def test_acapela_group_session_store(tmpdir):
+    """Test that `AcapelaGroup` reuses and renews stored sessions."""
+    store = SessionStore(str(tmpdir.join('sessions.json')))
+
+    with FakeAcapelaServer() as server, \
+            AcapelaGroup(base_url=server.url, session_store=store) as acapela:
+        store.save(server.url, 'foo', [{
+            'name': LOGGED_IN_COOKIE, 'value': 'stored', 'domain': None,
+            'path': '/', 'expires': time.time() + 3600, 'secure': False}])
+        acapela.authenticate('foo', 'bar')
+        # The stored session is reused.
+        assert server.requests(LOGIN_PATH) == 0
+        assert not acapela.get_mp3_url('French (France)', 'Manon',
+                                       'Bonjour').endswith('-music.mp3')
+
+        # The website ends the session: the client logs in again.
+        acapela._engine._http_session.cookie_jar.clear()
+        assert not acapela.get_mp3_url('French (France)', 'Manon',
+                                       'Salut').endswith('-music.mp3')
+        assert server.requests(LOGIN_PATH) == 1
+
+        assert store.load(server.url, 'foo')[0]['value'] == 'foo'
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_session_store(tmpdir):
+    """Test that `AcapelaGroupAsync` reuses stored sessions."""
+    store = SessionStore(str(tmpdir.join('sessions.json')))
+    store.save('http://www.acapela-group.com', 'foo', [{
+        'name': 'wordpress_logged_in_abc', 'value': 'foo',
+        'domain': 'www.acapela-group.com', 'path': '/',
+        'expires': time.time() + 3600, 'secure': False}])
+
+    async with AcapelaGroupAsync(session_store=store) as acapela:
+        with patch('aiohttp.ClientSession.post') as post_method:
+            await acapela.authenticate('foo', 'bar')
+            assert not post_method.called
+
+        assert acapela._is_logged_in()
+        assert not acapela._session_expired()
+        cookies = acapela._export_cookies()
+        assert cookies[0]['name'] == 'wordpress_logged_in_abc'
+        assert cookies[0]['expires'] > time.time()
+
+
+UNCLOSED_CLIENT = """
+import gc
+import sys
+
+from acapela_group.base import AcapelaGroup
+from acapela_group.testing import FakeAcapelaServer
+
+with FakeAcapelaServer() as server:
+    acapela = AcapelaGroup(base_url=server.url)
+    print(acapela.get_mp3_url('French (France)', 'Antoine', 'Bonjour'))
+    if sys.argv[1] == 'collect':
+        del acapela
+        gc.collect()
+"""
+
+
+@pytest.mark.parametrize('ending', ['exit', 'collect'])
+def test_acapela_group_not_closed(ending):
+    """Test that a client never closed still closes its session."""
+    environment = dict(os.environ, PYTHONPATH=os.path.dirname(
+        os.path.dirname(acapela_group.__file__)))
+    process = subprocess.run(
+        [sys.executable, '-c', UNCLOSED_CLIENT, ending], env=environment,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, timeout=60)
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.endswith('.mp3\n')
+    assert 'Unclosed' not in process.stderr
@@ -0,0 +1,136 @@
+import asyncio
+import concurrent.futures
+import itertools
+
+import pytest
+
+from acapela_group.base import AcapelaGroupError
+from acapela_group.batch import (BatchRequest, BatchResult, map_async,
+                                 map_threaded)
+
+
+class FakeSynthesizer:
+    """Coroutine function recording how many calls run at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, language, voice, text):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            # The first requests are the slowest ones.
+            await asyncio.sleep(0.01 / (int(text) + 1))
+            if language == 'bad':
+                raise AcapelaGroupError(text)
+            return 'http://site.com/{}.mp3'.format(text)
+        finally:
+            self.running -= 1
+
+
+def test_batch_request_coerce():
+    """Test the `BatchRequest.coerce` method."""
+    request = BatchRequest('French (France)', 'Antoine', 'Bonjour')
+    assert BatchRequest.coerce(request) is request
+    assert BatchRequest.coerce(['French (France)', 'Antoine', 'Bonjour']) \
+        == request
+    assert BatchResult(request, 'http://site.com/a.mp3', None).ok
+    assert not BatchResult(request, None, AcapelaGroupError()).ok
+
+
+@pytest.mark.asyncio
+async def test_map_async_ordered():
+    """Test that `map_async` keeps the input order and the concurrency."""
+    synthesizer = FakeSynthesizer()
+    requests = [('good', 'voice', str(index)) for index in range(10)]
+    requests[3] = ('bad', 'voice', '3')
+
+    results = [result async for result in map_async(
+        synthesizer, requests, 3, errors=(AcapelaGroupError,))]
+
+    assert [result.request.text for result in results] == \
+        [str(index) for index in range(10)]
+    assert results[0].url == 'http://site.com/0.mp3'
+    assert isinstance(results[3].error, AcapelaGroupError)
+    assert synthesizer.max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_map_async_unordered():
+    """Test that `map_async` yields results as soon as they are ready."""
+    order = ['3', '2', '1', '0']
+    events = {text: asyncio.Event() for text in order}
+
+    async def synthesize(language, voice, text):
+        await events[text].wait()
+        return 'http://site.com/{}.mp3'.format(text)
+
+    requests = [('good', 'voice', str(index)) for index in range(4)]
+    texts = []
+    # Each request is only answered once the previous result was yielded.
+    events[order[0]].set()
+    async for result in map_async(synthesize, requests, 4, ordered=False):
+        texts.append(result.request.text)
+        if len(texts) < len(order):
+            events[order[len(texts)]].set()
+
+    assert texts == order
+
+
+@pytest.mark.asyncio
+async def test_map_async_lazy():
+    """Test that `map_async` only consumes the requests it needs."""
+    async def requests():
+        for index in itertools.count():
+            yield ('good', 'voice', str(index))
+
+    synthesizer = FakeSynthesizer()
+    results = map_async(synthesizer, requests(), 2)
+    assert (await results.__anext__()).url == 'http://site.com/0.mp3'
+    assert (await results.__anext__()).url == 'http://site.com/1.mp3'
+    await results.aclose()
+
+
+@pytest.mark.asyncio
+async def test_map_async_errors():
+    """Test that unexpected errors abort the batch."""
+    synthesizer = FakeSynthesizer()
+    with pytest.raises(AcapelaGroupError):
+        async for _ in map_async(synthesizer, [('bad', 'voice', '0')], 1,
+                                 errors=(KeyError,)):
+            pass
+
+    with pytest.raises(ValueError):
+        async for _ in map_async(synthesizer, [], 0):
+            pass
+
+
+def test_map_threaded():
+    """Test the `map_threaded` function."""
+    def synthesize(language, voice, text):
+        if language == 'bad':
+            raise AcapelaGroupError(text)
+        return 'http://site.com/{}.mp3'.format(text)
+
+    requests = [('good', 'voice', str(index)) for index in range(10)]
+    requests[5] = ('bad', 'voice', '5')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(map_threaded(executor, synthesize, requests, 3,
+                                    errors=(AcapelaGroupError,)))
+        assert [result.request.text for result in results] == \
+            [str(index) for index in range(10)]
+        assert isinstance(results[5].error, AcapelaGroupError)
+
+        results = list(map_threaded(executor, synthesize, requests[:5], 3,
+                                    ordered=False))
+        assert sorted(result.url for result in results) == \
+            ['http://site.com/{}.mp3'.format(index) for index in range(5)]
+
+        # Only the requests needed are consumed.
+        results = map_threaded(executor, synthesize,
+                               (('good', 'voice', str(index))
+                                for index in itertools.count()), 2)
+        assert next(results).url == 'http://site.com/0.mp3'
+        results.close()
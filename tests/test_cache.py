@@ -0,0 +1,226 @@
+import sqlite3
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from acapela_group.base import AcapelaGroupAsync
+from acapela_group.cache import (MemoryCache, SQLiteCache, TieredCache,
+                                 make_key, normalize_text)
+
+
+def test_normalize_text():
+    """Test the `normalize_text` function."""
+    assert normalize_text("  Hello \t\n  world  ") == "Hello world"
+    # 'e' followed by a combining acute accent is composed into 'é'.
+    assert normalize_text("cafe\u0301") == "caf\u00e9"
+
+
+def test_make_key():
+    """Test the `make_key` function."""
+    assert make_key('sonid15', 'Antoine', 'Bonjour  le monde') == \
+        make_key('sonid15', 'Antoine', ' Bonjour le\nmonde ')
+    assert make_key('sonid15', 'Antoine', 'Bonjour') != \
+        make_key('sonid15', 'Antoine', 'Bonjour', authenticated=True)
+    assert make_key('sonid15', 'Antoine', 'Bonjour') != \
+        make_key('sonid10', 'Antoine', 'Bonjour')
+
+
+def test_memory_cache():
+    """Test the LRU eviction and counters of the `MemoryCache` class."""
+    cache = MemoryCache(max_entries=2)
+    assert cache.get('a') is None
+
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'  # 'b' is now the least recently used.
+
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.get('c') == 'C'
+    assert len(cache) == 2
+    assert cache.stats.as_dict() == {
+        'hits': 2, 'misses': 2, 'evictions': 1, 'expirations': 0}
+
+    with pytest.raises(ValueError):
+        MemoryCache(max_entries=0)
+
+
+def test_memory_cache_ttl():
+    """Test the expiration of the `MemoryCache` entries."""
+    cache = MemoryCache(ttl=10)
+    with patch('time.monotonic') as monotonic:
+        monotonic.return_value = 100
+        cache.set('a', 'A')
+        monotonic.return_value = 109
+        assert cache.get('a') == 'A'
+        monotonic.return_value = 110
+        assert cache.get('a') is None
+
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_sqlite_cache(tmpdir):
+    """Test the `SQLiteCache` class."""
+    path = str(tmpdir.join('cache', 'mp3_urls.db'))
+    cache = SQLiteCache(path, max_entries=2, prune_interval=1)
+
+    assert cache.get('a') is None
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.set('c', 'C')
+    assert cache.get('b') is None
+    assert cache.stats.evictions == 1
+
+    # Another instance (think another process) sees the same entries.
+    other_cache = SQLiteCache(path, max_entries=2, prune_interval=1)
+    assert other_cache.get('c') == 'C'
+    assert len(other_cache) == 2
+
+    with patch('time.time') as time_method:
+        time_method.return_value = 2 ** 40
+        assert other_cache.get('a') is None
+        assert other_cache.purge() == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    cache.close()
+    other_cache.close()
+
+
+def test_tiered_cache(tmpdir):
+    """Test that `TieredCache` promotes the values found in slow layers."""
+    memory = MemoryCache()
+    sqlite = SQLiteCache(str(tmpdir.join('mp3_urls.db')))
+    sqlite.set('a', 'A')
+
+    cache = TieredCache(memory, sqlite)
+    assert cache.get('a') == 'A'
+    assert memory.get('a') == 'A'
+    assert cache.get('b') is None
+
+    cache.set('b', 'B')
+    assert memory.get('b') == 'B'
+    assert sqlite.get('b') == 'B'
+    assert cache.stats.hits == 1
+    assert cache.stats.misses == 1
+
+    with pytest.raises(ValueError):
+        TieredCache()
+
+
+def test_sqlite_cache_prune_interval(tmpdir):
+    """Test that `SQLiteCache` only checks its size every few writes."""
+    cache = SQLiteCache(str(tmpdir.join('mp3_urls.db')), max_entries=2,
+                        prune_interval=3)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    cache.set('a', 'A')
+    assert len(cache) == 2
+    cache.set('c', 'C')
+    cache.set('d', 'D')
+    assert len(cache) == 4  # Not checked yet.
+    cache.set('e', 'E')
+    assert len(cache) == 2
+    assert cache.stats.evictions == 3
+    assert cache.get('e') == 'E'
+    cache.close()
+
+    with pytest.raises(ValueError):
+        SQLiteCache(str(tmpdir.join('other.db')), prune_interval=0)
+
+
+def test_tiered_cache_ttl(tmpdir):
+    """Test that `TieredCache` promotes the values with their lifetime."""
+    memory = MemoryCache(ttl=100)
+    sqlite = SQLiteCache(str(tmpdir.join('mp3_urls.db')), ttl=100)
+    cache = TieredCache(memory, sqlite)
+
+    with patch('time.time') as time_method, \
+            patch('time.monotonic') as monotonic:
+        time_method.return_value = 1000.0
+        monotonic.return_value = 50.0
+        sqlite.set('a', 'A')
+
+        time_method.return_value = 1090.0
+        monotonic.return_value = 140.0
+        assert cache.get_entry('a') == ('A', 10.0)
+        assert memory.get_entry('a') == ('A', 10.0)
+
+        # The promoted value expires with the original one.
+        monotonic.return_value = 150.0
+        assert memory.get('a') is None
+
+    assert cache.blocking
+    assert not TieredCache(memory).blocking
+    sqlite.close()
+
+
+def test_sqlite_cache_touch_batch(tmpdir):
+    """Test that `SQLiteCache` writes the access times by batches."""
+    path = str(tmpdir.join('mp3_urls.db'))
+    cache = SQLiteCache(path, max_entries=2, prune_interval=1, touch_batch=2)
+
+    def accessed_at(key):
+        with sqlite3.connect(path) as connection:
+            return connection.execute(
+                "SELECT accessed_at FROM mp3_urls WHERE key = ?",
+                (key,)).fetchone()[0]
+
+    with patch('time.time') as time_method:
+        time_method.return_value = 100.0
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+
+        time_method.return_value = 200.0
+        assert cache.get('a') == 'A'
+        assert cache.get('a') == 'A'
+        assert accessed_at('a') == 100.0  # Kept in memory.
+        assert cache.get('b') == 'B'
+        assert accessed_at('a') == accessed_at('b') == 200.0
+
+        # The next write saves the access times before evicting.
+        time_method.return_value = 300.0
+        assert cache.get('b') == 'B'
+        cache.set('c', 'C')
+        assert cache.get('a') is None
+        assert cache.get('b') == 'B'
+
+    with pytest.raises(ValueError):
+        SQLiteCache(path, touch_batch=0)
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_async(tmpdir):
+    """Test that the async client only hops to a thread for the disk."""
+    threads = []
+
+    class SpyMemoryCache(MemoryCache):
+        def get_entry(self, key):
+            threads.append(('memory', threading.current_thread()))
+            return super().get_entry(key)
+
+    class SpySQLiteCache(SQLiteCache):
+        def get_entry(self, key):
+            threads.append(('sqlite', threading.current_thread()))
+            return super().get_entry(key)
+
+    sqlite = SpySQLiteCache(str(tmpdir.join('mp3_urls.db')))
+    key = make_key('sonid15', 'bar', 'baz')
+    sqlite.set(key, 'http://site.com/a.mp3')
+    cache = TieredCache(SpyMemoryCache(), sqlite)
+
+    async with AcapelaGroupAsync(cache=cache) as acapela:
+        for _ in range(2):
+            assert await acapela.get_mp3_url('French (France)', 'bar',
+                                             'baz') == 'http://site.com/a.mp3'
+
+    loop_thread = threading.current_thread()
+    assert [name for name, _ in threads] == ['memory', 'sqlite', 'memory']
+    assert threads[0][1] is threads[2][1] is loop_thread
+    assert threads[1][1] is not loop_thread
+    assert cache.stats.hits == 2
+    assert cache.stats.misses == 0
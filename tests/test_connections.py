@@ -0,0 +1,71 @@
+import pytest
+
+from acapela_group.base import AcapelaGroup, AcapelaGroupAsync
+from acapela_group.connections import ConnectionConfig
+from acapela_group.testing import FakeAcapelaServer
+
+
+@pytest.fixture
+def server():
+    with FakeAcapelaServer(page_size=1000, latency=0.05) as server:
+        yield server
+
+
+def test_connection_config():
+    """Test the validation of the settings."""
+    with pytest.raises(ValueError):
+        ConnectionConfig(limit=0)
+    with pytest.raises(ValueError):
+        ConnectionConfig(limit_per_host=0)
+    with pytest.raises(ValueError):
+        ConnectionConfig(prewarm=-1)
+
+
+@pytest.mark.asyncio
+async def test_connection_config_aiohttp():
+    """Test the settings given to the aiohttp connector."""
+    config = ConnectionConfig(limit=20, limit_per_host=5,
+                              keepalive_timeout=10, dns_cache_ttl=None)
+    connector = config.aiohttp_connector()
+    assert connector.limit == 20
+    assert connector.limit_per_host == 5
+    assert not connector.use_dns_cache
+    await connector.close()
+
+
+@pytest.mark.asyncio
+async def test_async_warm_up(server):
+    """Test that the warm connections are reused by the requests."""
+    async with AcapelaGroupAsync(
+            base_url=server.url,
+            connections=ConnectionConfig(prewarm=3)) as acapela:
+        assert server.connections == 3
+        for text in ('Un', 'Deux', 'Trois'):
+            await acapela.get_mp3_url('French (France)', 'Manon', text)
+        assert server.connections == 3
+
+
+@pytest.mark.asyncio
+async def test_async_lazy_session(server):
+    """Test the client outside of `async with`."""
+    acapela = AcapelaGroupAsync(base_url=server.url)
+    assert await acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+    session = acapela._http_session
+    await acapela.close()
+    assert session.closed
+    await acapela.close()  # Closing twice does nothing.
+
+    # A new session is opened on demand.
+    assert await acapela.get_mp3_url('French (France)', 'Manon', 'Salut')
+    await acapela.close()
+
+
+def test_sync_warm_up(server):
+    """Test the `warm_up` method of the `AcapelaGroup` class."""
+    with AcapelaGroup(base_url=server.url,
+                      connections=ConnectionConfig(prewarm=2)) as acapela:
+        assert server.connections == 2
+        for text in ('Un', 'Deux'):
+            acapela.get_mp3_url('French (France)', 'Manon', text)
+        assert server.connections == 2
+        assert acapela.warm_up(3) == 3
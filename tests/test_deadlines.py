@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+
+from acapela_group.audio import AudioStore
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+                                DeadlineExceededError)
+from acapela_group.common import with_deadline
+from acapela_group.metrics import Metrics
+from acapela_group.singleflight import AsyncSingleFlight
+from acapela_group.testing import FakeAcapelaServer
+
+
+class Sleeper:
+    @with_deadline
+    async def sleep(self, delay, error=None, *, deadline=None):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return delay
+
+
+@pytest.mark.asyncio
+async def test_with_deadline():
+    """Test that `with_deadline` bounds a call by its deadline."""
+    sleeper = Sleeper()
+    assert await sleeper.sleep(0.01) == 0.01
+    assert await sleeper.sleep(
+        0.01, deadline=time.monotonic() + 1) == 0.01
+
+    started_at = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        await sleeper.sleep(10, deadline=time.monotonic() + 0.02)
+    assert time.monotonic() - started_at < 1
+
+    with pytest.raises(DeadlineExceededError):
+        await sleeper.sleep(0, deadline=time.monotonic() - 1)
+
+    # The timeout of a request is not mistaken for the deadline.
+    with pytest.raises(asyncio.TimeoutError) as exn:
+        await sleeper.sleep(0, asyncio.TimeoutError(),
+                            deadline=time.monotonic() + 1)
+    assert not isinstance(exn.value, DeadlineExceededError)
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_without_callers():
+    """Test that a shared call is cancelled once every caller went away."""
+    flights = AsyncSingleFlight()
+    cancelled = asyncio.Event()
+
+    async def function():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    first = asyncio.ensure_future(flights.do('key', function))
+    second = asyncio.ensure_future(flights.do('key', function))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    second.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert not flights._flights
+
+
+@pytest.mark.asyncio
+async def test_async_client_deadline():
+    """Test that a deadline is shared by every step of a call."""
+    metrics = Metrics()
+    with FakeAcapelaServer(latency=0.2) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     metrics=metrics) as acapela:
+            started_at = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                await acapela.get_mp3_url('French (France)', 'Manon',
+                                          'Bonjour',
+                                          deadline=time.monotonic() + 0.05)
+            assert time.monotonic() - started_at < 0.2
+
+            # Each step would be on time, but not both of them.
+            with pytest.raises(DeadlineExceededError):
+                await acapela.synthesize('French (France)', 'Manon', 'Salut',
+                                         '/dev/null',
+                                         deadline=time.monotonic() + 0.3)
+
+            with pytest.raises(DeadlineExceededError):
+                await acapela.authenticate('foo', 'bar',
+                                           deadline=time.monotonic() + 0.05)
+
+            server.latency = 0
+            url = await acapela.get_mp3_url('French (France)', 'Manon',
+                                            'Bonjour',
+                                            deadline=time.monotonic() + 5)
+            assert url.startswith(server.url + '/sounds/')
+
+    errors = {item['labels']['error']: item['value']
+              for item in metrics.snapshot()['counters']
+              if item['name'] == 'errors_total'}
+    assert errors == {'DeadlineExceededError': 3}
+
+
+@pytest.mark.asyncio
+async def test_synthesize_store_deadline(tmpdir):
+    """Test that the steps of the audio store are bounded by the deadline."""
+    class SlowStore(AudioStore):
+        def copy_to(self, key, destination):
+            time.sleep(0.3)
+            return super().copy_to(key, destination)
+
+    store = SlowStore(str(tmpdir))
+    async with AcapelaGroupAsync(audio_store=store) as acapela:
+        started_at = time.monotonic()
+        with pytest.raises(DeadlineExceededError):
+            await acapela.synthesize('French (France)', 'Manon', 'Salut',
+                                     '/dev/null',
+                                     deadline=time.monotonic() + 0.05)
+        assert time.monotonic() - started_at < 0.25
+
+
+def test_sync_client_deadline():
+    """Test the deadlines of the synchronous client and of its batches."""
+    with FakeAcapelaServer(latency=0.2) as server:
+        with AcapelaGroup(base_url=server.url) as acapela:
+            with pytest.raises(DeadlineExceededError):
+                acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour',
+                                    deadline=time.monotonic() + 0.05)
+
+            items = [('French (France)', 'Manon', str(index))
+                     for index in range(4)]
+            results = list(acapela.get_mp3_urls(
+                items, concurrency=2, deadline=time.monotonic() + 0.3))
+            assert [result.ok for result in results] == \
+                [True, True, False, False]
+            assert all(isinstance(result.error, DeadlineExceededError)
+                       for result in results[2:])
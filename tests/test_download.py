@@ -0,0 +1,36 @@
+import io
+import os
+
+import pytest
+
+from acapela_group.download import open_destination
+
+
+def test_open_destination_path(tmpdir):
+    """Test that `open_destination` writes paths atomically."""
+    path = str(tmpdir.join('sound.mp3'))
+
+    with open_destination(path) as fileobj:
+        fileobj.write(b'ID3')
+        assert not os.path.exists(path)  # Nothing is visible yet.
+    with open(path, 'rb') as fileobj:
+        assert fileobj.read() == b'ID3'
+
+    with pytest.raises(RuntimeError):
+        with open_destination(path) as fileobj:
+            fileobj.write(b'partial')
+            raise RuntimeError
+    with open(path, 'rb') as fileobj:
+        assert fileobj.read() == b'ID3'  # The previous file is untouched.
+    assert tmpdir.listdir() == [tmpdir.join('sound.mp3')]
+
+
+def test_open_destination_fileobj(capsysbinary):
+    """Test that `open_destination` writes file objects directly."""
+    buffer = io.BytesIO()
+    with open_destination(buffer) as fileobj:
+        assert fileobj is buffer
+
+    with open_destination('-') as fileobj:
+        fileobj.write(b'ID3')
+    assert capsysbinary.readouterr().out == b'ID3'
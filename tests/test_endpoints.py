@@ -0,0 +1,173 @@
+import asyncio
+import contextlib
+
+import pytest
+
+from acapela_group.base import AcapelaGroup, AcapelaGroupAsync, ServerError
+from acapela_group.endpoints import EndpointSet
+from acapela_group.metrics import Metrics
+from acapela_group.policy import Policy
+from acapela_group.testing import TTS_FORM_PATH, FakeAcapelaServer
+
+
+def test_endpoint_set():
+    """Test the choices, the ejections and the recoveries of endpoints."""
+    endpoints = EndpointSet(['http://a/', 'http://b', 'http://c'],
+                            max_failures=2, seed=0)
+    assert endpoints.urls == ['http://a', 'http://b', 'http://c']
+    a, b, c = endpoints.endpoints
+
+    # The fastest of any two endpoints is chosen, so the slowest never is.
+    endpoints.succeeded(a, 0.1)
+    endpoints.succeeded(b, 0.2)
+    endpoints.succeeded(c, 0.3)
+    assert c not in {endpoints.choose() for _ in range(50)}
+
+    # The requests in flight count as well.
+    a.in_flight = 5
+    assert a not in {endpoints.choose() for _ in range(50)}
+    a.in_flight = 0
+
+    # The latency of an idle endpoint fades.
+    c.last_success -= 120
+    assert c.score(30) == (pytest.approx(0.3 / 16, rel=0.01), 0)
+    c.last_success += 120
+
+    # The latency is a moving average.
+    endpoints.succeeded(a, 1.1)
+    assert a.stats.latency == pytest.approx(0.4)
+
+    assert not endpoints.failed(a)
+    assert endpoints.failed(a)
+    assert not endpoints.failed(a)  # Already ejected.
+    assert endpoints.ejected() == [a]
+    assert a not in {endpoints.choose() for _ in range(50)}
+
+    endpoints.failed(b)
+    endpoints.succeeded(b, 0.2)  # The failures must be in a row.
+    endpoints.failed(b)
+    assert endpoints.ejected() == [a]
+
+    endpoints.recovered(a)
+    assert endpoints.ejected() == []
+    assert a.stats.as_dict() == {
+        'requests': 0, 'failures': 3, 'ejections': 1, 'recoveries': 1,
+        'latency': pytest.approx(0.4), 'healthy': 1}
+
+    # With every endpoint ejected, they all get requests anyway.
+    for endpoint in endpoints.endpoints:
+        endpoints.failed(endpoint)
+        endpoints.failed(endpoint)
+    assert len(endpoints.ejected()) == 3
+    assert endpoints.choose() in endpoints.endpoints
+
+    with pytest.raises(ValueError):
+        EndpointSet([])
+    with pytest.raises(ValueError):
+        EndpointSet(['http://a', 'http://a/'])
+    with pytest.raises(ValueError):
+        EndpointSet(['http://a'], half_life=0)
+
+
+def test_endpoint_tracking():
+    """Test that only the transient errors count as failures."""
+    endpoints = EndpointSet(['http://a'], max_failures=1)
+    endpoint, = endpoints.endpoints
+
+    with pytest.raises(ValueError):
+        with endpoints.track(endpoint, (ServerError,)):
+            raise ValueError()
+    assert endpoint.healthy
+
+    with pytest.raises(ServerError):
+        with endpoints.track(endpoint, (ServerError,)) as tracked:
+            assert tracked.in_flight == 1
+            raise ServerError()
+    assert not endpoint.healthy
+    assert endpoint.in_flight == 0
+    assert endpoint.stats.requests == 2
+
+    with endpoints.track(endpoint, (ServerError,)):
+        pass
+    assert endpoint.healthy
+
+
+@contextlib.contextmanager
+def servers(count, **kwargs):
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(FakeAcapelaServer(**kwargs))
+               for _ in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_async_client_endpoints():
+    """Test that the requests are spread and fail over between servers."""
+    metrics = Metrics()
+    with servers(3, seed=0) as (first, second, third):
+        # The latencies fade at once, so that every endpoint gets requests.
+        endpoints = EndpointSet([first.url, second.url, third.url],
+                                max_failures=2, probe_interval=0.05,
+                                half_life=1e-6, seed=0)
+        policy = Policy(max_attempts=3, backoff=0)
+        async with AcapelaGroupAsync(endpoints=endpoints, policy=policy,
+                                     metrics=metrics) as acapela:
+            assert acapela.base_url == first.url
+            await acapela.authenticate('foo', 'bar')
+            await asyncio.gather(*(
+                acapela.get_mp3_url('French (France)', 'Manon', str(index))
+                for index in range(12)))
+            # Until they have a latency, the endpoints split the load.
+            assert sum(bool(server.requests(TTS_FORM_PATH))
+                       for server in (first, second, third)) >= 2
+            # The session is shared by every endpoint.
+            for text in 'abc':
+                url = await acapela.get_mp3_url('French (France)', 'Manon',
+                                                text)
+                assert not url.endswith('-music.mp3')
+
+            # A failing endpoint is ejected, and its requests retried on
+            # the others.
+            second.error_rate = 1
+            for index in range(12):
+                await acapela.get_mp3_url('French (France)', 'Manon',
+                                          'b{}'.format(index))
+            assert endpoints.ejected() == [endpoints.endpoints[1]]
+            failed = second.requests(TTS_FORM_PATH)
+            for index in range(6):
+                await acapela.get_mp3_url('French (France)', 'Manon',
+                                          'c{}'.format(index))
+            assert second.requests(TTS_FORM_PATH) == failed
+
+            # It is added back once the probes succeed.
+            second.error_rate = 0
+            for _ in range(40):
+                if not endpoints.ejected():
+                    break
+                await asyncio.sleep(0.05)
+            assert not endpoints.ejected()
+            assert acapela._probe_task is None
+
+    stats = endpoints.stats[second.url]
+    assert stats.ejections == stats.recoveries == 1
+    assert stats.failures >= 2
+    gauges = {(gauge['name'], gauge['labels']['endpoint']): gauge['value']
+              for gauge in metrics.snapshot()['gauges']
+              if gauge['name'].startswith('endpoint_')}
+    assert gauges[('endpoint_ejections', second.url)] == 1
+    assert gauges[('endpoint_healthy', second.url)] == 1
+
+
+def test_sync_client_endpoints():
+    """Test that the synchronous client spreads its batches too."""
+    with servers(2) as (first, second):
+        endpoints = EndpointSet([first.url, second.url], seed=0)
+        with AcapelaGroup(endpoints=endpoints) as acapela:
+            assert acapela.warm_up(4) == 4
+            items = [('French (France)', 'Manon', str(index))
+                     for index in range(20)]
+            assert all(result.ok for result in acapela.get_mp3_urls(items))
+
+        assert first.requests(TTS_FORM_PATH) + \
+            second.requests(TTS_FORM_PATH) == 20
+        assert first.requests(TTS_FORM_PATH) and \
+            second.requests(TTS_FORM_PATH)
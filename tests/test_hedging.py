@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from acapela_group.base import AcapelaGroupAsync, NeedsUpdateError
+from acapela_group.hedging import HedgingPolicy
+from acapela_group.testing import TTS_FORM_PATH, FakeAcapelaServer
+
+
+def make_function(delays, errors=()):
+    """Return a coroutine function taking `delays[n]` on its n-th call."""
+    calls = []
+
+    async def function(value):
+        index = len(calls)
+        calls.append(index)
+        try:
+            await asyncio.sleep(delays[index])
+        except asyncio.CancelledError:
+            calls[index] = 'cancelled'
+            raise
+        if index in errors:
+            raise NeedsUpdateError(str(index))
+        return '{}:{}'.format(value, index)
+
+    return function, calls
+
+
+def test_hedging_delay():
+    """Test the adaptive delay before a duplicate."""
+    hedging = HedgingPolicy(percentile=0.9, min_samples=10, initial_delay=2,
+                            min_delay=0.05)
+    assert hedging.delay() == 2
+    hedging._latencies.extend(index / 100 for index in range(1, 11))
+    assert hedging.delay() == 0.1
+    hedging._latencies.extend([0.01] * 100)
+    assert hedging.delay() == 0.05
+
+    with pytest.raises(ValueError):
+        HedgingPolicy(percentile=1)
+    with pytest.raises(ValueError):
+        HedgingPolicy(budget=-1)
+
+
+@pytest.mark.asyncio
+async def test_hedging_call():
+    """Test that a slow call is hedged and that the fastest one wins."""
+    hedging = HedgingPolicy(budget=1, initial_delay=0.02)
+
+    function, calls = make_function([0, 1])
+    assert await hedging.call(function, 'fast') == 'fast:0'
+    assert calls == [0]
+
+    function, calls = make_function([1, 0])
+    assert await hedging.call(function, 'slow') == 'slow:1'
+    await asyncio.sleep(0)
+    assert calls == ['cancelled', 1]  # The loser was cancelled.
+
+    # The duplicate fails: the first call still wins.
+    function, calls = make_function([0.05, 0], errors={1})
+    assert await hedging.call(function, 'slow') == 'slow:0'
+
+    # Both fail: the error of the first call is raised.
+    function, calls = make_function([0.05, 0], errors={0, 1})
+    with pytest.raises(NeedsUpdateError) as exn:
+        await hedging.call(function, 'slow')
+    assert str(exn.value) == '0'
+
+    assert hedging.stats.as_dict() == {
+        'requests': 4, 'hedged': 3, 'won': 1, 'denied': 0}
+
+
+@pytest.mark.asyncio
+async def test_hedging_budget():
+    """Test that the duplicates stay within the budget."""
+    hedging = HedgingPolicy(budget=0.5, burst=1, initial_delay=0)
+    for _ in range(6):
+        function, calls = make_function([0.01, 0.01])
+        await hedging.call(function, 'slow')
+
+    assert hedging.stats.hedged == 3
+    assert hedging.stats.denied == 3
+
+
+@pytest.mark.asyncio
+async def test_client_hedging():
+    """Test that the client hedges its slow text-to-speech requests."""
+    hedging = HedgingPolicy(budget=1, initial_delay=0.01)
+    with FakeAcapelaServer(page_size=1000, latency=0.05) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     hedging=hedging) as acapela:
+            url = await acapela.get_mp3_url('French (France)', 'Manon',
+                                            'Bonjour')
+            assert url.startswith(server.url + '/sounds/')
+
+        assert server.requests(TTS_FORM_PATH) == 2
+    assert hedging.stats.hedged == 1
@@ -0,0 +1,134 @@
+import functools
+import json
+import os
+import threading
+
+import aiohttp
+import pytest
+from click.testing import CliRunner
+
+from acapela_group.__main__ import main
+from acapela_group.base import AcapelaGroupAsync
+from acapela_group.jobs import Job
+from acapela_group.testing import TTS_FORM_PATH, FakeAcapelaServer
+
+
+def make_requests(count):
+    return [('French (France)', 'Manon', 'Phrase {}'.format(index))
+            for index in range(count)] + \
+        [('French (France)', 'Rachel', 'Wrong voice')]
+
+
+class FlakyClient(AcapelaGroupAsync):
+    """A client whose connection drops on the texts ending with a 3."""
+
+    async def _post_tts_form(self, base_url, data):
+        if data['MyTextForTTS'].endswith('3'):
+            raise aiohttp.ServerDisconnectedError()
+        return await super()._post_tts_form(base_url, data)
+
+
+@pytest.fixture
+def server():
+    with FakeAcapelaServer(page_size=1000) as server:
+        yield server
+
+
+def test_job_resumes(server, tmpdir):
+    """Test that a job only sends the requests not resolved yet."""
+    directory = str(tmpdir.join('job'))
+    job = Job(directory, workers=2, concurrency=4,
+              client_factory=functools.partial(AcapelaGroupAsync,
+                                               base_url=server.url))
+    stats = job.run(make_requests(20))
+    assert stats.as_dict() == {
+        'total': 21, 'skipped': 0, 'resolved': 20, 'failed': 1,
+        'remaining': 0, 'interrupted': False, 'errors': []}
+    assert sorted(record['index'] for record in job.results()) == \
+        list(range(21))
+    assert server.requests(TTS_FORM_PATH) == 21
+
+    # A crash in the middle of a line.
+    with open(os.path.join(directory, 'results-0.jsonl'), 'a') as fileobj:
+        fileobj.write('{"index": 3')
+
+    # Only the failed request is sent again.
+    stats = job.run(make_requests(20))
+    assert (stats.skipped, stats.resolved, stats.failed) == (20, 0, 1)
+    assert server.requests(TTS_FORM_PATH) == 22
+
+    job.retry_failed = False
+    assert job.run(make_requests(20)).skipped == 21
+    assert server.requests(TTS_FORM_PATH) == 22
+
+    with pytest.raises(ValueError):
+        job.run(make_requests(19))
+
+
+def test_job_stop(server, tmpdir):
+    """Test that a stopped job records its requests in flight."""
+    server.latency = 0.05
+    job = Job(str(tmpdir), workers=2, concurrency=2,
+              client_factory=functools.partial(AcapelaGroupAsync,
+                                               base_url=server.url))
+    timer = threading.Timer(1.0, job.stop)
+    timer.start()
+    stats = job.run(make_requests(200))
+    timer.join()
+
+    assert stats.interrupted
+    assert 0 < stats.resolved < 200
+    assert len(list(job.results())) == stats.resolved
+    # Every request sent was recorded.
+    assert server.requests(TTS_FORM_PATH) == stats.resolved
+
+    server.latency = 0
+    stats = job.run(make_requests(200))
+    assert not stats.interrupted
+    assert stats.remaining == 0
+
+
+def test_job_network_errors(server, tmpdir):
+    """Test that a network error fails its request, not the whole shard."""
+    job = Job(str(tmpdir), workers=1, concurrency=4,
+              client_factory=functools.partial(FlakyClient,
+                                               base_url=server.url))
+    stats = job.run(make_requests(20))
+    assert (stats.resolved, stats.failed, stats.remaining) == (18, 3, 0)
+    assert not stats.interrupted
+    errors = {record['text']: record['error_type']
+              for record in job.results() if 'error' in record}
+    assert errors == {'Phrase 3': 'NetworkError',
+                      'Phrase 13': 'NetworkError',
+                      'Wrong voice': 'NeedsUpdateError'}
+
+
+def test_job_worker_error(tmpdir):
+    """Test that a worker failing to log in does not stop the others."""
+    with FakeAcapelaServer(accounts={'foo': 'bar'}) as server:
+        job = Job(str(tmpdir), workers=1, credentials=('foo', 'wrong'),
+                  client_factory=functools.partial(AcapelaGroupAsync,
+                                                   base_url=server.url))
+        stats = job.run(make_requests(2))
+    assert stats.interrupted
+    assert stats.errors[0].startswith('InvalidCredentialsError')
+
+
+def test_main_job(server, tmpdir):
+    """Test the job command."""
+    requests_path = tmpdir.join('requests.tsv')
+    requests_path.write('\n'.join(
+        '\t'.join(request) for request in make_requests(3)))
+    directory = str(tmpdir.join('job'))
+
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        'job', str(requests_path), directory, '--base-url', server.url,
+        '--workers', '2', '--no-voice-check'])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)['resolved'] == 3
+
+    result = runner.invoke(main, [
+        'job', str(requests_path), directory, '--base-url', server.url])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)['skipped'] == 3
@@ -0,0 +1,41 @@
+import pytest
+
+from acapela_group.longtext import split_text
+
+
+def test_split_text_sentences():
+    """Test that `split_text` groups sentences into chunks."""
+    text = "First sentence. Second one!  Third one? Last."
+    assert split_text(text, 100) == ["First sentence. Second one! Third one? "
+                                     "Last."]
+    assert split_text(text, 30) == ["First sentence. Second one!",
+                                    "Third one? Last."]
+
+
+def test_split_text_clauses_and_words():
+    """Test that `split_text` splits long sentences."""
+    text = "A rather long clause, and another one; then the end."
+    assert split_text(text, 25) == ["A rather long clause,",
+                                    "and another one;",
+                                    "then the end."]
+    assert split_text("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+
+    for chunk in split_text("word " * 1000, 50):
+        assert len(chunk) <= 50
+
+    assert split_text("   ") == []
+
+    with pytest.raises(ValueError):
+        split_text("text", 0)
+
+
+def test_split_text_cjk():
+    """Test that `split_text` splits at the punctuation of CJK texts."""
+    text = '今日は良い天気です。明日も晴れるでしょう。' * 5
+    chunks = split_text(text, 30)
+    assert chunks == ['今日は良い天気です。明日も晴れるでしょう。'] * 5
+    assert ''.join(chunks) == text
+
+    # Clauses too, and the pieces are joined without spaces.
+    assert split_text('東京、大阪、名古屋、札幌、福岡。', 10) == \
+        ['東京、大阪、名古屋、', '札幌、福岡。']
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+import pytest
+
+from acapela_group.batch import imap_threaded
+from acapela_group.loop import LoopThread
+
+
+async def double(value):
+    await asyncio.sleep(0.01)
+    return value * 2
+
+
+def test_loop_thread():
+    """Test that `LoopThread` runs coroutines from other threads."""
+    loop = LoopThread()
+    assert not loop.running
+
+    future = loop.submit(double, 2)
+    assert loop.running
+    assert loop.run(double, 3) == 6
+    assert future.result() == 4
+
+    # A `LoopThread` can stand for an executor.
+    assert list(imap_threaded(loop, double, range(5), 2)) == [0, 2, 4, 6, 8]
+
+    async def wait_for_itself():
+        return loop.run(double, 1)
+
+    with pytest.raises(RuntimeError):
+        loop.run(wait_for_itself)
+
+    thread = loop._thread
+    loop.close()
+    assert not loop.running
+    assert not thread.is_alive()
+    loop.close()  # Closing twice does nothing.
+
+    # The loop is started again on demand.
+    assert loop.run(double, 4) == 8
+    assert loop._thread is not thread
+    loop.close()
+
+
+def test_loop_thread_cancel():
+    """Test that cancelling a future cancels its coroutine."""
+    started = threading.Event()
+    cancelled = threading.Event()
+
+    async def wait():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    loop = LoopThread()
+    future = loop.submit(wait)
+    assert started.wait(1)
+    future.cancel()
+    assert cancelled.wait(1)
+    loop.close()
+
+
+def test_loop_thread_close_cancels_tasks():
+    """Test that `LoopThread.close` cancels the tasks left on the loop."""
+    cancelled = threading.Event()
+
+    async def wait():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def spawn():
+        return asyncio.ensure_future(wait())
+
+    loop = LoopThread()
+    task = loop.run(spawn)
+    loop.close()
+    assert cancelled.is_set()
+    assert task.cancelled()
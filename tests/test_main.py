@@ -1,9 +1,21 @@
-from unittest.mock import patch
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
 
+import acapela_group
 from acapela_group.__main__ import main
-from acapela_group.base import AcapelaGroupError
+from acapela_group.base import AcapelaGroupError, NeedsUpdateError
+from acapela_group.sessions import SessionStore
+from acapela_group.testing import FakeAcapelaServer
+
+
+class AsyncMock(MagicMock):
+    async def __call__(self, *args, **kwargs):
+        return super(AsyncMock, self).__call__(*args, **kwargs)
 
 
 def test_main():
@@ -37,3 +49,130 @@ def test_main():
                                           '--username', 'foo',
                                           '--password', 'bar'])
             assert result.output == 'http://foo.com/path/to/file.mp3\n'
+
+
+def test_main_batch():
+    runner = CliRunner()
+    result = runner.invoke(main, ['foo', 'bar', 'baz', '--batch', '-'])
+    assert result.exit_code == 2  # Both arguments and a batch.
+
+    def get_mp3_url(language, voice, text, **kwargs):
+        if voice == 'unknown':
+            raise NeedsUpdateError("Could not extract mp3 url pattern.")
+        return 'http://foo.com/{}.mp3'.format(text)
+
+    # The batches run on the engine of the client.
+    with patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+               new_callable=AsyncMock) as get_mp3_url_method:
+        get_mp3_url_method.side_effect = get_mp3_url
+
+        result = runner.invoke(main, ['--batch', '-'], input=(
+            "French (France)\tAntoine\tun\n"
+            "\n"
+            "French (France)\tunknown\tdeux\n"
+            "invalid line\n"
+            "French (France)\tAntoine\ttrois\tquatre\n"))
+        assert result.exit_code == 0
+        lines = [json.loads(line) for line in result.output.splitlines()
+                 if line.startswith('{')]
+        assert lines == [
+            {'language': 'French (France)', 'voice': 'Antoine',
+             'text': 'un', 'url': 'http://foo.com/un.mp3'},
+            {'language': 'French (France)', 'voice': 'unknown',
+             'text': 'deux', 'error': 'Could not extract mp3 url pattern.',
+             'error_type': 'NeedsUpdateError'},
+            {'language': 'French (France)', 'voice': 'Antoine',
+             'text': 'trois\tquatre',
+             'url': 'http://foo.com/trois\tquatre.mp3'},
+        ]
+
+        result = runner.invoke(main, [
+            '--batch', '-', '--format', 'jsonl', '--unordered',
+            '--concurrency', '2'], input=(
+            '{"language": "French (France)", "voice": "Antoine", '
+            '"text": "un"}\n'
+            '{"language": "French (France)"}\n'))
+        assert result.exit_code == 0
+        assert 'http://foo.com/un.mp3' in result.output
+        assert 'Line 2: invalid request, skipped.' in result.output
+
+        with patch('acapela_group.base.AcapelaGroup.authenticate') \
+                as authenticate_method:
+            result = runner.invoke(main, [
+                '--batch', '-', '--username', 'foo', '--password', 'bar'],
+                input="French (France)\tAntoine\tun\n" * 5)
+            assert result.exit_code == 0
+            assert authenticate_method.call_count == 1
+
+
+def test_main_network_errors(tmpdir):
+    """Test that an unreachable website is reported without a traceback."""
+    with FakeAcapelaServer() as server:
+        url = server.url  # Nothing listens there anymore afterwards.
+    options = ['--base-url', url, '--retries', '0', '--no-voice-check',
+               '--voices-file', str(tmpdir.join('voices.json'))]
+
+    runner = CliRunner()
+    result = runner.invoke(main, ['--batch', '-'] + options, input=(
+        "French (France)\tManon\tun\n"
+        "French (France)\tManon\tdeux\n"))
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [line['error_type'] for line in lines] == ['NetworkError'] * 2
+
+    result = runner.invoke(main, ['French (France)', 'Manon', 'un'] +
+                           options)
+    assert result.exit_code == -2
+    assert 'Could not reach the website' in result.output
+    assert isinstance(result.exception, SystemExit)  # No traceback.
+
+
+def test_main_session_store(tmpdir):
+    runner = CliRunner()
+    session_file = str(tmpdir.join('sessions.json'))
+
+    with patch('acapela_group.base.AcapelaGroup.get_mp3_url') \
+            as get_mp3_url_method, \
+            patch('acapela_group.base.AcapelaGroupAsync._login',
+                  new_callable=AsyncMock) as login_method:
+        get_mp3_url_method.return_value = 'http://foo.com/path/to/file.mp3'
+
+        SessionStore(session_file).save(
+            'http://www.acapela-group.com', 'foo', [{
+                'name': 'wordpress_logged_in_abc', 'value': 'foo',
+                'domain': 'www.acapela-group.com', 'path': '/',
+                'expires': None, 'secure': False}])
+        arguments = ['French (France)', 'bar', 'baz', '--username', 'foo',
+                     '--password', 'bar', '--session-file', session_file]
+
+        result = runner.invoke(main, arguments)
+        assert result.output == 'http://foo.com/path/to/file.mp3\n'
+        assert not login_method.called
+
+        result = runner.invoke(main, arguments + ['--no-session-store'])
+        assert result.exit_code == 0
+        assert login_method.called
+
+
+HELP_IMPORTS = """
+import runpy
+import sys
+
+sys.argv = ['acapela-group', '--help']
+try:
+    runpy.run_module('acapela_group', run_name='__main__')
+except SystemExit:
+    pass
+print(sorted(name for name in ('aiohttp', 'requests') if name in sys.modules))
+"""
+
+
+def test_main_help_imports():
+    """Test that `python -m acapela_group --help` does not load aiohttp."""
+    environment = dict(os.environ, PYTHONPATH=os.path.dirname(
+        os.path.dirname(acapela_group.__file__)))
+    output = subprocess.check_output([sys.executable, '-c', HELP_IMPORTS],
+                                     env=environment,
+                                     universal_newlines=True)
+    # Neither http library is needed to print the help.
+    assert output.splitlines()[-1] == '[]'
@@ -0,0 +1,152 @@
+import itertools
+from unittest.mock import MagicMock
+
+import pytest
+
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+                                InvalidCredentialsError)
+from acapela_group.cache import MemoryCache
+from acapela_group.metrics import Measurement, Metrics, OpenTelemetryExporter
+from acapela_group.pool import AcapelaGroupAsyncPool, AcapelaGroupPool
+from acapela_group.testing import FakeAcapelaServer
+
+
+def phases(metrics, client):
+    return {histogram['labels']['phase']: histogram['count']
+            for histogram in metrics.snapshot()['histograms']
+            if histogram['labels']['client'] == client}
+
+
+def counter(metrics, name, **labels):
+    return sum(item['value'] for item in metrics.snapshot()['counters']
+               if item['name'] == name and
+               all(item['labels'].get(key) == value
+                   for key, value in labels.items()))
+
+
+def test_metrics():
+    """Test the aggregation and the export of `Metrics`."""
+    metrics = Metrics(buckets=(0.1, 1))
+    measurements = []
+    metrics.add_callback(measurements.append)
+    metrics.add_collector(lambda: [('cache_hits', 3, {'client': 'sync'})])
+
+    metrics.increment('errors_total', error='NeedsUpdateError')
+    metrics.increment('errors_total', error='NeedsUpdateError')
+    metrics.observe('phase_seconds', 0.5, phase='request')
+    metrics.observe('phase_seconds', 2, phase='request')
+
+    assert measurements[0] == Measurement(
+        'counter', 'errors_total', 1, {'error': 'NeedsUpdateError'})
+    assert len(measurements) == 4
+    assert metrics.prometheus_text() == (
+        '# TYPE acapela_group_errors_total counter\n'
+        'acapela_group_errors_total{error="NeedsUpdateError"} 2\n'
+        '# TYPE acapela_group_phase_seconds histogram\n'
+        'acapela_group_phase_seconds_bucket{le="0.1",phase="request"} 0\n'
+        'acapela_group_phase_seconds_bucket{le="1",phase="request"} 1\n'
+        'acapela_group_phase_seconds_bucket{le="+Inf",phase="request"} 2\n'
+        'acapela_group_phase_seconds_sum{phase="request"} 2.5\n'
+        'acapela_group_phase_seconds_count{phase="request"} 2\n'
+        '# TYPE acapela_group_cache_hits gauge\n'
+        'acapela_group_cache_hits{client="sync"} 3\n')
+
+
+def test_open_telemetry_exporter():
+    """Test that `OpenTelemetryExporter` forwards the measurements."""
+    meter = MagicMock()
+    metrics = Metrics()
+    metrics.add_callback(OpenTelemetryExporter(meter))
+    metrics.increment('errors_total', error='ServerError')
+    metrics.increment('errors_total', error='ServerError')
+    metrics.observe('phase_seconds', 0.5, phase='login')
+
+    meter.create_counter.assert_called_once_with('acapela_group_errors_total')
+    meter.create_counter.return_value.add.assert_called_with(
+        1, attributes={'error': 'ServerError'})
+    meter.create_histogram.return_value.record.assert_called_with(
+        0.5, attributes={'phase': 'login'})
+
+
+def test_acapela_group_metrics():
+    """Test the measurements of `AcapelaGroup`."""
+    metrics = Metrics()
+    with FakeAcapelaServer(accounts={'foo': 'bar'}, page_size=1000) \
+            as server, \
+            AcapelaGroup(base_url=server.url, cache=MemoryCache(),
+                         metrics=metrics) as acapela:
+        with pytest.raises(InvalidCredentialsError):
+            acapela.authenticate('foo', 'baz')
+        acapela.authenticate('foo', 'bar')
+        acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+        acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+
+    counts = phases(metrics, 'sync')
+    assert counts['connect'] >= 1
+    assert counts['login'] == 2
+    assert counts['request'] == 4
+    assert counts['transfer'] == counts['parse'] == 1
+    assert counter(metrics, 'errors_total',
+                   error='InvalidCredentialsError') == 1
+    assert counter(metrics, 'received_bytes_total', kind='page') == 1000
+    assert {'name': 'cache_hits', 'labels': {'client': 'sync'},
+            'value': 1} in metrics.snapshot()['gauges']
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_metrics():
+    """Test the measurements of `AcapelaGroupAsync`."""
+    metrics = Metrics()
+    with FakeAcapelaServer(page_size=1000) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     metrics=metrics) as acapela:
+            await acapela.authenticate('foo', 'bar')
+            url = await acapela.get_mp3_url('French (France)', 'Manon',
+                                            'Bonjour')
+            await acapela.download_mp3(url, '/dev/null')
+
+    counts = phases(metrics, 'async')
+    assert counts['connect'] >= 1
+    assert counts['request'] == 4
+    assert counts['login'] == 1
+    assert counts['parse'] == 1
+    assert counts['transfer'] == 2
+    assert counter(metrics, 'received_bytes_total', kind='page') == 1000
+    assert counter(metrics, 'received_bytes_total', kind='mp3') == \
+        40 * 417
+
+
+def test_pool_metrics():
+    """Test that the pools report the statistics of their accounts."""
+    metrics = Metrics()
+    pool = AcapelaGroupPool([('alice', 'secret')], metrics=metrics)
+    gauges = {gauge['name']: gauge['value']
+              for gauge in metrics.snapshot()['gauges']
+              if gauge['labels'].get('account') == 'alice'}
+    assert gauges['pool_requests'] == 0
+    assert gauges['pool_available'] == 1
+    pool.close()
+
+
+def test_shared_metrics():
+    """Test that clients sharing a `Metrics` export each series once."""
+    metrics = Metrics()
+    cache = MemoryCache()
+    pool = AcapelaGroupAsyncPool([('alice', 'secret'), ('bob', 'secret')],
+                                 metrics=metrics, cache=cache)
+    pool._members[0].client._flights.stats.calls = 2
+    pool._members[1].client._flights.stats.calls = 3
+    cache.stats.hits = 4
+
+    lines = [line for line in metrics.prometheus_text().splitlines()
+             if not line.startswith('#')]
+    series = [line.rsplit(' ', 1)[0] for line in lines]
+    assert len(series) == len(set(series))
+    # The clients of the pool are summed, the shared cache is not.
+    assert 'acapela_group_coalescing_calls{client="async"} 5' in lines
+    assert 'acapela_group_cache_hits{client="async"} 4' in lines
+
+    # The samples of a family are together.
+    families = [name for name, _ in itertools.groupby(
+        line.split('{')[0] for line in lines)]
+    assert len(families) == len(set(families))
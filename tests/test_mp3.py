@@ -0,0 +1,62 @@
+from acapela_group.mp3 import (audio_frames, concatenate, iter_frames,
+                               split_tags)
+
+
+# MPEG 1 layer III, 128 kbps, 44100 Hz, stereo, no padding: 417 bytes.
+HEADER = b'\xff\xfb\x90\x00'
+FRAME_SIZE = 417
+
+
+def make_frame(marker):
+    return HEADER + marker * (FRAME_SIZE - len(HEADER))
+
+
+def make_mp3(*markers, id3v2=True, id3v1=True, xing=True):
+    data = b''
+    if id3v2:
+        data += b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'T' * 10
+    if xing:
+        # The Xing tag lies after the side info of a stereo MPEG 1 frame.
+        frame = bytearray(make_frame(b'\x00'))
+        frame[36:40] = b'Xing'
+        data += bytes(frame)
+    data += b''.join(make_frame(marker) for marker in markers)
+    if id3v1:
+        data += b'TAG' + b'\x00' * 125
+    return data
+
+
+def test_split_tags():
+    """Test the `split_tags` function."""
+    tag, audio = split_tags(make_mp3(b'a', xing=False))
+    assert tag == b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'T' * 10
+    assert audio == make_frame(b'a')
+
+    tag, audio = split_tags(make_mp3(b'a', id3v2=False, id3v1=False,
+                                     xing=False))
+    assert tag == b''
+    assert audio == make_frame(b'a')
+
+
+def test_iter_frames():
+    """Test that `iter_frames` skips garbage and truncated frames."""
+    audio = b'junk' + make_frame(b'a') + make_frame(b'b') + b'\xff' + \
+        make_frame(b'c')[:100]
+    frames = [bytes(frame) for frame in iter_frames(audio)]
+    assert frames == [make_frame(b'a'), make_frame(b'b')]
+
+
+def test_audio_frames():
+    """Test that `audio_frames` drops the tags and the Xing frame."""
+    data = make_mp3(b'a', b'b')
+    assert audio_frames(data) == make_frame(b'a') + make_frame(b'b')
+    assert audio_frames(data, keep_tag=True).startswith(b'ID3')
+
+
+def test_concatenate():
+    """Test the `concatenate` function."""
+    joined = concatenate([make_mp3(b'a'), make_mp3(b'b', b'c')])
+    tag, audio = split_tags(joined)
+    assert tag.startswith(b'ID3')
+    assert [bytes(frame) for frame in iter_frames(audio)] == \
+        [make_frame(b'a'), make_frame(b'b'), make_frame(b'c')]
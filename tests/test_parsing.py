@@ -0,0 +1,56 @@
+import pytest
+
+from acapela_group.parsing import (DRAIN_LIMIT, MAX_URL_LENGTH, Mp3UrlScanner,
+                                   scan_mp3_url_async)
+
+
+PAGE = (b"<html><script>var foo = 'bar';\n"
+        b"var myPhpVar = 'http://site.com/path/to/file.mp3';\n"
+        b"</script></html>")
+
+
+def test_mp3_url_scanner_chunk_boundaries():
+    """Test that the url is found whatever the chunk boundaries."""
+    for chunk_size in range(1, len(PAGE) + 1):
+        scanner = Mp3UrlScanner()
+        for index in range(0, len(PAGE), chunk_size):
+            if scanner.feed(PAGE[index:index + chunk_size]) is not None:
+                break
+        assert scanner.url == 'http://site.com/path/to/file.mp3'
+
+
+def test_mp3_url_scanner_bounded_buffer():
+    """Test that the scanner does not keep the whole body in memory."""
+    scanner = Mp3UrlScanner()
+    for _ in range(100):
+        assert scanner.feed(b'x' * 1000) is None
+    assert len(scanner._buffer) < 20
+
+    scanner.feed(b"var myPhpVar = '" + b'x' * (MAX_URL_LENGTH * 2))
+    assert len(scanner._buffer) < 20
+    assert scanner.url is None
+
+
+@pytest.mark.asyncio
+async def test_scan_mp3_url_async():
+    """Test the `scan_mp3_url_async` function."""
+    async def chunks(page):
+        for index in range(0, len(page), 7):
+            yield page[index:index + 7]
+
+    assert await scan_mp3_url_async(chunks(PAGE)) == \
+        'http://site.com/path/to/file.mp3'
+    assert await scan_mp3_url_async(chunks(b'<dumb>lol</dumb>')) is None
+
+
+@pytest.mark.asyncio
+async def test_scan_mp3_url_async_drain():
+    """Test that `scan_mp3_url_async` stops reading once the url is found."""
+    async def chunks():
+        for chunk in [PAGE] + [b'x' * 1000] * 10 + [b'y' * DRAIN_LIMIT] * 2:
+            yield chunk
+
+    iterator = chunks()
+    assert await scan_mp3_url_async(iterator) == \
+        'http://site.com/path/to/file.mp3'
+    assert await iterator.__anext__() == b'y' * DRAIN_LIMIT  # Stopped.
@@ -0,0 +1,232 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from acapela_group.base import (AcapelaGroup, CircuitOpenError,
+                                InvalidCredentialsError, NetworkError,
+                                ServerError)
+from acapela_group.policy import CircuitBreaker, Policy, TokenBucket
+
+
+class AsyncMock(MagicMock):
+    async def __call__(self, *args, **kwargs):
+        return super(AsyncMock, self).__call__(*args, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    """Test that `TokenBucket` spaces the requests out."""
+    with patch('time.monotonic') as monotonic, \
+            patch('asyncio.sleep', new_callable=AsyncMock) as sleep:
+        monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2, burst=2)
+
+        await bucket.acquire_async()
+        await bucket.acquire_async()
+        assert not sleep.called  # The burst is free.
+
+        await bucket.acquire_async()
+        sleep.assert_called_with(0.5)
+        await bucket.acquire_async()
+        sleep.assert_called_with(1.0)  # Waiting requests queue up.
+
+        monotonic.return_value = 110.0
+        sleep.reset_mock()
+        await bucket.acquire_async()
+        assert not sleep.called  # The bucket refilled meanwhile.
+
+
+def test_circuit_breaker():
+    """Test the states of `CircuitBreaker`."""
+    with patch('time.monotonic') as monotonic:
+        monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=10)
+
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        monotonic.return_value = 110.0
+        breaker.before_call()  # The trial call.
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()  # Only one trial call at once.
+
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        monotonic.return_value = 120.0
+        breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.before_call()
+
+
+def failing(*outcomes):
+    """Return a coroutine function raising or returning each outcome."""
+    function = MagicMock(side_effect=outcomes)
+
+    async def call(*args):
+        return function(*args)
+
+    return call, function
+
+
+@pytest.mark.asyncio
+async def test_policy_retries_transient_errors():
+    """Test that `Policy.call_async` only retries the transient errors."""
+    policy = Policy(max_attempts=3, backoff=0)
+    call, function = failing(ServerError, ServerError, 'foo')
+    assert await policy.call_async(call, 'bar',
+                                   transient_errors=(ServerError,)) == 'foo'
+    assert function.call_count == 3
+    function.assert_called_with('bar')
+
+    call, function = failing(*[ServerError] * 3)
+    with pytest.raises(ServerError):
+        await policy.call_async(call, transient_errors=(ServerError,))
+    assert function.call_count == 3
+
+    call, function = failing(InvalidCredentialsError)
+    with pytest.raises(InvalidCredentialsError):
+        await policy.call_async(call, transient_errors=(ServerError,))
+    assert function.call_count == 1
+
+
+def test_policy_delay():
+    """Test that `Policy.delay` grows exponentially, up to a maximum."""
+    policy = Policy(backoff=1, max_backoff=5)
+    with patch('random.uniform') as uniform:
+        uniform.side_effect = lambda low, high: high
+        assert [policy.delay(attempt) for attempt in range(1, 5)] == \
+            [1, 2, 4, 5]
+
+
+@pytest.mark.asyncio
+async def test_policy_circuit_breaker():
+    """Test that `Policy.call_async` fails fast once the circuit is open."""
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    policy = Policy(max_attempts=5, backoff=0, circuit_breaker=breaker)
+    call, function = failing(*[ServerError] * 5)
+    with pytest.raises(CircuitOpenError):
+        await policy.call_async(call, transient_errors=(ServerError,))
+    assert function.call_count == 2
+
+    # Errors other than the transient ones mean that the website is up.
+    breaker = CircuitBreaker(failure_threshold=1)
+    policy = Policy(circuit_breaker=breaker)
+    with pytest.raises(InvalidCredentialsError):
+        await policy.call_async(failing(InvalidCredentialsError)[0])
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_policy_call_async():
+    """Test the `Policy.call_async` method."""
+    policy = Policy(max_attempts=2, backoff=0)
+    calls = []
+
+    async def function(value):
+        calls.append(value)
+        if len(calls) == 1:
+            raise ServerError
+        return value
+
+    assert await policy.call_async(function, 'foo',
+                                   transient_errors=(ServerError,)) == 'foo'
+    assert calls == ['foo', 'foo']
+
+
+@pytest.mark.asyncio
+async def test_policy_network_errors():
+    """Test that the network errors are raised as `NetworkError`."""
+    policy = Policy(max_attempts=2, backoff=0)
+
+    async def function():
+        raise ConnectionResetError('reset by peer')
+
+    with pytest.raises(NetworkError) as exn:
+        await policy.call_async(function,
+                                transient_errors=(ConnectionError,))
+    assert isinstance(exn.value.__cause__, ConnectionResetError)
+    assert 'reset by peer' in str(exn.value)
+
+    # The other errors are raised as they are.
+    with pytest.raises(ConnectionResetError):
+        await policy.call_async(function)
+
+
+@pytest.mark.asyncio
+async def test_policy_cancelled_trial():
+    """Test that a cancelled trial call opens the circuit again."""
+    with patch('time.monotonic') as monotonic:
+        monotonic.return_value = 100.0
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10)
+        policy = Policy(max_attempts=1, circuit_breaker=breaker)
+        breaker.record_failure()
+
+        monotonic.return_value = 110.0
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        trial = asyncio.ensure_future(policy.call_async(hang))
+        await started.wait()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        assert breaker.state == CircuitBreaker.OPEN
+
+        # Another trial call is let through after a fresh timeout.
+        with pytest.raises(CircuitOpenError):
+            await policy.call_async(hang)
+        monotonic.return_value = 120.0
+
+        async def succeed():
+            return 'foo'
+
+        assert await policy.call_async(succeed) == 'foo'
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class FakeAiohttpResponse:
+    def __init__(self, status, chunks=()):
+        self.status = status
+        self.released = False
+        self.content = MagicMock()
+        self.content.iter_chunked.return_value = self._iter(chunks)
+
+    async def _iter(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.released = True
+
+
+def test_acapela_group_retries_server_errors():
+    """Test that `AcapelaGroup` retries the requests failing with a 5xx."""
+    error_response = FakeAiohttpResponse(503)
+    mp3_url_response = FakeAiohttpResponse(200, [
+        b"var myPhpVar = 'http://site.com/path/to/file.mp3';"])
+
+    with AcapelaGroup(policy=Policy(max_attempts=2, backoff=0,
+                                    timeout=5)) as acapela, \
+            patch('aiohttp.ClientSession.post') as post_method:
+        post_method.side_effect = [error_response, mp3_url_response]
+        assert acapela.get_mp3_url('french (france)', 'bar', 'baz') == \
+            "http://site.com/path/to/file.mp3"
+
+    assert post_method.call_count == 2
+    assert post_method.call_args[1]['timeout'].total == 5
+    assert error_response.released  # The failed response was released.
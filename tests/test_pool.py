@@ -0,0 +1,156 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from acapela_group.base import (CircuitOpenError, NeedsUpdateError,
+                                NoAccountAvailableError,
+                                TooManyInvalidLoginAttemptsError,
+                                VoiceNotSupportedError)
+from acapela_group.pool import AcapelaGroupAsyncPool, AcapelaGroupPool
+from acapela_group.testing import LOGIN_PATH, FakeAcapelaServer
+
+
+class AsyncMock(MagicMock):
+    async def __call__(self, *args, **kwargs):
+        return super(AsyncMock, self).__call__(*args, **kwargs)
+
+
+ACCOUNTS = [('alice', 'secret'), ('bob', 'secret')]
+
+
+def test_pool_spreads_requests():
+    """Test that `AcapelaGroupPool` spreads requests over the accounts."""
+    with patch('acapela_group.base.AcapelaGroup.authenticate') \
+            as authenticate_method, \
+            patch('acapela_group.base.AcapelaGroup.get_mp3_url') \
+            as get_mp3_url_method:
+        get_mp3_url_method.return_value = 'http://site.com/a.mp3'
+
+        with AcapelaGroupPool(ACCOUNTS) as pool:
+            for _ in range(4):
+                assert pool.get_mp3_url('French (France)', 'bar', 'baz') == \
+                    'http://site.com/a.mp3'
+            results = list(pool.get_mp3_urls(
+                [('French (France)', 'bar', 'baz')] * 4, concurrency=2))
+            stats = pool.stats()
+
+    assert all(result.ok for result in results)
+    # Each account logged in once, lazily.
+    assert sorted(call[0] for call in authenticate_method.call_args_list) == \
+        sorted(ACCOUNTS)
+    assert stats['alice']['requests'] == stats['bob']['requests'] == 4
+    assert stats['alice']['successes'] == 4
+    assert stats['alice']['outstanding'] == 0
+    assert stats['alice']['available']
+
+
+def test_pool_takes_accounts_out_of_rotation():
+    """Test that failing accounts are taken out of rotation and back."""
+    with patch('acapela_group.base.AcapelaGroup.authenticate') \
+            as authenticate_method, \
+            patch('acapela_group.base.AcapelaGroup.get_mp3_url') \
+            as get_mp3_url_method, \
+            patch('time.monotonic') as monotonic:
+        monotonic.return_value = 1000
+        pool = AcapelaGroupPool(ACCOUNTS, max_failures=2, cooldown=60)
+
+        def authenticate(username, password, deadline=None):
+            if username == 'alice':
+                raise TooManyInvalidLoginAttemptsError()
+        authenticate_method.side_effect = authenticate
+
+        with pytest.raises(TooManyInvalidLoginAttemptsError):
+            pool.get_mp3_url('French (France)', 'bar', 'baz')
+        assert not pool.stats()['alice']['available']
+
+        # Request errors do not count against the account, nor does an
+        # open circuit.
+        for error in (NeedsUpdateError, VoiceNotSupportedError,
+                      CircuitOpenError):
+            get_mp3_url_method.side_effect = error
+            for _ in range(3):
+                with pytest.raises(error):
+                    pool.get_mp3_url('French (France)', 'bar', 'baz')
+        assert pool.stats()['bob']['failures'] == 0
+        assert pool.stats()['bob']['available']
+
+        get_mp3_url_method.side_effect = ConnectionError
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                pool.get_mp3_url('French (France)', 'bar', 'baz')
+        assert pool.stats()['bob']['failures'] == 2
+        assert not pool.stats()['bob']['available']
+
+        with pytest.raises(NoAccountAvailableError):
+            pool.get_mp3_url('French (France)', 'bar', 'baz')
+
+        # After the cooldown, the accounts are back and log in again.
+        monotonic.return_value = 1060
+        authenticate_method.side_effect = None
+        get_mp3_url_method.side_effect = None
+        get_mp3_url_method.return_value = 'http://site.com/a.mp3'
+        pool.get_mp3_url('French (France)', 'bar', 'baz')
+        assert all(stats['available'] for stats in pool.stats().values())
+        assert authenticate_method.call_count == 3
+        assert authenticate_method.call_args[0] == ('alice', 'secret')
+
+    with pytest.raises(ValueError):
+        AcapelaGroupPool([])
+
+
+@pytest.mark.asyncio
+async def test_async_pool():
+    """Test the `AcapelaGroupAsyncPool` class."""
+    with patch('acapela_group.base.AcapelaGroupAsync.authenticate',
+               new_callable=AsyncMock), \
+            patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+                  new_callable=AsyncMock) as get_mp3_url_method:
+        get_mp3_url_method.return_value = 'http://site.com/a.mp3'
+
+        async with AcapelaGroupAsyncPool(ACCOUNTS) as pool:
+            results = [result async for result in pool.get_mp3_urls(
+                [('French (France)', 'bar', 'baz')] * 6, concurrency=3)]
+            stats = pool.stats()
+
+    assert all(result.ok for result in results)
+    assert stats['alice']['requests'] + stats['bob']['requests'] == 6
+    assert stats['alice']['requests'] >= 2
+    assert stats['bob']['requests'] >= 2
+
+
+@pytest.mark.asyncio
+async def test_async_pool_cancelled_calls():
+    """Test that cancelled calls give their account back."""
+    async def get_mp3_url(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    with patch('acapela_group.base.AcapelaGroupAsync.authenticate',
+               new_callable=AsyncMock), \
+            patch('acapela_group.base.AcapelaGroupAsync.get_mp3_url',
+                  side_effect=get_mp3_url):
+        async with AcapelaGroupAsyncPool(ACCOUNTS) as pool:
+            for _ in range(3):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(pool.get_mp3_url(
+                        'French (France)', 'bar', 'baz'), 0.01)
+            stats = pool.stats()
+
+    for username, _ in ACCOUNTS:
+        assert stats[username]['outstanding'] == 0
+        assert stats[username]['failures'] == 0
+        assert stats[username]['available']
+
+
+@pytest.mark.asyncio
+async def test_async_pool_shares_login():
+    """Test that the first requests of an account share a single login."""
+    with FakeAcapelaServer(accounts=dict(ACCOUNTS[:1])) as server:
+        async with AcapelaGroupAsyncPool(ACCOUNTS[:1],
+                                         base_url=server.url) as pool:
+            urls = await asyncio.gather(*[
+                pool.get_mp3_url('French (France)', 'Antoine', str(index))
+                for index in range(5)])
+        assert server.requests(LOGIN_PATH) == 1
+
+    assert len(set(urls)) == 5
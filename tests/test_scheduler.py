@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from acapela_group.base import AcapelaGroupAsync
+from acapela_group.scheduler import (BULK, INTERACTIVE, PriorityClass,
+                                     Scheduler, default_classes)
+from acapela_group.testing import FakeAcapelaServer
+
+
+async def run(scheduler, jobs, order):
+    """Hold every slot, queue `jobs`, then let them go one by one."""
+    blockers = [scheduler.acquire() for _ in range(scheduler.concurrency)]
+    await asyncio.gather(*blockers)
+
+    async def job(name, priority, caller):
+        async with scheduler.slot(priority, caller):
+            order.append(name)
+
+    tasks = [asyncio.ensure_future(job(*job_args)) for job_args in jobs]
+    await asyncio.sleep(0)
+    for _ in range(scheduler.concurrency):
+        scheduler.release()
+    await asyncio.gather(*tasks)
+
+
+def test_default_classes():
+    """Test that bulk requests leave some slots free by default."""
+    assert default_classes(10)[BULK].max_concurrency == 8
+    assert default_classes(1)[BULK].max_concurrency == 1
+    assert default_classes(10)[INTERACTIVE].max_concurrency is None
+
+
+@pytest.mark.asyncio
+async def test_scheduler_priority():
+    """Test that the interactive requests go before the bulk ones."""
+    scheduler = Scheduler(concurrency=1)
+    order = []
+    await run(scheduler, [('bulk1', BULK, None), ('bulk2', BULK, None),
+                          ('interactive', None, None)], order)
+
+    assert order == ['interactive', 'bulk1', 'bulk2']
+    stats = scheduler.stats
+    assert stats[BULK].admitted == 2
+    assert stats[BULK].max_queued == 2
+    assert stats[BULK].queued == 0
+    assert stats[INTERACTIVE].admitted == 2  # With the blocker.
+    assert stats[BULK].mean_wait_time >= stats[INTERACTIVE].mean_wait_time
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fair_queuing():
+    """Test that the callers of a class take turns, by weight."""
+    scheduler = Scheduler(concurrency=1)
+    scheduler.set_weight('heavy', 2)
+    order = []
+    await run(scheduler,
+              [('big', BULK, 'big')] * 4 + [('small', BULK, 'small')] * 2 +
+              [('heavy', BULK, 'heavy')] * 4, order)
+
+    assert order[:5] == ['heavy', 'big', 'small', 'heavy', 'heavy']
+    assert order.count('big') == 4
+
+    with pytest.raises(ValueError):
+        scheduler.set_weight('heavy', 0)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_caps():
+    """Test the per-class concurrency caps."""
+    scheduler = Scheduler(concurrency=3, classes={
+        'a': PriorityClass(priority=0, max_concurrency=1),
+        'b': PriorityClass(priority=1)}, default_class='a')
+
+    await scheduler.acquire('a')
+    waiting = asyncio.ensure_future(scheduler.acquire('a'))
+    await scheduler.acquire('b')  # 'a' is full: 'b' gets a slot.
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    assert scheduler.stats['a'].queued == 1
+
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.stats['a'].queued == 0
+    scheduler.release('a')
+    assert scheduler.in_flight == 1
+
+    with pytest.raises(ValueError):
+        await scheduler.acquire('c')
+    with pytest.raises(ValueError):
+        Scheduler(classes={'a': PriorityClass()})
+
+
+@pytest.mark.asyncio
+async def test_client_scheduler():
+    """Test that the client schedules the requests it sends."""
+    scheduler = Scheduler(concurrency=2)
+    with FakeAcapelaServer(page_size=1000, latency=0.01) as server:
+        async with AcapelaGroupAsync(base_url=server.url,
+                                     scheduler=scheduler) as acapela:
+            results = [result async for result in acapela.get_mp3_urls(
+                [('French (France)', 'Manon', str(index))
+                 for index in range(6)], priority=BULK, caller='job')]
+            assert all(result.ok for result in results)
+            assert await acapela.get_mp3_url('French (France)', 'Manon',
+                                             'Salut')
+
+    assert scheduler.stats[BULK].admitted == 6
+    assert scheduler.stats[INTERACTIVE].admitted == 1
+    assert scheduler.in_flight == 0
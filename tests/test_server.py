@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import threading
+
+import pytest
+from aiohttp import web
+from click.testing import CliRunner
+
+from acapela_group.__main__ import main
+from acapela_group.base import (AcapelaGroupAsync, LanguageNotSupportedError,
+                                OverloadedError)
+from acapela_group.metrics import Metrics
+from acapela_group.remote import RemoteClient
+from acapela_group.server import Server
+from acapela_group.singleflight import FlightStats
+from acapela_group.testing import LOGIN_PATH, FakeAcapelaServer
+
+
+@contextlib.contextmanager
+def running(server, path=None):
+    """Run `server` on a background event loop, and yield its address."""
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(server.make_app())
+    loop.run_until_complete(runner.setup())
+    if path is not None:
+        site = web.UnixSite(runner, path)
+    else:
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        if path is not None:
+            yield 'unix:' + path
+        else:
+            port = site._server.sockets[0].getsockname()[1]
+            yield 'http://127.0.0.1:{}'.format(port)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+
+class BlockingClient:
+    """A client whose requests wait until they are released."""
+
+    def __init__(self):
+        self.flight_stats = FlightStats()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def get_mp3_url(self, language, voice, text):
+        self.started.set()
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        return 'http://foo.com/{}.mp3'.format(text)
+
+
+@pytest.fixture
+def website():
+    with FakeAcapelaServer(accounts={'foo': 'bar'}, seed=0) as website:
+        yield website
+
+
+def test_server(website):
+    """Test the service against the fake website."""
+    metrics = Metrics()
+    server = Server(AcapelaGroupAsync(base_url=website.url, metrics=metrics),
+                    credentials=('foo', 'bar'), metrics=metrics)
+    with running(server) as address, RemoteClient(address) as client:
+        url = client.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+        assert url.startswith(website.url + '/sounds/')
+        assert not url.endswith('-music.mp3')
+
+        results = list(client.get_mp3_urls(
+            [('French (France)', 'Manon', text)
+             for text in ('Un', 'Deux', 'Trois')]))
+        assert all(result.error is None for result in results)
+
+        with pytest.raises(LanguageNotSupportedError):
+            client.get_mp3_url('Klingon', 'Manon', 'Bonjour')
+
+        for fields in ({'caller': ['a', 'b']}, {'caller': {'a': 1}},
+                       {'priority': [1]}):
+            status, payload = client._request('POST', '/mp3-url', json.dumps(
+                dict(fields, language='French (France)', voice='Manon',
+                     text='Bonjour')))
+            assert status == 400
+            assert json.loads(payload)['error_type'] == 'ValueError'
+
+        health = client.health()
+        assert health['status'] == 'ok'
+        assert health['in_flight'] == 0
+
+        status, payload = client._request('GET', '/metrics')
+        assert status == 200
+        assert b'acapela_group_phase_seconds' in payload
+
+    # The service logged in once, when it started.
+    assert website.requests(LOGIN_PATH) == 1
+
+
+def test_server_overloaded():
+    """Test that the service sheds the load when its queue is full."""
+    blocking_client = BlockingClient()
+    server = Server(blocking_client, concurrency=1, queue_size=0)
+    with running(server) as address, RemoteClient(address) as client:
+        first = threading.Thread(target=client.get_mp3_url,
+                                 args=('French (France)', 'Manon', 'Un'))
+        first.start()
+        assert blocking_client.started.wait(5)
+
+        with pytest.raises(OverloadedError):
+            client.get_mp3_url('French (France)', 'Manon', 'Deux')
+        assert client.health()['shed'] == 1
+
+        blocking_client.release.set()
+        first.join()
+
+
+def test_server_queue_timeout():
+    """Test that a request waiting for too long is refused."""
+    blocking_client = BlockingClient()
+    server = Server(blocking_client, concurrency=1, queue_timeout=0.05)
+    with running(server) as address, RemoteClient(address) as client:
+        first = threading.Thread(target=client.get_mp3_url,
+                                 args=('French (France)', 'Manon', 'Un'))
+        first.start()
+        assert blocking_client.started.wait(5)
+
+        with pytest.raises(OverloadedError):
+            client.get_mp3_url('French (France)', 'Manon', 'Deux')
+
+        blocking_client.release.set()
+        first.join()
+
+
+def test_server_unix_socket():
+    """Test the service on a Unix socket."""
+    blocking_client = BlockingClient()
+    blocking_client.release.set()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'acapela-group.sock')
+        with running(Server(blocking_client), path) as address, \
+                RemoteClient(address) as client:
+            assert client.get_mp3_url('French (France)', 'Manon', 'Un') == \
+                'http://foo.com/Un.mp3'
+
+
+def test_cli_server():
+    """Test the thin client mode of the command line."""
+    blocking_client = BlockingClient()
+    blocking_client.release.set()
+    runner = CliRunner()
+    with running(Server(blocking_client)) as address:
+        result = runner.invoke(main, ['--server', address, 'French (France)',
+                                      'Manon', 'Un'])
+        assert result.exit_code == 0
+        assert result.output == 'http://foo.com/Un.mp3\n'
+
+        result = runner.invoke(main, ['fetch', '--server', address,
+                                      '--username', 'foo', '--password',
+                                      'bar', 'French (France)', 'Manon',
+                                      'Un'])
+        assert result.exit_code == 2
+
+    result = runner.invoke(main, ['--server', address, 'French (France)',
+                                  'Manon', 'Un'])
+    assert result.exit_code == -2
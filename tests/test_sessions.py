@@ -0,0 +1,51 @@
+import os
+import time
+
+from acapela_group.sessions import (SessionStore, default_session_path,
+                                    is_logged_in)
+
+
+def make_cookie(name, expires):
+    return {'name': name, 'value': 'foo', 'domain': 'www.acapela-group.com',
+            'path': '/', 'expires': expires, 'secure': False}
+
+
+def test_default_session_path(monkeypatch):
+    """Test the `default_session_path` function."""
+    monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/cache')
+    assert default_session_path() == \
+        '/tmp/cache/acapela-group/sessions.json'
+
+
+def test_is_logged_in():
+    """Test the `is_logged_in` function."""
+    assert not is_logged_in([])
+    assert not is_logged_in([make_cookie('PHPSESSID', None)])
+    assert is_logged_in([make_cookie('wordpress_logged_in_abc', None)])
+    assert is_logged_in([make_cookie('wordpress_logged_in_abc', 100)],
+                        now=99)
+    assert not is_logged_in([make_cookie('wordpress_logged_in_abc', 100)],
+                            now=100)
+
+
+def test_session_store(tmpdir):
+    """Test the `SessionStore` class."""
+    path = str(tmpdir.join('acapela', 'sessions.json'))
+    store = SessionStore(path)
+    assert store.load('http://www.acapela-group.com', 'foo') is None
+
+    valid = [make_cookie('wordpress_logged_in_abc', time.time() + 3600)]
+    expired = [make_cookie('wordpress_logged_in_abc', time.time() - 1)]
+    store.save('http://www.acapela-group.com', 'foo', valid)
+    store.save('http://www.acapela-group.com', 'bar', expired)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+    # Another process would see the same sessions.
+    other_store = SessionStore(path)
+    assert other_store.load('http://www.acapela-group.com', 'foo') == valid
+    assert other_store.load('http://www.acapela-group.com', 'bar') is None
+    assert other_store.load('http://www.fake.com', 'foo') is None
+
+    other_store.discard('http://www.acapela-group.com', 'foo')
+    other_store.discard('http://www.acapela-group.com', 'baz')
+    assert store.load('http://www.acapela-group.com', 'foo') is None
@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from acapela_group.base import AcapelaGroup, AcapelaGroupAsync
+from acapela_group.singleflight import AsyncSingleFlight
+
+
+@pytest.mark.asyncio
+async def test_async_single_flight():
+    """Test that `AsyncSingleFlight` coalesces the calls made at once."""
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def function(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value < 0:
+            raise ValueError(value)
+        return value * 2
+
+    assert await asyncio.gather(*[flights.do('a', function, 21)
+                                  for _ in range(3)] +
+                                [flights.do('b', function, 1)]) == \
+        [42, 42, 42, 2]
+    assert calls == [21, 1]
+    assert flights.stats.deduplicated == 2
+
+    results = await asyncio.gather(
+        *[flights.do('c', function, -1) for _ in range(2)],
+        return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_async_single_flight_cancel():
+    """Test that cancelling a caller does not cancel the shared call."""
+    flights = AsyncSingleFlight()
+
+    async def function():
+        await asyncio.sleep(0.01)
+        return 'foo'
+
+    first = asyncio.ensure_future(flights.do('key', function))
+    second = asyncio.ensure_future(flights.do('key', function))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 'foo'
+
+
+class FakeAiohttpResponse:
+    def __init__(self, chunks):
+        self.status = 200
+        self.content = MagicMock()
+        self.content.iter_chunked.side_effect = lambda size: self._iter(
+            chunks)
+
+    async def _iter(self, chunks):
+        await asyncio.sleep(0.01)
+        for chunk in chunks:
+            yield chunk
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def test_acapela_group_coalesces_requests():
+    """Test that concurrent identical `get_mp3_url` calls share a POST."""
+    release = threading.Event()
+
+    class SlowResponse(FakeAiohttpResponse):
+        async def _iter(self, chunks):
+            while not release.is_set():
+                await asyncio.sleep(0.001)
+            for chunk in chunks:
+                yield chunk
+
+    with patch('aiohttp.ClientSession.post') as post_method:
+        post_method.side_effect = lambda *args, **kwargs: SlowResponse(
+            [b"var myPhpVar = 'http://site.com/path/to/file.mp3';"])
+        with AcapelaGroup() as acapela:
+            futures = [acapela.submit('french (france)', 'bar', text)
+                       for text in ('Hello world', 'Hello  world',
+                                    'Hello world', 'Hello world')]
+            while acapela.flight_stats.calls < 4:
+                pass
+            release.set()
+            assert [future.result() for future in futures] == \
+                ['http://site.com/path/to/file.mp3'] * 4
+
+    assert post_method.call_count == 1
+    assert acapela.flight_stats.deduplicated == 3
+
+
+@pytest.mark.asyncio
+async def test_acapela_group_async_coalesces_requests():
+    """Test that concurrent identical async `get_mp3_url` calls share a POST.
+    """
+    with patch('aiohttp.ClientSession.post') as post_method:
+        post_method.side_effect = lambda *args, **kwargs: FakeAiohttpResponse(
+            [b"var myPhpVar = 'http://site.com/path/to/file.mp3';"])
+        async with AcapelaGroupAsync() as acapela:
+            urls = await asyncio.gather(*[
+                acapela.get_mp3_url('french (france)', 'bar', 'baz')
+                for _ in range(5)])
+
+    assert urls == ['http://site.com/path/to/file.mp3'] * 5
+    assert post_method.call_count == 1
+    assert acapela.flight_stats.as_dict() == \
+        {'calls': 5, 'flights': 1, 'deduplicated': 4}
@@ -0,0 +1,78 @@
+import asyncio
+import io
+
+import pytest
+from click.testing import CliRunner
+
+from acapela_group.__main__ import main
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+                                InvalidCredentialsError, ServerError,
+                                TooManyInvalidLoginAttemptsError)
+from acapela_group.mp3 import iter_frames
+from acapela_group.policy import Policy
+from acapela_group.testing import LOGIN_PATH, TTS_FORM_PATH, FakeAcapelaServer
+
+
+@pytest.fixture
+def server():
+    with FakeAcapelaServer(accounts={'foo': 'bar'}, seed=0) as server:
+        yield server
+
+
+def test_fake_server_sync(server):
+    """Test `AcapelaGroup` against the fake website."""
+    with AcapelaGroup(base_url=server.url) as acapela:
+        anonymous_url = acapela.get_mp3_url('French (France)', 'Manon',
+                                            'Bonjour')
+        assert anonymous_url.startswith(server.url + '/sounds/')
+        assert anonymous_url.endswith('-music.mp3')
+
+        with pytest.raises(InvalidCredentialsError):
+            acapela.authenticate('foo', 'baz')
+        acapela.authenticate('foo', 'bar')
+        url = acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+        assert not url.endswith('-music.mp3')
+
+        buffer = io.BytesIO()
+        acapela.download_mp3(url, buffer)
+        assert len(list(iter_frames(buffer.getvalue()))) == 40
+
+    assert server.requests(LOGIN_PATH) == 2
+    assert server.requests(TTS_FORM_PATH) == 2
+
+    server.locked_out = True
+    with pytest.raises(TooManyInvalidLoginAttemptsError):
+        AcapelaGroup(base_url=server.url).authenticate('foo', 'bar')
+
+
+@pytest.mark.asyncio
+async def test_fake_server_async(server):
+    """Test `AcapelaGroupAsync` against the fake website."""
+    async with AcapelaGroupAsync(base_url=server.url) as acapela:
+        await acapela.authenticate('foo', 'bar')
+        urls = await asyncio.gather(*[
+            acapela.get_mp3_url('French (France)', 'Manon', text)
+            for text in ('Un', 'Deux', 'Trois')])
+
+    assert len(set(urls)) == 3
+    assert not any(url.endswith('-music.mp3') for url in urls)
+
+
+def test_fake_server_errors(server):
+    """Test the policy of the clients against a failing website."""
+    server.error_rate = 1
+    with AcapelaGroup(base_url=server.url,
+                      policy=Policy(max_attempts=3, backoff=0)) as acapela:
+        with pytest.raises(ServerError):
+            acapela.get_mp3_url('French (France)', 'Manon', 'Bonjour')
+    assert server.requests(TTS_FORM_PATH) == 3
+
+
+def test_fake_server_cli(server):
+    """Test the command line against the fake website."""
+    runner = CliRunner()
+    result = runner.invoke(main, [
+        '--base-url', server.url, '--username', 'foo', '--password', 'bar',
+        '--no-session-store', 'French (France)', 'Manon', 'Bonjour'])
+    assert result.exit_code == 0
+    assert result.output.startswith(server.url + '/sounds/')
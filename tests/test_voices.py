@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+
+import pytest
+from click.testing import CliRunner
+
+from acapela_group.__main__ import main
+from acapela_group.base import (AcapelaGroup, AcapelaGroupAsync,
+                                LanguageNotSupportedError, NeedsUpdateError,
+                                VoiceNotSupportedError)
+from acapela_group.testing import TTS_FORM_PATH, FakeAcapelaServer
+from acapela_group.voices import VOICES, VoiceCatalog, parse_voices
+
+
+@pytest.fixture
+def server():
+    with FakeAcapelaServer(page_size=1000) as server:
+        yield server
+
+
+def test_parse_voices():
+    html = ('<select name="MyLanguages"><option value="sonid15">French'
+            '</option></select>'
+            '<select name="MySelectedVoice" id="sonid15">'
+            '<option value="Manon">Manon</option>'
+            "<option value='Bruno'>Bruno</option></select>"
+            '<select id="sonid9"></select>')
+    assert parse_voices(html) == {'sonid15': ('Manon', 'Bruno')}
+
+    with pytest.raises(NeedsUpdateError):
+        parse_voices('<html></html>')
+
+
+def test_voice_catalog():
+    catalog = VoiceCatalog({'sonid15': ('Manon', 'Bruno')})
+    catalog.check_voice('sonid15', 'manon')
+    catalog.check_voice('sonid15', 'Manon (emotive voice)')
+    catalog.check_voice('sonid9', 'Anyone')  # Not in the catalog.
+    with pytest.raises(VoiceNotSupportedError):
+        catalog.check_voice('sonid15', 'Rachel')
+
+    assert catalog.voices_for('French (France)') == ('Manon', 'Bruno')
+    assert catalog.voices_for('English (UK)') == ()
+    with pytest.raises(LanguageNotSupportedError):
+        catalog.voices_for('Klingon')
+
+    catalog.validate = False
+    catalog.check_voice('sonid15', 'Rachel')
+
+    catalog.check_failure('key')
+    catalog.add_failure('key', 'It failed.')
+    with pytest.raises(NeedsUpdateError, match='It failed.'):
+        catalog.check_failure('key')
+    assert catalog.failure_stats.hits == 1
+
+
+def test_voice_catalog_files():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'voices', 'voices.json')
+        assert VoiceCatalog.load(path).as_dict() == VOICES
+
+        catalog = VoiceCatalog()
+        catalog.update({'sonid15': ('Manon', 'Nouvelle')})
+        catalog.save(path)
+        loaded = VoiceCatalog.load(path, validate=False)
+        assert loaded.voices_for('French (France)') == ('Manon', 'Nouvelle')
+        assert loaded.voices_for('English (UK)') == VOICES['sonid9']
+        assert not loaded.validate
+
+        with open(path, 'w') as fileobj:
+            fileobj.write('not json')
+        assert VoiceCatalog.load(path).as_dict() == VOICES
+
+
+def test_pre_flight_validation(server):
+    """Test that unknown voices are refused without any request."""
+    with AcapelaGroup(base_url=server.url, voices=VoiceCatalog()) as acapela:
+        with pytest.raises(VoiceNotSupportedError):
+            acapela.get_mp3_url('French (France)', 'Rachel', 'Bonjour')
+        assert acapela.get_mp3_url('French (France)', 'manon', 'Bonjour')
+    assert server.requests(TTS_FORM_PATH) == 1
+
+
+def test_negative_cache(server):
+    """Test that failing requests are not sent again for a while."""
+    with AcapelaGroup(base_url=server.url,
+                      voices=VoiceCatalog(validate=False)) as acapela:
+        for _ in range(3):
+            with pytest.raises(NeedsUpdateError):
+                acapela.get_mp3_url('French (France)', 'Rachel', 'Bonjour')
+    assert server.requests(TTS_FORM_PATH) == 1
+
+    with AcapelaGroup(base_url=server.url,
+                      voices=VoiceCatalog(validate=False,
+                                          failure_ttl=0)) as acapela:
+        for _ in range(2):
+            with pytest.raises(NeedsUpdateError):
+                acapela.get_mp3_url('French (France)', 'Rachel', 'Bonjour')
+    assert server.requests(TTS_FORM_PATH) == 3
+
+
+@pytest.mark.asyncio
+async def test_negative_cache_async(server):
+    """Test the voice catalog of `AcapelaGroupAsync`."""
+    catalog = VoiceCatalog(validate=False)
+    async with AcapelaGroupAsync(base_url=server.url,
+                                 voices=catalog) as acapela:
+        assert await acapela.fetch_voices() == VOICES
+        for _ in range(2):
+            with pytest.raises(NeedsUpdateError):
+                await acapela.get_mp3_url('French (France)', 'Rachel', 'Un')
+
+        catalog.validate = True
+        with pytest.raises(VoiceNotSupportedError):
+            await acapela.get_mp3_url('French (France)', 'Rachel', 'Deux')
+    assert server.requests(TTS_FORM_PATH) == 2
+
+
+def test_voices_cli(server):
+    runner = CliRunner()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'voices.json')
+        result = runner.invoke(main, ['voices', 'French (France)',
+                                      '--voices-file', path])
+        assert result.exit_code == 0
+        assert result.output.split() == list(VOICES['sonid15'])
+
+        server.voices = {'sonid15': ('Manon',)}
+        result = runner.invoke(main, ['voices', '--refresh', '--base-url',
+                                      server.url, '--voices-file', path])
+        assert result.exit_code == 0
+        assert 'FRENCH (FRANCE): Manon\n' in result.output
+        with open(path) as fileobj:
+            assert json.load(fileobj)['voices']['sonid15'] == ['Manon']
+
+        # The command line checks the voices of the saved catalog.
+        result = runner.invoke(main, ['--base-url', server.url,
+                                      '--voices-file', path,
+                                      'French (France)', 'Bruno', 'Bonjour'])
+        assert result.exit_code == -2
+        assert server.requests(TTS_FORM_PATH) == 1
+
+        result = runner.invoke(main, ['--base-url', server.url,
+                                      '--voices-file', path,
+                                      '--no-voice-check',
+                                      'French (France)', 'Bruno', 'Bonjour'])
+        assert result.exit_code == -2
+        assert server.requests(TTS_FORM_PATH) == 2